@@ -1,36 +1,66 @@
-from datetime import datetime, timedelta
-from typing import Optional
-from jose import jwt
-from passlib.context import CryptContext
+import logging
+import uuid
+from datetime import timedelta
+from typing import Optional, Tuple
 from fastapi import HTTPException, status
+from sqlalchemy import update
+from app import database, hashing, models, tokens
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 # Настройки
 SECRET_KEY = settings.secret_key
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_HOURS = 48
-
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+ALGORITHM = tokens.ALGORITHM
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# argon2 выполняется в пуле процессов hashing.service; при переполнении очереди - HashingOverloaded
+def check_password(plain_password, hashed_password) -> Tuple[bool, bool]:
+    return hashing.service.run(hashing.check_password, plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hashing.service.run(hashing.hash_password, password)
+
+async def check_password_async(plain_password, hashed_password) -> Tuple[bool, bool]:
+    return await hashing.service.run_async(hashing.check_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await hashing.service.run_async(hashing.hash_password, password)
+
+# Пересчет устаревшего хеша после успешного входа - фоновой задачей, после ответа на логин.
+# Хеш заменяется, только если пароль не сменили за это время
+def _replace_hash(user_id: uuid.UUID, old_hash: str, new_hash: str):
+    return update(models.User).where(
+        models.User.id == user_id, models.User.hashed_password == old_hash
+    ).values(hashed_password=new_hash)
+
+def rehash_password(user_id: uuid.UUID, old_hash: str, password: str):
+    try:
+        new_hash = get_password_hash(password)
+    except hashing.HashingOverloaded:
+        # Пул занят логинами - пересчитаем при следующем входе
+        return
+    try:
+        with database.SessionLocal() as db:
+            db.execute(_replace_hash(user_id, old_hash, new_hash))
+            db.commit()
+    except Exception:
+        logger.exception("Password rehash failed")
+
+async def rehash_password_async(user_id: uuid.UUID, old_hash: str, password: str):
+    try:
+        new_hash = await get_password_hash_async(password)
+    except hashing.HashingOverloaded:
+        return
+    try:
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(_replace_hash(user_id, old_hash, new_hash))
+            await db.commit()
+    except Exception:
+        logger.exception("Password rehash failed")
 
+# Выпуск и проверка JWT - app/tokens.py (кольцо ключей, refresh-токены, отзыв)
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    return tokens.create_token(data, tokens.ACCESS, expires_delta)
 
 def verify_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except jwt.InvalidTokenError:
-        return None
+    return tokens.decode(token)
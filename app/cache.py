@@ -0,0 +1,128 @@
+import dataclasses
+import datetime
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+from app.config import settings
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кеш ограниченного размера с временем жизни записей."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+@dataclasses.dataclass(frozen=True)
+class Principal:
+    """Снимок пользователя для авторизации; не привязан к сессии, поэтому его можно кешировать."""
+
+    id: uuid.UUID
+    username: str
+    email: str
+    group: str
+    is_active: bool
+    created_at: datetime.datetime
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            group=user.group,
+            is_active=user.is_active,
+            created_at=user.created_at,
+        )
+
+
+# Пользователи по id - сбрасываются в crud.update_user / crud.delete_user (в других воркерах - app/cache_sync.py)
+principal_cache = TTLCache(settings.principal_cache_size, settings.principal_cache_ttl)
+# Расшифрованные JWT (payload и версия списка отзыва) по sha256 токена - dependencies.token_cache_key;
+# запись живет не дольше самого токена
+token_cache = TTLCache(settings.token_cache_size, settings.token_cache_ttl)
+
+
+# Виды инвалидаций, которые рассылаются другим воркерам
+PRINCIPAL = "principal"
+ADVERTISEMENT = "advertisement"
+# Инвалидации этого воркера копятся здесь; app/cache_sync.py пишет их в БД пачкой
+_published: list = []
+_published_lock = threading.Lock()
+
+
+def publish(kind: str, key: Optional[uuid.UUID] = None):
+    if settings.web_concurrency > 1:
+        with _published_lock:
+            _published.append((kind, key))
+
+
+def take_published() -> list:
+    with _published_lock:
+        published = _published[:]
+        _published.clear()
+    return published
+
+
+def invalidate_principal(user_id: uuid.UUID, broadcast: bool = True):
+    principal_cache.pop(user_id)
+    if broadcast:
+        publish(PRINCIPAL, user_id)
+
+
+def stats() -> dict:
+    return {
+        "principals": principal_cache.stats(),
+        "tokens": token_cache.stats(),
+    }
@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+import logging
+import uuid
+from typing import Optional, Set
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, select
+from app import cache, models, response_cache
+from app.config import settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Кеши пользователей (app/cache.py) и ответов (app/response_cache.py) - в памяти каждого воркера gunicorn.
+# Запись сбрасывает их сразу только в своем процессе; остальным воркерам инвалидации доставляет таблица
+# cache_invalidations. Раз в cache_sync_interval воркер одной транзакцией пишет накопленные свои
+# и читает чужие - запрос записи в эту таблицу не ходит. Другие воркеры отдают устаревший ответ или
+# пользователя не дольше ~2 интервалов. С одним воркером (web_concurrency=1) таблица не используется.
+
+# Строки старше этого срока уже применены всеми воркерами
+RETENTION = datetime.timedelta(minutes=10)
+
+
+class CacheSync:
+    def __init__(self, interval: float):
+        self.interval = interval
+        # Свои инвалидации воркер уже применил - в таблице их отличает origin
+        self.origin = uuid.uuid4().hex
+        self._synced_at: Optional[datetime.datetime] = None
+        # id строк, примененных на прошлом шаге: окна чтения перекрываются
+        self._seen: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def sync(self) -> int:
+        """Записывает накопленные инвалидации этого воркера и применяет чужие. Возвращает число примененных."""
+        Invalidation = models.CacheInvalidation
+        now = datetime.datetime.utcnow()
+        published = cache.take_published()
+        try:
+            with SessionLocal() as db:
+                if published:
+                    db.execute(insert(Invalidation), [
+                        {"kind": kind, "key": None if key is None else str(key), "origin": self.origin,
+                         "created_at": now}
+                        for kind, key in published
+                    ])
+                db.execute(delete(Invalidation).where(Invalidation.created_at < now - RETENTION))
+                db.commit()
+                if self._synced_at is None:
+                    # Кеши только что запущенного воркера пусты - прошлые инвалидации ему не нужны
+                    self._synced_at = now
+                    return 0
+                # Окно с запасом, как у отзывов токенов: транзакция могла закоммититься позже своего created_at
+                since = self._synced_at - datetime.timedelta(seconds=self.interval * 2)
+                rows = db.execute(
+                    select(Invalidation.id, Invalidation.kind, Invalidation.key)
+                    .where(Invalidation.created_at > since, Invalidation.origin != self.origin)
+                ).all()
+        except Exception:
+            # Не записали - отправим со следующей попыткой
+            for kind, key in published:
+                cache.publish(kind, key)
+            raise
+        self._synced_at = now
+        fresh = [row for row in rows if row.id not in self._seen]
+        self._seen = {row.id for row in rows}
+        for row in fresh:
+            key = None if row.key is None else uuid.UUID(row.key)
+            if row.kind == cache.PRINCIPAL:
+                cache.invalidate_principal(key, broadcast=False)
+            else:
+                response_cache.invalidate_advertisement(key, broadcast=False)
+        return len(fresh)
+
+    def start(self):
+        if settings.web_concurrency > 1:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Последние инвалидации этого воркера - другим, пока они еще работают
+        try:
+            await run_in_threadpool(self.sync)
+        except Exception:
+            logger.exception("Cache invalidation sync failed")
+
+    async def _run(self):
+        while True:
+            try:
+                await run_in_threadpool(self.sync)
+            except Exception:
+                logger.exception("Cache invalidation sync failed")
+            await asyncio.sleep(self.interval)
+
+
+job = CacheSync(settings.cache_sync_interval)
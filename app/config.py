@@ -1,9 +1,131 @@
+import os
+from typing import Dict, Optional
+from urllib.parse import quote_plus
 from pydantic_settings import BaseSettings
-from pydantic import Field
+from pydantic import Field, model_validator
 
 
-class Settings:
-    secret_key = "your-super-secret-key-here-123"
-    database_url = "sqlite:///./advertisements.db"
+class Settings(BaseSettings):
+    secret_key: str = "your-super-secret-key-here-123"
+    # DATABASE_URL задается явно; иначе, если есть POSTGRES_HOST (docker-compose), собираем URL Postgres
+    database_url: Optional[str] = None
+    postgres_user: str = "postgres"
+    postgres_password: str = "password"
+    postgres_db: str = "advertisements"
+    postgres_host: Optional[str] = None
+    postgres_port: int = 5432
+    # Реплика для чтения: GET-обработчики используют ее вместо основной БД
+    database_read_url: Optional[str] = None
+    # Шарды объявлений (app/sharding.py), JSON: имя шарда -> URL и категория -> имя шарда.
+    # Категории без назначения и все остальные таблицы - в основной БД (шард "default").
+    # Назначение категории менять только вместе с переносом ее объявлений
+    database_shards: Dict[str, str] = {}
+    shard_categories: Dict[str, str] = {}
+    # Потоки для параллельных запросов ко всем шардам
+    shard_fan_out_workers: int = 16
+    # Пул соединений
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int = 30000
+    # PRAGMA для SQLite: WAL позволяет читать во время записи, busy_timeout - ждать блокировку, а не падать
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_busy_timeout_ms: int = 5000
+    # Проверка внешних ключей (advertisements.author_id -> users.id); в SQLite по умолчанию выключена
+    sqlite_foreign_keys: bool = True
+    # ASYNC_DB=true переключает роутеры на AsyncSession (aiosqlite / asyncpg)
+    async_db: bool = False
+    # Кеш авторизованных пользователей и расшифрованных токенов (app/cache.py)
+    principal_cache_size: int = 10000
+    principal_cache_ttl: float = 60
+    # Число воркеров gunicorn (gunicorn.conf.py выставляет WEB_CONCURRENCY). Больше одного - кеши
+    # пользователей и ответов сбрасываются во всех воркерах через таблицу cache_invalidations (app/cache_sync.py)
+    web_concurrency: int = 1
+    # Период обмена инвалидациями между воркерами: другие воркеры отдают устаревшие данные не дольше ~2 периодов
+    cache_sync_interval: float = 1
+    token_cache_size: int = 10000
+    token_cache_ttl: float = 300
+    # Ключи подписи JWT (app/tokens.py): "kid:секрет,kid:секрет", первый подписывает, остальные только проверяют.
+    # Пусто - единственный ключ secret_key
+    token_keys: str = ""
+    # Токены без kid (выпущенные до кольца) проверяются secret_key. По умолчанию - только пока
+    # token_keys пуст; после перехода на кольцо их можно временно принимать явным true на срок
+    # жизни refresh-токенов, затем выключить - иначе secret_key никогда не выводится из оборота
+    accept_legacy_tokens: Optional[bool] = None
+    access_token_expire_minutes: int = 15
+    refresh_token_expire_days: int = 14
+    # Отзыв токенов: блум-фильтр в памяти, синхронизация с таблицей revoked_tokens и ее перестроение
+    revocation_bloom_capacity: int = 100000
+    revocation_bloom_error_rate: float = 0.001
+    revocation_sync_interval: float = 5
+    revocation_rebuild_interval: float = 3600
+    # Параметры argon2 (по умолчанию - значения passlib) и пул процессов для хеширования (app/hashing.py)
+    argon2_time_cost: int = 2
+    argon2_memory_cost: int = 102400
+    argon2_parallelism: int = 8
+    hash_workers: int = Field(default_factory=lambda: min(4, os.cpu_count() or 1))
+    hash_max_pending: int = 64
+    # Кеш сериализованных ответов чтения объявлений (app/response_cache.py)
+    response_cache_size: int = 2048
+    response_cache_ttl: float = 300
+    # С репликой (database_read_url) ответы не кешируются столько секунд после изменения объявлений:
+    # реплика могла еще не получить запись, и устаревший ответ прожил бы в кеше весь TTL.
+    # Должно быть не меньше типичного отставания реплики
+    response_cache_replica_lag: float = 5
+    # Размер пачки (строк в транзакции) для массового импорта и экспорта объявлений
+    bulk_batch_size: int = 1000
+    # Ограничение частоты запросов (app/rate_limit.py): "N/second|minute|hour|day", пустая строка - без лимита.
+    # login и register считаются по IP, создание объявлений - по пользователю из токена
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "app.rate_limit:MemoryBackend"
+    rate_limit_login: str = "20/minute"
+    rate_limit_register: str = "10/minute"
+    rate_limit_create_advertisement: str = "60/minute"
+    # Очистка мягко удаленных данных (app/purge.py): период проверки, размер пачки, пауза между пачками
+    # и срок хранения удаленных строк до физического удаления
+    purge_interval: float = 60
+    purge_batch_size: int = 500
+    purge_pause: float = 0.05
+    purge_retention_seconds: float = 7 * 24 * 3600
+    # Профилирование запросов (app/profiling.py): по заголовку администратора и/или доле запросов,
+    # семплирование стеков раз в profile_interval_ms, в памяти - последние profile_buffer_size профилей
+    profiling_enabled: bool = False
+    profile_header: str = "X-Profile"
+    profile_sample_rate: float = 0.0
+    profile_interval_ms: float = 5
+    profile_buffer_size: int = 50
+    # Счетчики просмотров (app/views.py): шарды буфера, период записи в БД;
+    # рейтинг популярных - размер top-K и период перечитывания из БД (учесть другие воркеры)
+    views_shards: int = 16
+    views_flush_interval: float = 5
+    popular_size: int = 100
+    popular_refresh_interval: float = 60
+    # Очередь работы после записи (app/outbox.py): параллельных пачек, событий в пачке, период опроса таблицы,
+    # задержка после сигнала о новом событии (копим пачку), попытки с экспоненциальной паузой,
+    # аренда взятой пачки и время дообработки при остановке
+    outbox_concurrency: int = 4
+    outbox_batch_size: int = 100
+    outbox_poll_interval: float = 1
+    outbox_batch_delay: float = 0.2
+    outbox_max_attempts: int = 5
+    outbox_retry_delay: float = 1
+    outbox_lease_seconds: float = 60
+    outbox_drain_timeout: float = 10
 
-settings = Settings()
\ No newline at end of file
+    @model_validator(mode="after")
+    def build_database_url(self):
+        if self.database_url is None:
+            if self.postgres_host:
+                self.database_url = (
+                    f"postgresql://{quote_plus(self.postgres_user)}:{quote_plus(self.postgres_password)}"
+                    f"@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
+                )
+            else:
+                self.database_url = "sqlite:///./advertisements.db"
+        return self
+
+settings = Settings()
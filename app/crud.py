@@ -1,30 +1,70 @@
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import Optional, List
+import contextlib
+import datetime
+import operator
 import uuid
-from app import models, schemas, auth
+from app import (
+    models, schemas, auth, cache, outbox, pagination, price_stats, purge, response_cache, search, sharding, views
+)
+
+
+SORT_CREATED_AT = "created_at"
+SORT_RELEVANCE = "relevance"
+
+# Колонки ответа для чтения кортежами без построения ORM-объектов (as_rows=True)
+_advertisement_columns = tuple(getattr(models.Advertisement, name) for name in response_cache.ADVERTISEMENT_FIELDS)
+_user_columns = tuple(getattr(models.User, name) for name in response_cache.USER_FIELDS)
+
+
+# Мягко удаленные строки (deleted_at не NULL) не видны ни в одном запросе чтения
+_live_user = models.User.deleted_at.is_(None)
+_live_advertisement = models.Advertisement.deleted_at.is_(None)
+
+# Ключ порядка выдачи (created_at, id) - по нему же сливаются ответы шардов (app/sharding.py)
+_created_at_key = operator.attrgetter("created_at", "id")
 
 
 # User CRUD
 def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+    return db.query(models.User).filter(models.User.username == username, _live_user).first()
 
 
 def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+    return db.query(models.User).filter(models.User.email == email, _live_user).first()
 
 
 def get_user_by_id(db: Session, user_id: uuid.UUID):
-    return db.query(models.User).filter(models.User.id == user_id).first()
-
-
-def create_user(db: Session, user: schemas.UserCreate):
-    # Проверяем уникальность username и email
-    if get_user_by_username(db, user.username):
-        raise ValueError("Username already exists")
-    if get_user_by_email(db, user.email):
-        raise ValueError("Email already exists")
-
-    hashed_password = auth.get_password_hash(user.password)
+    return db.query(models.User).filter(models.User.id == user_id, _live_user).first()
+
+
+def get_users_by_ids(db: Session, user_ids: List[uuid.UUID], as_rows: bool = False):
+    # Как get_advertisements_by_ids: один запрос IN, порядок - как в user_ids
+    if not user_ids:
+        return []
+    query = db.query(*_user_columns) if as_rows else db.query(models.User)
+    found = {row.id: row for row in query.filter(models.User.id.in_(user_ids), _live_user)}
+    return [found[user_id] for user_id in user_ids if user_id in found]
+
+
+def _unique_violation(error: IntegrityError) -> Exception:
+    # Уникальность username/email проверяет БД - переводим нарушение ограничения в понятную ошибку
+    message = str(error.orig).lower()
+    if "unique" not in message and "duplicate" not in message:
+        return error
+    if "username" in message:
+        return ValueError("Username already exists")
+    if "email" in message:
+        return ValueError("Email already exists")
+    return ValueError("User already exists")
+
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    # hashed_password можно посчитать заранее (async-режим хеширует, не блокируя event loop)
+    if hashed_password is None:
+        hashed_password = auth.get_password_hash(user.password)
     db_user = models.User(
         username=user.username,
         email=user.email,
@@ -32,44 +72,61 @@ def create_user(db: Session, user: schemas.UserCreate):
         group=user.group.value if isinstance(user.group, schemas.UserGroup) else user.group
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    try:
+        # eager_defaults: один INSERT ... RETURNING вместо INSERT + refresh
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise _unique_violation(e)
     return db_user
 
 
-def update_user(db: Session, user_id: uuid.UUID, user_update: schemas.UserUpdate):
-    db_user = get_user_by_id(db, user_id)
-    if not db_user:
-        return None
-
+def update_user(
+        db: Session,
+        user_id: uuid.UUID,
+        user_update: schemas.UserUpdate,
+        hashed_password: Optional[str] = None
+):
     update_data = user_update.dict(exclude_unset=True)
 
-    # Проверяем уникальность при обновлении
-    if "username" in update_data and update_data["username"] != db_user.username:
-        if get_user_by_username(db, update_data["username"]):
-            raise ValueError("Username already exists")
-
-    if "email" in update_data and update_data["email"] != db_user.email:
-        if get_user_by_email(db, update_data["email"]):
-            raise ValueError("Email already exists")
-
     if "password" in update_data:
-        update_data["hashed_password"] = auth.get_password_hash(update_data.pop("password"))
-
-    for field, value in update_data.items():
-        setattr(db_user, field, value)
-
-    db.commit()
-    db.refresh(db_user)
+        password = update_data.pop("password")
+        update_data["hashed_password"] = hashed_password or auth.get_password_hash(password)
+
+    if not update_data:
+        return get_user_by_id(db, user_id)
+
+    # Один UPDATE ... RETURNING вместо SELECT + проверок уникальности + UPDATE + refresh
+    try:
+        db_user = db.execute(
+            update(models.User)
+            .where(models.User.id == user_id, _live_user)
+            .values(**update_data)
+            .returning(models.User)
+        ).scalar_one_or_none()
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise _unique_violation(e)
+    cache.invalidate_principal(user_id)
     return db_user
 
 
 def delete_user(db: Session, user_id: uuid.UUID):
-    db_user = get_user_by_id(db, user_id)
-    if db_user:
-        db.delete(db_user)
-        db.commit()
-    return db_user
+    # Мягкое удаление одной строкой; объявления пользователя пачками снимает фоновая очистка,
+    # чтобы не держать блокировку записи на время удаления всех объявлений.
+    # username и email освобождаются сразу: уникальны только среди живых пользователей
+    deleted_id = db.execute(
+        update(models.User)
+        .where(models.User.id == user_id, _live_user)
+        .values(deleted_at=datetime.datetime.utcnow(), is_active=False)
+        .returning(models.User.id)
+    ).scalar_one_or_none()
+    db.commit()
+    if deleted_id:
+        cache.invalidate_principal(user_id)
+        purge.job.wake()
+    return deleted_id
 
 
 # Advertisement CRUD
@@ -78,57 +135,299 @@ def create_advertisement(db: Session, advertisement: schemas.AdvertisementCreate
         **advertisement.dict(),
         author_id=author_id
     )
-    db.add(db_advertisement)
-    db.commit()
-    db.refresh(db_advertisement)
+    # Объявление, его сводка цен и событие outbox - в шарде категории, одной транзакцией
+    with sharding.session(db, sharding.shard_for(advertisement.category)) as shard_db:
+        shard_db.add(db_advertisement)
+        shard_db.flush()
+        # Сводка цен - в той же транзакции, индексация для поиска - событием outbox после ответа
+        search.enqueue_reindex(shard_db, [db_advertisement.id])
+        price_stats.record(shard_db, added=[db_advertisement.price])
+        shard_db.commit()
+    outbox.worker.wake()
+    response_cache.invalidate_advertisement()
     return db_advertisement
 
 
+def bulk_create_advertisements(db: Session, advertisements: List[schemas.AdvertisementCreate], author_id: uuid.UUID):
+    # Одна транзакция и один executemany на пачку вместо commit/refresh на каждое объявление
+    rows = [
+        {**advertisement.dict(), "id": uuid.uuid4(), "author_id": author_id}
+        for advertisement in advertisements
+    ]
+    by_shard = {}
+    for row in rows:
+        by_shard.setdefault(sharding.shard_for(row["category"]), []).append(row)
+    # Пачка с категориями разных шардов: сначала пишем во все, затем фиксируем. Ошибки строк
+    # (ограничения) возникают до первого commit, и тогда пачка откатывается целиком
+    with contextlib.ExitStack() as stack:
+        sessions = [(stack.enter_context(sharding.session(db, shard)), shard_rows)
+                    for shard, shard_rows in by_shard.items()]
+        try:
+            for shard_db, shard_rows in sessions:
+                shard_db.execute(insert(models.Advertisement), shard_rows)
+                search.enqueue_reindex(shard_db, [row["id"] for row in shard_rows])
+                price_stats.record(shard_db, added=[row["price"] for row in shard_rows])
+            for shard_db, _ in sessions:
+                shard_db.commit()
+        except Exception:
+            for shard_db, _ in sessions:
+                shard_db.rollback()
+            raise
+    outbox.worker.wake()
+    response_cache.invalidate_advertisement()
+    return len(rows)
+
+
+def _advertisement_query(db: Session, as_rows: bool):
+    query = db.query(*_advertisement_columns) if as_rows else db.query(models.Advertisement)
+    return query.filter(_live_advertisement)
+
+
+def iter_advertisements(
+        db: Session,
+        author_id: Optional[uuid.UUID] = None,
+        batch_size: int = 1000,
+        as_rows: bool = False
+):
+    # yield_per читает строки порциями по batch_size, не загружая всю таблицу в память
+    def query(shard_db: Session):
+        ordered = _advertisement_query(shard_db, as_rows).order_by(
+            models.Advertisement.created_at, models.Advertisement.id
+        )
+        if author_id is not None:
+            ordered = ordered.filter(models.Advertisement.author_id == author_id)
+        return ordered.yield_per(batch_size)
+    return sharding.iter_merged(db, query, _created_at_key)
+
+
+def _get_advertisement_by_id(db: Session, advertisement_id: uuid.UUID):
+    return db.query(models.Advertisement).filter(
+        models.Advertisement.id == advertisement_id, _live_advertisement
+    ).first()
+
+
 def get_advertisement_by_id(db: Session, advertisement_id: uuid.UUID):
-    return db.query(models.Advertisement).filter(models.Advertisement.id == advertisement_id).first()
+    # Шард объявления по id неизвестен - ищем во всех; запись потом идет в шард его категории
+    return next(filter(None, sharding.fan_out(db, _get_advertisement_by_id, advertisement_id)), None)
 
 
-def get_advertisements(
-        db: Session,
+def _find_advertisements(db: Session, advertisement_ids: List[uuid.UUID], as_rows: bool):
+    return _advertisement_query(db, as_rows).filter(models.Advertisement.id.in_(advertisement_ids)).all()
+
+
+def get_advertisements_by_ids(db: Session, advertisement_ids: List[uuid.UUID], as_rows: bool = False):
+    # Один запрос IN по первичному ключу (в каждом шарде); отсутствующие и удаленные пропускаются,
+    # порядок - как в advertisement_ids
+    if not advertisement_ids:
+        return []
+    found = {
+        row.id: row
+        for rows in sharding.fan_out(db, _find_advertisements, advertisement_ids, as_rows)
+        for row in rows
+    }
+    return [found[advertisement_id] for advertisement_id in advertisement_ids if advertisement_id in found]
+
+
+def get_advertisements_with_authors(db: Session, advertisement_ids: List[uuid.UUID]):
+    # Пары (объявление, автор или None) строками по колонкам: два запроса IN на весь пакет, без N+1
+    advertisements = get_advertisements_by_ids(db, advertisement_ids, as_rows=True)
+    author_ids = list({advertisement.author_id for advertisement in advertisements})
+    authors = {row.id: row for row in get_users_by_ids(db, author_ids, as_rows=True)}
+    return [(advertisement, authors.get(advertisement.author_id)) for advertisement in advertisements]
+
+
+def get_popular_advertisements(db: Session, limit: int):
+    # Рейтинг - из памяти (app/views.py), из БД - только сами объявления
+    ranked = views.counter.ranking.top(limit)
+    rows = {row.id: row for row in get_advertisements_by_ids(db, [ad_id for ad_id, _ in ranked], as_rows=True)}
+    return [(rows[ad_id], view_count) for ad_id, view_count in ranked if ad_id in rows]
+
+
+def _filter_advertisements(
+        query,
         title: Optional[str] = None,
         description: Optional[str] = None,
         min_price: Optional[float] = None,
-        max_price: Optional[float] = None
+        max_price: Optional[float] = None,
+        category: Optional[str] = None
 ):
-    query = db.query(models.Advertisement)
-    if title:
-        query = query.filter(models.Advertisement.title.ilike(f"%{title}%"))
-    if description:
-        query = query.filter(models.Advertisement.description.ilike(f"%{description}%"))
+    query, relevance = search.apply_search(query, title, description)
     if min_price is not None:
         query = query.filter(models.Advertisement.price >= min_price)
     if max_price is not None:
         query = query.filter(models.Advertisement.price <= max_price)
+    if category is not None:
+        query = query.filter(models.Advertisement.category == category)
+    return query, relevance
 
-    return query.order_by(models.Advertisement.created_at.desc()).all()
 
+def _order_advertisements(query, relevance, sort: str):
+    if sort == SORT_RELEVANCE:
+        if relevance is None:
+            raise ValueError("Relevance sorting requires a title or description filter")
+        return query.order_by(relevance, models.Advertisement.created_at.desc(), models.Advertisement.id.desc())
+    return query.order_by(models.Advertisement.created_at.desc(), models.Advertisement.id.desc())
 
-def update_advertisement(db: Session, advertisement_id: uuid.UUID, advertisement_update: schemas.AdvertisementUpdate):
-    db_advertisement = get_advertisement_by_id(db, advertisement_id)
-    if not db_advertisement:
-        return None
 
-    update_data = advertisement_update.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_advertisement, field, value)
+def _search_shard(
+        db: Session,
+        limit: Optional[int],
+        cursor: Optional[str],
+        title: Optional[str],
+        description: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        sort: str,
+        as_rows: bool,
+        category: Optional[str],
+        with_relevance: bool
+):
+    query, relevance = _filter_advertisements(
+        _advertisement_query(db, as_rows), title, description, min_price, max_price, category
+    )
+    # Keyset-пагинация по (created_at, id): читаем не больше limit + 1 строк на любой глубине
+    if cursor:
+        created_at, advertisement_id = pagination.decode_cursor(cursor)
+        query = query.filter(
+            tuple_(models.Advertisement.created_at, models.Advertisement.id) < (created_at, advertisement_id)
+        )
+    query = _order_advertisements(query, relevance, sort)
+    if with_relevance:
+        # Значение релевантности в строке - по нему сливаются ответы шардов
+        query = query.add_columns(relevance.element.label("relevance"))
+    return (query if limit is None else query.limit(limit)).all()
+
+
+def _search(
+        db: Session,
+        limit: Optional[int],
+        cursor: Optional[str],
+        title: Optional[str],
+        description: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        sort: str,
+        as_rows: bool,
+        category: Optional[str]
+):
+    shards = sharding.shards_for(category)
+    with_relevance = sort == SORT_RELEVANCE and len(shards) > 1
+    results = sharding.fan_out(
+        db, _search_shard, limit, cursor, title, description, min_price, max_price, sort, as_rows, category,
+        with_relevance, shards=shards
+    )
+    if len(results) == 1:
+        return results[0]
+    if not with_relevance:
+        return sharding.merge(results, _created_at_key, reverse=True, limit=limit)
+    # Без категории релевантность сравнивается между шардами: оценка каждого FTS считается по своим
+    # документам, поэтому порядок на стыке шардов приблизительный. bm25 - чем меньше, тем лучше, ts_rank - наоборот
+    descending = search.backend == search.POSTGRES
+    items = sharding.merge(results, operator.attrgetter("relevance"), reverse=descending, limit=limit)
+    return items if as_rows else [row[0] for row in items]
 
-    db.commit()
-    db.refresh(db_advertisement)
+
+def get_advertisements(
+        db: Session,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = SORT_CREATED_AT,
+        as_rows: bool = False,
+        category: Optional[str] = None
+):
+    return _search(db, None, None, title, description, min_price, max_price, sort, as_rows, category)
+
+
+def get_advertisements_page(
+        db: Session,
+        limit: int,
+        cursor: Optional[str] = None,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = SORT_CREATED_AT,
+        as_rows: bool = False,
+        category: Optional[str] = None
+):
+    if sort == SORT_RELEVANCE:
+        # Курсор привязан к (created_at, id), для сортировки по релевантности отдаем только первую страницу
+        if cursor:
+            raise ValueError("Cursor pagination is not supported with relevance sorting")
+        return _search(db, limit, None, title, description, min_price, max_price, sort, as_rows, category), None
+
+    items = _search(db, limit + 1, cursor, title, description, min_price, max_price, sort, as_rows, category)
+    return items[:limit], pagination.next_cursor(items, limit)
+
+
+def get_price_stats(
+        db: Session,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        category: Optional[str] = None
+):
+    if title is None and description is None and min_price is None and max_price is None and category is None:
+        return price_stats.merge_summaries(sharding.fan_out(db, price_stats.summary_parts))
+    query, _ = _filter_advertisements(
+        select(models.Advertisement).where(_live_advertisement), title, description, min_price, max_price, category
+    )
+    return price_stats.merge_aggregates(
+        sharding.fan_out(db, price_stats.aggregate_rows, query, shards=sharding.shards_for(category))
+    )
+
+
+def update_advertisement(
+        db: Session,
+        db_advertisement: models.Advertisement,
+        advertisement_update: schemas.AdvertisementUpdate
+):
+    # Объявление уже загружено роутером при проверке прав - повторно не читаем
+    update_data = advertisement_update.dict(exclude_unset=True)
+    with sharding.session(db, sharding.shard_for(db_advertisement.category)) as shard_db:
+        # Объявление другого шарда прочитано уже закрытой сессией - присоединяем его к сессии шарда
+        shard_db.add(db_advertisement)
+        old_price = db_advertisement.price
+        for field, value in update_data.items():
+            setattr(db_advertisement, field, value)
+
+        if db_advertisement.price != old_price:
+            price_stats.record(shard_db, added=[db_advertisement.price], removed=[old_price])
+        if "title" in update_data or "description" in update_data:
+            search.enqueue_reindex(shard_db, [db_advertisement.id])
+        shard_db.commit()
+    outbox.worker.wake()
+    response_cache.invalidate_advertisement(db_advertisement.id)
     return db_advertisement
 
 
-def delete_advertisement(db: Session, advertisement_id: uuid.UUID):
-    db_advertisement = get_advertisement_by_id(db, advertisement_id)
-    if db_advertisement:
-        db.delete(db_advertisement)
-        db.commit()
+def delete_advertisement(db: Session, db_advertisement: models.Advertisement):
+    # Мягкое удаление: строку и ее запись в FTS физически удалит фоновая очистка после срока хранения.
+    # Условный UPDATE: при параллельных удалениях сводку цен уменьшает только первый
+    with sharding.session(db, sharding.shard_for(db_advertisement.category)) as shard_db:
+        price = shard_db.execute(
+            update(models.Advertisement)
+            .where(models.Advertisement.id == db_advertisement.id, _live_advertisement)
+            .values(deleted_at=datetime.datetime.utcnow())
+            .returning(models.Advertisement.price)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+        if price is not None:
+            price_stats.record(shard_db, removed=[price])
+        shard_db.commit()
+    views.counter.ranking.discard(db_advertisement.id)
+    response_cache.invalidate_advertisement(db_advertisement.id)
     return db_advertisement
 
 
+def _user_advertisements(db: Session, user_id: uuid.UUID):
+    return db.query(models.Advertisement).filter(
+        models.Advertisement.author_id == user_id, _live_advertisement
+    ).order_by(models.Advertisement.created_at.desc(), models.Advertisement.id.desc()).all()
+
+
 def get_user_advertisements(db: Session, user_id: uuid.UUID):
-    return db.query(models.Advertisement).filter(models.Advertisement.author_id == user_id).all()
\ No newline at end of file
+    return sharding.merge(sharding.fan_out(db, _user_advertisements, user_id), _created_at_key, reverse=True)
@@ -0,0 +1,149 @@
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Iterable, List, Optional
+import uuid
+from app import auth, crud, database, models, schemas, sharding
+
+# Асинхронные версии функций crud. Запросы выполняются через AsyncSession.run_sync:
+# логика остается в одном месте (app/crud.py), а ввод-вывод идет через асинхронный драйвер.
+# Вызовы, затрагивающие другие шарды объявлений (app/sharding.py), идут в threadpool: run_sync
+# выполняется в потоке event loop, и ожидание потоков шардов в sharding.fan_out остановило бы его
+
+
+async def _in_shards(db: AsyncSession, fn, *args, shards: Optional[Iterable[str]] = None):
+    shards = list(sharding.engines) if shards is None else list(shards)
+    if shards == [sharding.DEFAULT]:
+        return await db.run_sync(fn, *args)
+    # Основная БД - синхронной сессией того же движка (основного или реплики), что и у db
+    session_factory = database.SessionLocal if db.bind is database.async_engine else database.ReadSessionLocal
+
+    def call():
+        with session_factory() as sync_db:
+            return fn(sync_db, *args)
+    return await run_in_threadpool(call)
+
+
+# User CRUD
+async def get_user_by_username(db: AsyncSession, username: str):
+    return await db.run_sync(crud.get_user_by_username, username)
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.run_sync(crud.get_user_by_email, email)
+
+
+async def get_user_by_id(db: AsyncSession, user_id: uuid.UUID):
+    return await db.run_sync(crud.get_user_by_id, user_id)
+
+
+async def get_users_by_ids(db: AsyncSession, user_ids: List[uuid.UUID], as_rows: bool = False):
+    return await db.run_sync(crud.get_users_by_ids, user_ids, as_rows)
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    # argon2 считаем до run_sync, иначе ожидание пула хеширования заблокирует event loop
+    hashed_password = await auth.get_password_hash_async(user.password)
+    return await db.run_sync(crud.create_user, user, hashed_password)
+
+
+async def update_user(db: AsyncSession, user_id: uuid.UUID, user_update: schemas.UserUpdate):
+    hashed_password = None
+    if user_update.password is not None:
+        hashed_password = await auth.get_password_hash_async(user_update.password)
+    return await db.run_sync(crud.update_user, user_id, user_update, hashed_password)
+
+
+async def delete_user(db: AsyncSession, user_id: uuid.UUID):
+    return await db.run_sync(crud.delete_user, user_id)
+
+
+# Advertisement CRUD
+async def create_advertisement(db: AsyncSession, advertisement: schemas.AdvertisementCreate, author_id: uuid.UUID):
+    return await _in_shards(
+        db, crud.create_advertisement, advertisement, author_id, shards=[sharding.shard_for(advertisement.category)]
+    )
+
+
+async def get_advertisement_by_id(db: AsyncSession, advertisement_id: uuid.UUID):
+    return await _in_shards(db, crud.get_advertisement_by_id, advertisement_id)
+
+
+async def get_advertisements_by_ids(db: AsyncSession, advertisement_ids: List[uuid.UUID], as_rows: bool = False):
+    return await _in_shards(db, crud.get_advertisements_by_ids, advertisement_ids, as_rows)
+
+
+async def get_advertisements_with_authors(db: AsyncSession, advertisement_ids: List[uuid.UUID]):
+    return await _in_shards(db, crud.get_advertisements_with_authors, advertisement_ids)
+
+
+async def get_popular_advertisements(db: AsyncSession, limit: int):
+    return await _in_shards(db, crud.get_popular_advertisements, limit)
+
+
+async def get_advertisements(
+        db: AsyncSession,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = crud.SORT_CREATED_AT,
+        as_rows: bool = False,
+        category: Optional[str] = None
+):
+    return await _in_shards(
+        db, crud.get_advertisements, title, description, min_price, max_price, sort, as_rows, category,
+        shards=sharding.shards_for(category)
+    )
+
+
+async def get_price_stats(
+        db: AsyncSession,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        category: Optional[str] = None
+):
+    return await _in_shards(
+        db, crud.get_price_stats, title, description, min_price, max_price, category,
+        shards=sharding.shards_for(category)
+    )
+
+
+async def get_advertisements_page(
+        db: AsyncSession,
+        limit: int,
+        cursor: Optional[str] = None,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = crud.SORT_CREATED_AT,
+        as_rows: bool = False,
+        category: Optional[str] = None
+):
+    return await _in_shards(
+        db, crud.get_advertisements_page, limit, cursor, title, description, min_price, max_price, sort, as_rows,
+        category, shards=sharding.shards_for(category)
+    )
+
+
+async def update_advertisement(
+        db: AsyncSession,
+        db_advertisement: models.Advertisement,
+        advertisement_update: schemas.AdvertisementUpdate
+):
+    return await _in_shards(
+        db, crud.update_advertisement, db_advertisement, advertisement_update,
+        shards=[sharding.shard_for(db_advertisement.category)]
+    )
+
+
+async def delete_advertisement(db: AsyncSession, db_advertisement: models.Advertisement):
+    return await _in_shards(
+        db, crud.delete_advertisement, db_advertisement, shards=[sharding.shard_for(db_advertisement.category)]
+    )
+
+
+async def get_user_advertisements(db: AsyncSession, user_id: uuid.UUID):
+    return await _in_shards(db, crud.get_user_advertisements, user_id)
@@ -1,17 +1,107 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from app import metrics
 from app.config import settings
 
 SQLALCHEMY_DATABASE_URL = settings.database_url
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _engine_options(url: str, is_async: bool = False) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        options = {"connect_args": {"check_same_thread": False, "timeout": settings.sqlite_busy_timeout_ms / 1000}}
+        if parsed.database in (None, "", ":memory:"):
+            # In-memory SQLite живет в одном соединении - настройки пула к нему неприменимы
+            return options
+    elif parsed.get_backend_name() == "postgresql":
+        if is_async:
+            options = {"connect_args": {"server_settings": {"statement_timeout": str(settings.db_statement_timeout_ms)}}}
+        else:
+            options = {"connect_args": {"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"}}
+    else:
+        options = {}
+
+    options.update(
+        # Пул с замером времени ожидания соединения (app/metrics.py)
+        poolclass=metrics.InstrumentedAsyncQueuePool if is_async else metrics.InstrumentedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+    return options
+
+
+def _configure_sqlite(sync_engine, foreign_keys: bool = settings.sqlite_foreign_keys):
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+        cursor.execute(f"PRAGMA foreign_keys={'ON' if foreign_keys else 'OFF'}")
+        cursor.close()
+
+
+def make_engine(url: str, foreign_keys: bool = settings.sqlite_foreign_keys):
+    new_engine = create_engine(url, **_engine_options(url))
+    if _is_sqlite(url):
+        _configure_sqlite(new_engine, foreign_keys)
+    return new_engine
+
+
+engine = make_engine(SQLALCHEMY_DATABASE_URL)
+# Без реплики чтение идет в основную БД
+read_engine = make_engine(settings.database_read_url) if settings.database_read_url else engine
+# expire_on_commit=False: после commit не перечитываем объект - он уже содержит актуальные данные
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=read_engine)
 Base = declarative_base()
 
+
+def _async_database_url(url: str) -> str:
+    # Тот же URL, но с асинхронным драйвером
+    for sync_prefix, async_prefix in (
+            ("sqlite://", "sqlite+aiosqlite://"),
+            ("postgresql://", "postgresql+asyncpg://"),
+            ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+
+# Асинхронный движок создаем только в async-режиме, чтобы не требовать greenlet и aiosqlite/asyncpg без необходимости
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+if settings.async_db:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    def make_async_engine(url: str):
+        new_engine = create_async_engine(_async_database_url(url), **_engine_options(url, is_async=True))
+        if _is_sqlite(url):
+            _configure_sqlite(new_engine.sync_engine)
+        return new_engine
+
+    async_engine = make_async_engine(SQLALCHEMY_DATABASE_URL)
+    async_read_engine = make_async_engine(settings.database_read_url) if settings.database_read_url else async_engine
+    # expire_on_commit=False: после commit атрибуты не должны подгружаться лениво вне greenlet
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, expire_on_commit=False)
+
+# Сессия на запрос. Соединение из пула берется при первом запросе к БД, а не при создании
+# сессии, поэтому зависимость, не дошедшая до БД (кеш авторизации, кешированный ответ), пул не трогает.
+# FastAPI кеширует зависимость в пределах запроса: все Depends(get_db) получают одну сессию
 def get_db():
     db = SessionLocal()
     try:
@@ -19,5 +109,29 @@ def get_db():
     finally:
         db.close()
 
-def create_tables():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+if settings.database_read_url:
+    def get_read_db():
+        db = ReadSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_async_read_db():
+        async with AsyncReadSessionLocal() as db:
+            yield db
+else:
+    # Без реплики чтение - та же зависимость: авторизация (optional_auth) и обработчик
+    # делят одну сессию и одно соединение вместо двух одновременно занятых
+    get_read_db = get_db
+    get_async_read_db = get_async_db
+
+def create_tables(bind=engine):
+    from app import migrations
+
+    Base.metadata.create_all(bind=bind)
+    migrations.run(bind)
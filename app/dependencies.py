@@ -2,7 +2,10 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from typing import Optional
+import hashlib
+import time
 import uuid
+from app import cache, tokens
 from app.database import get_db
 from app.auth import verify_token
 from app.crud import get_user_by_id
@@ -11,18 +14,45 @@ from app.crud import get_user_by_id
 security = HTTPBearer(auto_error=False)
 
 
-def get_current_user(
-        credentials: HTTPAuthorizationCredentials = Depends(security),
-        db: Session = Depends(get_db)
-):
-    if not credentials:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Authorization required"
-        )
-
+def token_cache_key(token: str) -> bytes:
+    # Ключ кеша - хеш токена: сами токены в памяти процесса не храним
+    return hashlib.sha256(token.encode()).digest()
+
+
+def decode_token(token: str, check_revoked: bool = True) -> Optional[dict]:
+    # Подпись проверяем один раз, дальше берем payload из кеша по хешу токена.
+    # Вместе с payload храним версию списка отзыва, с которой он проверен: пока новых отзывов нет,
+    # повторная проверка не нужна. Иначе - блум-фильтр в памяти, в БД только при его срабатывании.
+    # check_revoked=False - для middleware, которым нужен лишь sub (лимиты): отозванный токен
+    # все равно отклонят зависимости авторизации
+    key = token_cache_key(token)
+    entry = cache.token_cache.get(key)
+    if entry is None:
+        payload = verify_token(token)
+        if not payload:
+            return None
+        ttl = min(cache.token_cache.ttl, payload.get("exp", 0) - time.time())
+        entry = (payload, -1)
+        if ttl > 0:
+            cache.token_cache.set(key, entry, ttl)
+    payload, checked_version = entry
+    if not check_revoked:
+        return payload
+    revocations = tokens.revocations
+    if checked_version != revocations.version:
+        version = revocations.version
+        if revocations.is_revoked(payload.get("jti")):
+            cache.token_cache.pop(key)
+            return None
+        ttl = min(cache.token_cache.ttl, payload.get("exp", 0) - time.time())
+        if ttl > 0:
+            cache.token_cache.set(key, (payload, version), ttl)
+    return payload
+
+
+def user_id_from_credentials(credentials: HTTPAuthorizationCredentials) -> uuid.UUID:
     token = credentials.credentials
-    payload = verify_token(token)
+    payload = decode_token(token)
     if not payload:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -38,23 +68,48 @@ def get_current_user(
 
     # Преобразуем строку обратно в UUID
     try:
-        user_uuid = uuid.UUID(user_id)
+        return uuid.UUID(user_id)
     except ValueError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid user ID in token"
         )
 
-    user = get_user_by_id(db, user_uuid)
+
+def load_principal(db: Session, user_id: uuid.UUID) -> Optional[cache.Principal]:
+    principal = cache.principal_cache.get(user_id)
+    if principal is None:
+        user = get_user_by_id(db, user_id)
+        if not user:
+            return None
+        principal = cache.Principal.from_user(user)
+        cache.principal_cache.set(user_id, principal)
+    return principal
+
+
+def check_active_user(user):
     if not user or not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found or inactive"
         )
-
     return user
 
 
+def get_current_user(
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: Session = Depends(get_db)
+):
+    if not credentials:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authorization required"
+        )
+
+    user_uuid = user_id_from_credentials(credentials)
+    return check_active_user(load_principal(db, user_uuid))
+
+
 def require_admin(current_user=Depends(get_current_user)):
     if current_user.group != "admin":
         raise HTTPException(
@@ -71,23 +126,9 @@ def optional_auth(
     if not credentials:
         return None
 
-    # Дублируем логику get_current_user, но без выброса исключений
-    token = credentials.credentials
-    payload = verify_token(token)
-    if not payload:
-        return None
-
-    user_id = payload.get("sub")
-    if not user_id:
-        return None
-
+    # Та же логика, что в get_current_user, но без выброса исключений
     try:
-        user_uuid = uuid.UUID(user_id)
-    except ValueError:
+        user_uuid = user_id_from_credentials(credentials)
+        return check_active_user(load_principal(db, user_uuid))
+    except HTTPException:
         return None
-
-    user = get_user_by_id(db, user_uuid)
-    if not user or not user.is_active:
-        return None
-
-    return user
\ No newline at end of file
@@ -0,0 +1,53 @@
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import uuid
+from app import cache, crud_async
+from app.database import get_async_db
+from app.dependencies import security, user_id_from_credentials, check_active_user, require_admin
+
+# Асинхронные версии зависимостей из app/dependencies.py (settings.async_db)
+
+
+async def load_principal_async(db: AsyncSession, user_id: uuid.UUID) -> Optional[cache.Principal]:
+    principal = cache.principal_cache.get(user_id)
+    if principal is None:
+        user = await crud_async.get_user_by_id(db, user_id)
+        if not user:
+            return None
+        principal = cache.Principal.from_user(user)
+        cache.principal_cache.set(user_id, principal)
+    return principal
+
+
+async def get_current_user_async(
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: AsyncSession = Depends(get_async_db)
+):
+    if not credentials:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authorization required"
+        )
+
+    user_uuid = user_id_from_credentials(credentials)
+    return check_active_user(await load_principal_async(db, user_uuid))
+
+
+async def require_admin_async(current_user=Depends(get_current_user_async)):
+    return require_admin(current_user)
+
+
+async def optional_auth_async(
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+        db: AsyncSession = Depends(get_async_db)
+):
+    if not credentials:
+        return None
+
+    try:
+        user_uuid = user_id_from_credentials(credentials)
+        return check_active_user(await load_principal_async(db, user_uuid))
+    except HTTPException:
+        return None
@@ -0,0 +1,135 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Tuple
+from app import metrics
+from app.config import settings
+
+# argon2 - схема новых хешей. Остальные только проверяются: ими хешировал пароли прежний
+# app/routers/auth.py. Такие хеши, как и argon2 с устаревшими параметрами, после успешного
+# входа пересчитываются в фоне (app/auth.py)
+SCHEMES = ["argon2", "pbkdf2_sha256", "django_argon2", "sha256_crypt"]
+
+_pwd_context = None
+_pwd_context_lock = threading.Lock()
+
+
+def get_pwd_context():
+    # passlib и бэкенды хешей загружаются при первом хешировании - в процессах пула, а не при импорте приложения
+    global _pwd_context
+    if _pwd_context is None:
+        with _pwd_context_lock:
+            if _pwd_context is None:
+                from passlib.context import CryptContext
+
+                _pwd_context = CryptContext(
+                    schemes=SCHEMES,
+                    default="argon2",
+                    deprecated="auto",
+                    argon2__time_cost=settings.argon2_time_cost,
+                    argon2__memory_cost=settings.argon2_memory_cost,
+                    argon2__parallelism=settings.argon2_parallelism,
+                )
+    return _pwd_context
+
+
+class HashingOverloaded(Exception):
+    """Очередь на хеширование заполнена - запрос нужно отклонить, а не ставить в ожидание."""
+
+
+# Функции верхнего уровня, чтобы их можно было передать в дочерний процесс
+def hash_password(password: str) -> str:
+    return get_pwd_context().hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+def check_password(plain_password: str, hashed_password: str) -> Tuple[bool, bool]:
+    """(пароль верен, хеш нужно пересчитать с текущей схемой и параметрами)."""
+    context = get_pwd_context()
+    if not context.verify(plain_password, hashed_password):
+        return False, False
+    return True, context.needs_update(hashed_password)
+
+
+class HashingService:
+    """Выполняет argon2 в отдельном пуле процессов с ограничением на число ожидающих задач.
+
+    Хеширование не занимает GIL и потоки веб-сервера: поток запроса только ждет Future.
+    При workers=0 хеширование выполняется в текущем потоке (удобно для разработки).
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                # spawn, а не fork: fork многопоточного сервера может унаследовать захваченные блокировки
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+
+    def submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingOverloaded()
+            self.pending += 1
+
+        started = time.perf_counter()
+        latency = metrics.password_hash_latency.labels(fn.__name__)
+        executor = self._executor or self.start()
+        if executor is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            try:
+                future = executor.submit(fn, *args)
+            except Exception:
+                self._release(None)
+                raise
+        future.add_done_callback(self._release)
+        future.add_done_callback(lambda _future: latency.observe(time.perf_counter() - started))
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    async def run_async(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+        }
+
+
+service = HashingService(settings.hash_workers, settings.hash_max_pending)
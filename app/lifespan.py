@@ -1,8 +1,42 @@
 from contextlib import asynccontextmanager
-from app.database import create_tables
+from app import cache_sync, hashing, migrations, outbox, purge, search, sharding, tokens, views
+from app.database import async_engine, async_read_engine, create_tables
+
+
+def setup_schema():
+    # Таблицы, миграции и полнотекстовый индекс - под общей блокировкой, чтобы воркеры не гонялись за DDL.
+    # search.setup выполняется в каждом процессе: он же выбирает backend поиска.
+    # Шарды объявлений (app/sharding.py) получают ту же схему
+    for shard, shard_engine in sharding.engines.items():
+        with migrations.schema_lock(shard_engine):
+            create_tables(shard_engine)
+            if shard != sharding.DEFAULT:
+                sharding.drop_user_foreign_key(shard_engine)
+            search.setup(shard_engine)
+
 
 @asynccontextmanager
 async def lifespan(app):
     # При запуске создаем таблицы
-    create_tables()
-    yield
\ No newline at end of file
+    setup_schema()
+    # Фильтр отзыва заполняем до первого запроса: иначе отозванные токены прошли бы до первой синхронизации
+    tokens.revocations.load()
+    # Пул хеширования поднимаем заранее, чтобы первый логин не ждал запуска процессов
+    hashing.service.start()
+    purge.job.start()
+    views.counter.start()
+    tokens.sync_job.start()
+    cache_sync.job.start()
+    outbox.worker.start()
+    yield
+    # Сначала дообрабатываем события outbox и сбрасываем просмотры: к этому моменту запросы уже завершены
+    await outbox.worker.stop()
+    await views.counter.stop()
+    await tokens.sync_job.stop()
+    await cache_sync.job.stop()
+    await purge.job.stop()
+    hashing.service.shutdown()
+    if async_engine is not None:
+        await async_engine.dispose()
+    if async_read_engine is not None and async_read_engine is not async_engine:
+        await async_read_engine.dispose()
\ No newline at end of file
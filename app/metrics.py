@@ -0,0 +1,288 @@
+import bisect
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Метрики в текстовом формате Prometheus. Дочерние серии с метками создаются один раз
+# и дальше берутся из словаря по готовому ключу, поэтому на запрос не строятся строки меток
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    )
+    return "{%s}" % pairs
+
+
+class _Family:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(_format_labels(self.labelnames, values), child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+
+class Counter(_Family):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def _render_child(self, labels: str, child: _Value):
+        return [f"{self.name}{labels} {child.value}"]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Family):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, labels: str, child: _HistogramValue):
+        lines = []
+        cumulative = 0
+        inner = labels[1:-1] + "," if labels else ""
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            lines.append(f'{self.name}_bucket{{{inner}le="{le}"}} {cumulative}')
+        lines.append(f"{self.name}_sum{labels} {child.sum}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+registry: List[_Family] = []
+# Функции, которые при выдаче /metrics обновляют метрики из внешних счетчиков (кеши, пул хеширования)
+collectors: List[Callable[[], None]] = []
+
+
+def render() -> str:
+    for collect in collectors:
+        collect()
+    lines = []
+    for family in registry:
+        lines.extend(family.render())
+    return "\n".join(lines) + "\n"
+
+
+# HTTP
+http_requests = Counter("http_requests_total", "HTTP requests", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests being processed").labels()
+
+# БД
+db_queries = Counter("db_queries_total", "SQL statements executed").labels()
+db_query_latency = Histogram("db_query_duration_seconds", "SQL statement latency").labels()
+db_queries_per_request = Histogram(
+    "db_queries_per_request", "SQL statements per HTTP request", ("route",), buckets=COUNT_BUCKETS
+)
+db_time_per_request = Histogram("db_time_per_request_seconds", "Time spent in SQL per HTTP request", ("route",))
+db_pool_wait = Histogram("db_pool_checkout_wait_seconds", "Time waiting for a pooled connection").labels()
+
+# Хеширование паролей (app/hashing.py): время от постановки в очередь до результата
+password_hash_latency = Histogram("password_hash_duration_seconds", "argon2 hash/verify latency", ("operation",))
+# Очередь работы после записи (app/outbox.py): result - done, retry или failed
+outbox_events = Counter("outbox_events_total", "Outbox events handled", ("kind", "result"))
+
+
+# Внешние счетчики: кеши (app/cache.py) и очередь хеширования
+cache_hits = Counter("cache_hits_total", "Cache hits", ("cache",))
+cache_misses = Counter("cache_misses_total", "Cache misses", ("cache",))
+cache_evictions = Counter("cache_evictions_total", "Cache evictions", ("cache",))
+cache_size = Gauge("cache_size", "Cache entries", ("cache",))
+hashing_pending = Gauge("password_hash_pending", "argon2 jobs queued or running").labels()
+hashing_rejected = Counter("password_hash_rejected_total", "argon2 jobs rejected by admission control").labels()
+
+
+def register_cache(name: str, cache):
+    def collect():
+        stats = cache.stats()
+        cache_hits.labels(name).value = stats["hits"]
+        cache_misses.labels(name).value = stats["misses"]
+        cache_evictions.labels(name).value = stats["evictions"]
+        cache_size.labels(name).value = stats["size"]
+    collectors.append(collect)
+
+
+def register_hashing(service):
+    def collect():
+        stats = service.stats()
+        hashing_pending.value = stats["pending"]
+        hashing_rejected.value = stats["rejected"]
+    collectors.append(collect)
+
+
+class _RequestStats:
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+# Статистика БД текущего HTTP-запроса. Контекст копируется в threadpool, поэтому
+# запросы из синхронных обработчиков попадают в тот же объект
+_request_stats: contextvars.ContextVar[Optional[_RequestStats]] = contextvars.ContextVar(
+    "metrics_request_stats", default=None
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+    db_queries.inc()
+    db_query_latency.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+
+class _TimedCheckout:
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: латентность и число запросов по шаблону маршрута, запросы в обработке, SQL на запрос."""
+
+    def __init__(self, app):
+        self.app = app
+        self._endpoint_paths: Dict[object, str] = {}
+
+    def _route_path(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        # Старые версии Starlette не кладут route в scope - ищем шаблон по endpoint
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._endpoint_paths.get(endpoint)
+        if path is None:
+            for candidate in scope["app"].routes:
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    path = self._endpoint_paths[endpoint] = candidate.path
+                    break
+            else:
+                return "unmatched"
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            _request_stats.reset(token)
+            method = scope["method"]
+            route = self._route_path(scope)
+            http_latency.labels(method, route).observe(elapsed)
+            http_requests.labels(method, route, status_code).inc()
+            db_queries_per_request.labels(route).observe(stats.queries)
+            db_time_per_request.labels(route).observe(stats.db_time)
@@ -0,0 +1,238 @@
+"""Миграции схемы поверх create_all.
+
+create_all создает только отсутствующие таблицы и не добавляет индексы в уже
+существующие, поэтому изменения схемы для рабочих БД описываются здесь.
+Примененные версии хранятся в таблице schema_migrations.
+
+Запуск отдельно от приложения: python -m app.migrations
+"""
+import contextlib
+import datetime
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from app import models, price_stats
+
+migrations_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migrations_metadata,
+    Column("version", String(100), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _concurrently(conn: Connection) -> str:
+    # Postgres строит и удаляет индекс без блокировки записи в таблицу. CONCURRENTLY нельзя
+    # выполнять в транзакции, поэтому такие миграции идут в autocommit
+    return " CONCURRENTLY" if conn.dialect.name == "postgresql" else ""
+
+
+# DDL в миграциях записан явно, а не берется из models: модели меняются, примененные миграции - нет
+def create_index(
+        conn: Connection, name: str, table: str, columns: List[str], where: Optional[str] = None, unique: bool = False
+):
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    ddl = f"CREATE {kind}{_concurrently(conn)} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    if where:
+        ddl += f" WHERE {where}"
+    conn.exec_driver_sql(ddl)
+
+
+def drop_index(conn: Connection, name: str):
+    conn.exec_driver_sql(f"DROP INDEX{_concurrently(conn)} IF EXISTS {name}")
+
+
+def add_column(conn: Connection, table: str, name: str, type_, default: Optional[str] = None):
+    # create_all уже создал колонку в новой БД - добавляем только в существующие таблицы.
+    # С default колонка NOT NULL; постоянное значение по умолчанию не переписывает таблицу (Postgres 11+)
+    if name not in {column["name"] for column in inspect(conn).get_columns(table)}:
+        ddl = f"ALTER TABLE {table} ADD COLUMN {name} {type_.compile(dialect=conn.dialect)}"
+        if default is not None:
+            ddl += f" NOT NULL DEFAULT {default}"
+        conn.exec_driver_sql(ddl)
+
+
+def _index_migration(name: str, table: str, columns: List[str]) -> Callable[[Connection], None]:
+    def migrate(conn: Connection):
+        create_index(conn, name, table, columns)
+    return migrate
+
+
+def _soft_delete(conn: Connection):
+    add_column(conn, "users", "deleted_at", DateTime())
+    add_column(conn, "advertisements", "deleted_at", DateTime())
+    # Горячие индексы становятся частичными: удаленные строки в них не попадают
+    create_index(conn, "ix_advertisements_live_created_at_id", "advertisements", ["created_at", "id"],
+                 "deleted_at IS NULL")
+    create_index(conn, "ix_advertisements_live_price", "advertisements", ["price"], "deleted_at IS NULL")
+    drop_index(conn, "ix_advertisements_created_at_id")
+    drop_index(conn, "ix_advertisements_price")
+    create_index(conn, "ix_advertisements_deleted_at", "advertisements", ["deleted_at"], "deleted_at IS NOT NULL")
+    create_index(conn, "ix_users_deleted_at", "users", ["deleted_at"], "deleted_at IS NOT NULL")
+
+    if conn.dialect.name == "postgresql":
+        foreign_keys = {fk["name"] for fk in inspect(conn).get_foreign_keys("advertisements")}
+        if "fk_advertisements_author_id_users" not in foreign_keys:
+            # NOT VALID: новые строки проверяются сразу, а существующие не сканируются под блокировкой
+            conn.exec_driver_sql(
+                "ALTER TABLE advertisements ADD CONSTRAINT fk_advertisements_author_id_users "
+                "FOREIGN KEY (author_id) REFERENCES users (id) NOT VALID"
+            )
+    # В SQLite внешний ключ добавить в существующую таблицу нельзя - он есть только в новых БД
+
+
+def _orphaned_advertisements(conn: Connection):
+    # Объявления уже удаленных пользователей помечаем удаленными - их уберет фоновая очистка
+    conn.execute(
+        update(models.Advertisement)
+        .where(models.Advertisement.deleted_at.is_(None))
+        .where(~select(models.User.id).where(models.User.id == models.Advertisement.author_id).exists())
+        .values(deleted_at=datetime.datetime.utcnow())
+    )
+    price_stats.rebuild(conn, models.Advertisement.deleted_at.is_(None))
+
+
+def _view_count(conn: Connection):
+    add_column(conn, "advertisements", "view_count", Integer(), "0")
+    create_index(conn, "ix_advertisements_live_view_count", "advertisements", ["view_count"], "deleted_at IS NULL")
+
+
+def _category(conn: Connection):
+    add_column(conn, "advertisements", "category", String(50), "'other'")
+    create_index(conn, "ix_advertisements_live_category_created_at_id", "advertisements",
+                 ["category", "created_at", "id"], "deleted_at IS NULL")
+
+
+USERS_COLUMNS = 'id, username, email, hashed_password, "group", is_active, created_at, deleted_at'
+
+
+def _rebuild_sqlite_users(conn: Connection):
+    # UNIQUE из CREATE TABLE в SQLite не удалить - таблица пересоздается без него
+    # (https://www.sqlite.org/lang_altertable.html#otheralter). Внешние ключи отключаются вне
+    # транзакции, иначе DROP TABLE users проверил бы ссылки объявлений
+    foreign_keys = conn.exec_driver_sql("PRAGMA foreign_keys").scalar()
+    conn.commit()
+    conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+    try:
+        conn.exec_driver_sql("DROP TABLE IF EXISTS users_new")
+        conn.exec_driver_sql(
+            "CREATE TABLE users_new (id UUID NOT NULL, username VARCHAR(50) NOT NULL, email VARCHAR(100) NOT NULL, "
+            "hashed_password VARCHAR(200) NOT NULL, \"group\" VARCHAR(20) NOT NULL, is_active BOOLEAN NOT NULL, "
+            "created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, deleted_at DATETIME, PRIMARY KEY (id))"
+        )
+        conn.exec_driver_sql(f"INSERT INTO users_new ({USERS_COLUMNS}) SELECT {USERS_COLUMNS} FROM users")
+        conn.exec_driver_sql("DROP TABLE users")
+        conn.exec_driver_sql("ALTER TABLE users_new RENAME TO users")
+        create_index(conn, "ix_users_deleted_at", "users", ["deleted_at"], "deleted_at IS NOT NULL")
+        create_index(conn, "uq_users_live_username", "users", ["username"], "deleted_at IS NULL", unique=True)
+        conn.commit()
+    finally:
+        conn.exec_driver_sql(f"PRAGMA foreign_keys={'ON' if foreign_keys else 'OFF'}")
+
+
+def _users_live_unique(conn: Connection):
+    # Мягко удаленный пользователь до фоновой очистки занимал username и email: уникальность
+    # теперь только среди живых строк. Новые индексы создаются до удаления старых ограничений
+    create_index(conn, "uq_users_live_username", "users", ["username"], "deleted_at IS NULL", unique=True)
+    drop_index(conn, "ix_users_username")
+    email_constraints = [
+        constraint["name"] for constraint in inspect(conn).get_unique_constraints("users")
+        if constraint["column_names"] == ["email"]
+    ]
+    if email_constraints and conn.dialect.name != "postgresql":
+        _rebuild_sqlite_users(conn)
+    create_index(conn, "uq_users_live_email", "users", ["email"], "deleted_at IS NULL", unique=True)
+    if conn.dialect.name == "postgresql":
+        for name in email_constraints:
+            conn.exec_driver_sql(f"ALTER TABLE users DROP CONSTRAINT {name}")
+
+
+# (версия, функция, выполняется ли в autocommit ради CONCURRENTLY) в порядке применения.
+# Уже примененные миграции не меняем - только добавляем новые
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None], bool]] = [
+    ("0001_advertisements_created_at_id",
+     _index_migration("ix_advertisements_created_at_id", "advertisements", ["created_at", "id"]), True),
+    ("0002_advertisements_author_id_created_at",
+     _index_migration("ix_advertisements_author_id_created_at", "advertisements", ["author_id", "created_at", "id"]),
+     True),
+    ("0003_advertisements_price", _index_migration("ix_advertisements_price", "advertisements", ["price"]), True),
+    # Таблицу создает create_all, миграция заполняет сводку по уже существующим объявлениям
+    ("0004_price_buckets", price_stats.rebuild, False),
+    ("0005_soft_delete", _soft_delete, True),
+    ("0006_orphaned_advertisements", _orphaned_advertisements, False),
+    ("0007_view_count", _view_count, True),
+    ("0008_category", _category, True),
+    ("0009_users_live_unique", _users_live_unique, True),
+]
+
+
+# Ключ pg_advisory_lock для изменений схемы
+SCHEMA_LOCK_KEY = 0x61647673
+
+
+@contextlib.contextmanager
+def schema_lock(engine: Engine):
+    """Межпроцессная блокировка на время создания схемы и миграций.
+
+    Воркеры стартуют одновременно: DDL выполняет тот, кто взял блокировку,
+    остальные дожидаются его и видят уже готовую схему.
+    """
+    if engine.dialect.name == "postgresql":
+        # autocommit: сессионная блокировка без открытой транзакции, иначе CREATE INDEX CONCURRENTLY ждал бы ее
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        return
+
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or not database or database == ":memory:":
+        yield
+        return
+    import fcntl
+
+    with open(f"{database}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def applied_versions(engine: Engine) -> set:
+    with engine.begin() as conn:
+        migrations_metadata.create_all(conn)
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def run(engine: Engine) -> List[str]:
+    """Применяет недостающие миграции и возвращает их версии."""
+    applied = applied_versions(engine)
+    done = []
+    for version, migrate, autocommit in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.connect() as conn:
+            if autocommit and conn.dialect.name == "postgresql":
+                conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, applied_at=datetime.datetime.utcnow()
+            ))
+            conn.commit()
+        done.append(version)
+    return done
+
+
+if __name__ == "__main__":
+    from app import sharding
+
+    # Основная БД и шарды объявлений (app/sharding.py)
+    for shard, shard_engine in sharding.engines.items():
+        with schema_lock(shard_engine):
+            done = run(shard_engine)
+        for version in done:
+            print(f"{shard}: applied {version}")
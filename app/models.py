@@ -1,21 +1,54 @@
 import datetime
 import uuid
-from sqlalchemy import DateTime, Float, String, Text, Boolean, func
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from typing import List, Optional
+from sqlalchemy import JSON, UUID, DateTime, Float, ForeignKey, Integer, String, Text, Boolean, Index, func, text
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from app.database import Base
 
+# В SQLite server_default (CURRENT_TIMESTAMP) хранит время без микросекунд,
+# поэтому и значения из Python храним в том же формате - иначе строки сравниваются некорректно
+Timestamp = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
+
+LIVE = text("deleted_at IS NULL")
+DELETED = text("deleted_at IS NOT NULL")
+PENDING = text("failed_at IS NULL")
+# Категория - ключ шардирования (app/sharding.py); объявления без категории и созданные до нее - "other"
+DEFAULT_CATEGORY = "other"
+
 
 class User(Base):
     __tablename__ = "users"
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    username: Mapped[str] = mapped_column(String(50), unique=True, nullable=False, index=True)
-    email: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
+    # Уникальность username и email - частичными индексами среди живых пользователей (__table_args__)
+    username: Mapped[str] = mapped_column(String(50), nullable=False)
+    email: Mapped[str] = mapped_column(String(100), nullable=False)
     hashed_password: Mapped[str] = mapped_column(String(200), nullable=False)
     group: Mapped[str] = mapped_column(String(20), default="user", nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     created_at: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=func.now())
+    # Мягкое удаление: строку и объявления пользователя удаляет фоновая очистка (app/purge.py)
+    deleted_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime, nullable=True)
+
+    # lazy="raise": объявления подгружаются только явно (selectinload), без скрытых запросов
+    advertisements: Mapped[List["Advertisement"]] = relationship(
+        back_populates="author", lazy="raise", passive_deletes=True
+    )
+
+    # created_at возвращается из INSERT ... RETURNING, без отдельного refresh
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        # Очередь фоновой очистки; живые пользователи в индекс не попадают
+        Index("ix_users_deleted_at", "deleted_at", sqlite_where=DELETED, postgresql_where=DELETED),
+        # Удаленный пользователь до очистки не занимает username и email - их можно зарегистрировать снова
+        Index("uq_users_live_username", "username", unique=True, sqlite_where=LIVE, postgresql_where=LIVE),
+        Index("uq_users_live_email", "email", unique=True, sqlite_where=LIVE, postgresql_where=LIVE),
+    )
 
 
 class Advertisement(Base):
@@ -25,5 +58,93 @@ class Advertisement(Base):
     title: Mapped[str] = mapped_column(String(200), nullable=False)
     description: Mapped[str] = mapped_column(Text, nullable=True)
     price: Mapped[float] = mapped_column(Float, nullable=False)
-    author_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
-    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=func.now())
\ No newline at end of file
+    category: Mapped[str] = mapped_column(
+        String(50), nullable=False, default=DEFAULT_CATEGORY, server_default=DEFAULT_CATEGORY
+    )
+    author_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("users.id", name="fk_advertisements_author_id_users"), nullable=False
+    )
+    created_at: Mapped[datetime.datetime] = mapped_column(Timestamp, server_default=func.now())
+    deleted_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime, nullable=True)
+    # Пишется пачками из буфера просмотров (app/views.py), не на каждый GET
+    view_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+
+    author: Mapped[User] = relationship(back_populates="advertisements", lazy="raise")
+
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        # Горячие запросы читают только живые объявления (deleted_at IS NULL) - частичные индексы
+        # не содержат удаленных строк и не растут от них.
+        # Сортировка поиска и keyset-пагинация по (created_at, id)
+        Index("ix_advertisements_live_created_at_id", "created_at", "id", sqlite_where=LIVE, postgresql_where=LIVE),
+        # Поиск в категории: в шарде обычно несколько категорий, выдача - сразу в порядке (created_at, id)
+        Index(
+            "ix_advertisements_live_category_created_at_id", "category", "created_at", "id",
+            sqlite_where=LIVE, postgresql_where=LIVE
+        ),
+        # Фильтры min_price/max_price и min/max для статистики цен
+        Index("ix_advertisements_live_price", "price", sqlite_where=LIVE, postgresql_where=LIVE),
+        # Объявления автора и экспорт: поиск по author_id сразу в порядке (created_at, id), без сортировки.
+        # Полный, а не частичный: по нему же проверяется внешний ключ и очистка ищет объявления удаленных
+        Index("ix_advertisements_author_id_created_at", "author_id", "created_at", "id"),
+        # Очередь фоновой очистки
+        Index("ix_advertisements_deleted_at", "deleted_at", sqlite_where=DELETED, postgresql_where=DELETED),
+        # Кандидаты рейтинга популярных читаются с конца индекса
+        Index("ix_advertisements_live_view_count", "view_count", sqlite_where=LIVE, postgresql_where=LIVE),
+    )
+    # Новые индексы для существующих БД добавляются миграциями (app/migrations.py)
+
+
+class PriceBucket(Base):
+    # Сводка цен по корзинам гистограммы (app/price_stats.py), обновляется в той же транзакции, что и объявления
+    __tablename__ = "price_buckets"
+
+    bucket: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+
+
+class RevokedToken(Base):
+    # Отозванные токены (logout, использованный refresh); в памяти воркеров - блум-фильтр по jti (app/tokens.py)
+    __tablename__ = "revoked_tokens"
+
+    jti: Mapped[str] = mapped_column(String(32), primary_key=True)
+    user_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True)
+    # После истечения токен отклоняется по exp, запись удаляется при перестроении фильтра
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, index=True)
+    # Воркеры подтягивают новые отзывы по revoked_at
+    revoked_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+class CacheInvalidation(Base):
+    # Сброс кешей для других воркеров gunicorn (app/cache_sync.py); строки живут несколько минут
+    __tablename__ = "cache_invalidations"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(20), nullable=False)
+    # id объявления или пользователя; без id - сброс всех закешированных поисков
+    key: Mapped[Optional[str]] = mapped_column(String(36), nullable=True)
+    # Воркер-отправитель: свои инвалидации он уже применил
+    origin: Mapped[str] = mapped_column(String(32), nullable=False)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+class OutboxEvent(Base):
+    # Отложенная работа после записи (app/outbox.py): событие пишется в той же транзакции, что и строка,
+    # и удаляется после успешной обработки
+    __tablename__ = "outbox"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Не раньше этого времени событие можно взять в обработку: пауза перед повтором или аренда обработчиком
+    available_at: Mapped[datetime.datetime] = mapped_column(DateTime, nullable=False)
+    # Попытки исчерпаны - событие остается в таблице для разбора
+    failed_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    __table_args__ = (
+        # Очередь: только необработанные события
+        Index("ix_outbox_pending_available_at", "available_at", "id", sqlite_where=PENDING, postgresql_where=PENDING),
+    )
@@ -0,0 +1,250 @@
+import asyncio
+import datetime
+import logging
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
+from app import metrics, models, sharding
+from app.config import settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Работа, которую запускает запись, но которой не место в запросе (индексация и т.п.).
+# crud пишет событие в таблицу outbox в той же транзакции, что и саму строку: событие
+# не теряется при падении процесса и не появляется, если транзакция откатилась.
+# Фоновая задача (lifespan) берет события пачками: UPDATE ... RETURNING сдвигает available_at
+# на срок аренды, поэтому воркеры gunicorn не берут одну пачку дважды, а пачку упавшего
+# процесса после аренды подхватит другой. Обработчик получает все события своего вида из
+# пачки сразу и должен быть идемпотентным: после сбоя событие обрабатывается повторно.
+# Неудача - повтор с экспоненциальной паузой, после outbox_max_attempts событие помечается failed_at.
+# У каждого шарда объявлений (app/sharding.py) своя таблица outbox: событие пишется в транзакции
+# шарда, и обработчик получает сессию того же шарда.
+
+# Вид события -> (обработчик, действие после commit). Обработчик получает сессию и список payload
+# и пишет в ту же транзакцию, в которой события удаляются из outbox: результат и отметка
+# об обработке фиксируются вместе
+handlers: Dict[str, Tuple[Callable[[Session, List[dict]], None], Optional[Callable[[], None]]]] = {}
+
+
+def handler(kind: str, after_commit: Optional[Callable[[], None]] = None):
+    def register(fn):
+        handlers[kind] = (fn, after_commit)
+        return fn
+    return register
+
+
+def enqueue(db: Session, kind: str, payload: dict):
+    """Добавляет событие в текущую транзакцию db; после commit вызовите wake()."""
+    db.execute(insert(models.OutboxEvent).values(
+        kind=kind, payload=payload, attempts=0, available_at=datetime.datetime.utcnow()
+    ))
+
+
+def _pending(db: Session) -> int:
+    Outbox = models.OutboxEvent
+    return db.execute(select(func.count()).select_from(Outbox).where(Outbox.failed_at.is_(None))).scalar_one()
+
+
+def pending() -> int:
+    """Необработанные события во всех шардах, включая взятые в обработку и ожидающие повтора."""
+    with SessionLocal() as db:
+        return sum(sharding.fan_out(db, _pending))
+
+
+def claim(batch_size: int, lease: float, session_factory: sessionmaker = SessionLocal) -> list:
+    Outbox = models.OutboxEvent
+    now = datetime.datetime.utcnow()
+    due = (
+        select(Outbox.id)
+        .where(Outbox.failed_at.is_(None), Outbox.available_at <= now)
+        .order_by(Outbox.available_at, Outbox.id)
+        .limit(batch_size)
+    )
+    with session_factory() as db:
+        # Повторная проверка available_at во внешнем WHERE: в Postgres параллельный UPDATE
+        # перепроверяет ее по новой версии строки и пропускает уже взятые события
+        rows = db.execute(
+            update(Outbox)
+            .where(Outbox.id.in_(due.scalar_subquery()), Outbox.available_at <= now)
+            .values(available_at=now + datetime.timedelta(seconds=lease), attempts=Outbox.attempts + 1)
+            .returning(Outbox.id, Outbox.kind, Outbox.payload, Outbox.attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+    return sorted(rows, key=lambda row: row.id)
+
+
+def process(events, max_attempts: int, retry_delay: float, session_factory: sessionmaker = SessionLocal) -> int:
+    """Выполняет обработчики взятой пачки: готовые события удаляются, неудачные откладываются на повтор."""
+    Outbox = models.OutboxEvent
+    by_kind = defaultdict(list)
+    for event in events:
+        by_kind[event.kind].append(event)
+    done, failed = 0, []
+    for kind, kind_events in by_kind.items():
+        try:
+            if kind not in handlers:
+                raise LookupError(f"No outbox handler for {kind!r}")
+            fn, after_commit = handlers[kind]
+            with session_factory() as db:
+                fn(db, [event.payload for event in kind_events])
+                db.execute(delete(Outbox).where(Outbox.id.in_([event.id for event in kind_events])))
+                db.commit()
+        except Exception as e:
+            logger.exception("Outbox handler %s failed", kind)
+            failed.extend((event, repr(e)) for event in kind_events)
+            continue
+        done += len(kind_events)
+        metrics.outbox_events.labels(kind, "done").inc(len(kind_events))
+        if after_commit is not None:
+            after_commit()
+
+    if failed:
+        now = datetime.datetime.utcnow()
+        with session_factory() as db:
+            for event, error in failed:
+                if event.attempts >= max_attempts:
+                    values = {"failed_at": now}
+                    metrics.outbox_events.labels(event.kind, "failed").inc()
+                else:
+                    delay = retry_delay * 2 ** (event.attempts - 1)
+                    values = {"available_at": now + datetime.timedelta(seconds=delay)}
+                    metrics.outbox_events.labels(event.kind, "retry").inc()
+                db.execute(update(Outbox).where(Outbox.id == event.id).values(last_error=error[:1000], **values))
+            db.commit()
+    return done
+
+
+def drain(batch_size: Optional[int] = None, timeout: Optional[float] = None) -> int:
+    """Синхронно обрабатывает все готовые события (остановка приложения, сидер бенчмарков)."""
+    batch_size = batch_size or settings.outbox_batch_size
+    deadline = None if timeout is None else time.monotonic() + timeout
+    processed = 0
+    for session_factory in sharding.sessionmakers.values():
+        while deadline is None or time.monotonic() < deadline:
+            events = claim(batch_size, settings.outbox_lease_seconds, session_factory)
+            if not events:
+                break
+            processed += process(events, settings.outbox_max_attempts, settings.outbox_retry_delay, session_factory)
+    return processed
+
+
+class OutboxWorker:
+    def __init__(
+            self, concurrency: int, batch_size: int, poll_interval: float, batch_delay: float,
+            max_attempts: int, retry_delay: float, lease: float, drain_timeout: float
+    ):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.batch_delay = batch_delay
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.drain_timeout = drain_timeout
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Не отменяем задачу, а даем ей дообработать накопленное: запросы к этому моменту завершены.
+        # Не успели за drain_timeout - события остаются в таблице до следующего запуска
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Outbox drain did not finish in %s s", self.drain_timeout)
+        self._task = None
+        self._loop = None
+
+    def wake(self):
+        # Вызывается из crud (в том числе из потоков threadpool) после commit с новыми событиями
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _process(self, events, slots: asyncio.Semaphore, session_factory: sessionmaker):
+        try:
+            await run_in_threadpool(process, events, self.max_attempts, self.retry_delay, session_factory)
+        except Exception:
+            # Не удалось записать результат - события вернутся в очередь по истечении аренды
+            logger.exception("Outbox batch failed")
+        finally:
+            slots.release()
+
+    async def _drain_due(self):
+        # Шарды обрабатываются параллельно, каждый - своей очередью пачек; сбой одного не останавливает другие
+        results = await asyncio.gather(
+            *(self._drain_shard(factory) for factory in sharding.sessionmakers.values()), return_exceptions=True
+        )
+        for error in results:
+            if isinstance(error, Exception):
+                logger.error("Outbox poll failed", exc_info=error)
+
+    async def _drain_shard(self, session_factory: sessionmaker):
+        # До concurrency пачек одновременно: следующая пачка берется, пока обрабатываются предыдущие
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        try:
+            while True:
+                await slots.acquire()
+                try:
+                    events = await run_in_threadpool(claim, self.batch_size, self.lease, session_factory)
+                except BaseException:
+                    slots.release()
+                    raise
+                if not events:
+                    slots.release()
+                    break
+                task = asyncio.create_task(self._process(events, slots, session_factory))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            # Последний проход начинается уже после stop(): в него попадает все, что закоммичено до остановки
+            stopping = self._stopping
+            try:
+                await self._drain_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox poll failed")
+            if stopping:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                # Даем событиям соседних запросов попасть в ту же пачку: меньше транзакций на событие
+                await asyncio.sleep(self.batch_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+worker = OutboxWorker(
+    settings.outbox_concurrency,
+    settings.outbox_batch_size,
+    settings.outbox_poll_interval,
+    settings.outbox_batch_delay,
+    settings.outbox_max_attempts,
+    settings.outbox_retry_delay,
+    settings.outbox_lease_seconds,
+    settings.outbox_drain_timeout,
+)
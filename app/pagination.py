@@ -0,0 +1,28 @@
+import base64
+import datetime
+import json
+import uuid
+from typing import Optional, Tuple
+
+
+# Курсор - непрозрачная для клиента строка с ключом последней выданной записи (created_at, id)
+def encode_cursor(created_at: datetime.datetime, item_id: uuid.UUID) -> str:
+    raw = json.dumps([created_at.isoformat(), item_id.hex], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, uuid.UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(item_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def next_cursor(items: list, limit: int) -> Optional[str]:
+    # Запрашиваем limit + 1 строк: лишняя строка означает, что есть следующая страница
+    if len(items) <= limit:
+        return None
+    last = items[limit - 1]
+    return encode_cursor(last.created_at, last.id)
@@ -0,0 +1,178 @@
+import bisect
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from app import models
+
+# Статистика цен для GET /advertisement/stats.
+# Гистограмма строится по фиксированным границам: корзина i - [EDGES[i-1], EDGES[i]),
+# первая - цены ниже EDGES[0], последняя - от EDGES[-1] и выше.
+# Без фильтров ответ собирается из сводки price_buckets, которую поддерживает crud,
+# и min/max по индексу цены; с фильтрами - одним проходом GROUP BY по отобранным строкам.
+# Границы менять только вместе с миграцией, пересчитывающей сводку.
+BUCKET_EDGES = (0, 10, 50, 100, 500, 1_000, 5_000, 10_000, 50_000, 100_000)
+BUCKETS = len(BUCKET_EDGES) + 1
+PERCENTILES = (("p25", 0.25), ("p50", 0.5), ("p75", 0.75), ("p90", 0.9), ("p99", 0.99))
+
+_table = models.PriceBucket.__table__
+_increment = update(_table).where(_table.c.bucket == bindparam("b_bucket")).values(
+    count=_table.c.count + bindparam("b_count"),
+    total=_table.c.total + bindparam("b_total"),
+)
+
+
+def bucket_of(price: float) -> int:
+    return bisect.bisect_right(BUCKET_EDGES, price)
+
+
+def bucket_expression(column):
+    return case(*[(column < edge, index) for index, edge in enumerate(BUCKET_EDGES)], else_=len(BUCKET_EDGES))
+
+
+def _bounds(bucket: int):
+    lower = BUCKET_EDGES[bucket - 1] if bucket > 0 else None
+    upper = BUCKET_EDGES[bucket] if bucket < len(BUCKET_EDGES) else None
+    return lower, upper
+
+
+# Поддержка сводки: изменения копятся по корзинам и пишутся одним executemany в транзакции crud
+def record(db: Session, added: Iterable[float] = (), removed: Iterable[float] = ()):
+    changes: Dict[int, List[float]] = {}
+    for sign, prices in ((1, added), (-1, removed)):
+        for price in prices:
+            change = changes.setdefault(bucket_of(price), [0, 0.0])
+            change[0] += sign
+            change[1] += sign * price
+    params = [
+        {"b_bucket": bucket, "b_count": count, "b_total": total}
+        for bucket, (count, total) in changes.items()
+        if count or total
+    ]
+    if params:
+        db.execute(_increment, params)
+
+
+def rebuild(conn, where=None):
+    """Пересчитывает сводку по таблице объявлений (миграции и ручное восстановление).
+
+    where - условие на живые объявления; в миграции 0004 колонки deleted_at еще нет.
+    """
+    price = models.Advertisement.price
+    bucket = bucket_expression(price)
+    query = select(bucket.label("bucket"), func.count().label("count"), func.sum(price).label("total"))
+    if where is not None:
+        query = query.where(where)
+    totals = {row.bucket: row for row in conn.execute(query.group_by(bucket))}
+    conn.execute(delete(_table))
+    conn.execute(insert(_table), [
+        {
+            "bucket": bucket,
+            "count": totals[bucket].count if bucket in totals else 0,
+            "total": totals[bucket].total if bucket in totals else 0.0,
+        }
+        for bucket in range(BUCKETS)
+    ])
+
+
+def _percentile(buckets: List[dict], count: int, q: float) -> float:
+    # Линейная интерполяция внутри корзины: точность ограничена шириной корзины
+    target = q * count
+    seen = 0
+    for bucket in buckets:
+        if not bucket["count"]:
+            continue
+        if seen + bucket["count"] >= target:
+            fraction = (target - seen) / bucket["count"]
+            return bucket["low"] + (bucket["high"] - bucket["low"]) * fraction
+        seen += bucket["count"]
+    return buckets[-1]["high"]
+
+
+def _result(counts: Dict[int, int], total: float, minimum: Optional[float], maximum: Optional[float]) -> dict:
+    count = sum(counts.values())
+    buckets = []
+    for bucket in range(BUCKETS):
+        lower, upper = _bounds(bucket)
+        buckets.append({
+            "lower": lower,
+            "upper": upper,
+            "count": counts.get(bucket, 0),
+            # Интерполяция - между краями корзины, суженными до общих min/max: одно правило
+            # для сводки и для фильтра, одни и те же строки дают одни и те же перцентили
+            "low": lower if lower is not None else minimum,
+            "high": upper if upper is not None else maximum,
+        })
+
+    percentiles = {}
+    if count:
+        filled = [bucket for bucket in buckets if bucket["count"]]
+        for bucket in filled:
+            bucket["low"] = max(bucket["low"], minimum)
+            bucket["high"] = min(bucket["high"], maximum)
+        percentiles = {name: _percentile(filled, count, q) for name, q in PERCENTILES}
+
+    return {
+        "count": count,
+        "min": minimum,
+        "max": maximum,
+        "avg": total / count if count else None,
+        "percentiles": percentiles,
+        "buckets": [{"lower": b["lower"], "upper": b["upper"], "count": b["count"]} for b in buckets],
+    }
+
+
+def summary_parts(db: Session):
+    # Постоянное время: BUCKETS строк сводки + min/max по индексу ix_advertisements_live_price.
+    # min и max в отдельных подзапросах - так SQLite читает по одной строке с краев индекса
+    price = models.Advertisement.price
+    rows = db.execute(select(_table.c.bucket, _table.c.count, _table.c.total)).all()
+    live = models.Advertisement.deleted_at.is_(None)
+    minimum, maximum = db.execute(select(
+        select(func.min(price)).where(live).scalar_subquery(),
+        select(func.max(price)).where(live).scalar_subquery(),
+    )).one()
+    return rows, minimum, maximum
+
+
+def merge_summaries(parts) -> dict:
+    """Сводка по нескольким БД (шарды объявлений): сумма корзин, крайние min/max."""
+    counts: Dict[int, int] = {}
+    total = 0.0
+    minimum = maximum = None
+    for rows, shard_min, shard_max in parts:
+        for row in rows:
+            if row.count:
+                counts[row.bucket] = counts.get(row.bucket, 0) + row.count
+            total += row.total
+        if shard_min is not None:
+            minimum = shard_min if minimum is None else min(minimum, shard_min)
+            maximum = shard_max if maximum is None else max(maximum, shard_max)
+    return _result(counts, total, minimum, maximum)
+
+
+def aggregate_rows(db: Session, query) -> list:
+    """Корзины отфильтрованного запроса (select из advertisements): один проход GROUP BY."""
+    price = models.Advertisement.price
+    bucket = bucket_expression(price)
+    return db.execute(
+        query.with_only_columns(
+            bucket.label("bucket"),
+            func.count().label("count"),
+            func.sum(price).label("total"),
+            func.min(price).label("low"),
+            func.max(price).label("high"),
+        ).group_by(bucket)
+    ).all()
+
+
+def merge_aggregates(results) -> dict:
+    counts: Dict[int, int] = {}
+    total = 0.0
+    minimum = maximum = None
+    for rows in results:
+        for row in rows:
+            counts[row.bucket] = counts.get(row.bucket, 0) + row.count
+            total += row.total
+            minimum = row.low if minimum is None else min(minimum, row.low)
+            maximum = row.high if maximum is None else max(maximum, row.high)
+    return _result(counts, total, minimum, maximum)
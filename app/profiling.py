@@ -0,0 +1,283 @@
+import asyncio
+import collections
+import contextvars
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import cache
+from app.config import settings
+
+# Профилирование отдельных запросов (включается PROFILING_ENABLED=true).
+# Профилируется запрос администратора с заголовком settings.profile_header или случайная
+# доля settings.profile_sample_rate всех запросов. Пока запрос выполняется, отдельный поток
+# снимает стеки каждые profile_interval_ms: поток event loop (async-обработчики, middleware)
+# и потоки threadpool, в стеке которых есть код app (sync-обработчики, crud, argon2 в auth),
+# а пока корутина запроса приостановлена - ее цепочка await (на чем ждет async-обработчик).
+# Стеки потоков процесса общие, поэтому при параллельных запросах в профиль попадают и их
+# семплы; SQL-запросы, наоборот, привязаны к запросу через contextvar.
+# Последние profile_buffer_size профилей хранятся в памяти воркера (app/routers/profiling.py
+# отдает их администраторам в форматах speedscope и collapsed stacks).
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+_MAX_DEPTH = 256
+_ids = itertools.count(1)
+
+
+class Profile:
+    def __init__(self, method: str, path: str, interval: float, reason: str):
+        self.id = f"{os.getpid()}-{next(_ids)}"
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.route = None
+        self.status = None
+        self.interval = interval
+        self.started_at = time.time()
+        self.perf_started = time.perf_counter()
+        self.duration = 0.0
+        # Стек (кортеж кадров от корня к листу) -> число семплов, отдельно по потокам
+        self.samples: Dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+        self.sql: List[Tuple[float, float, str]] = []
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": sum(sum(counter.values()) for counter in self.samples.values()),
+            "sql_queries": len(self.sql),
+            "sql_ms": round(sum(duration for _, duration, _ in self.sql) * 1000, 2),
+        }
+
+    def details(self) -> dict:
+        return {
+            **self.summary(),
+            "interval_ms": self.interval * 1000,
+            "sql": [
+                {"offset_ms": round(offset * 1000, 3), "duration_ms": round(duration * 1000, 3), "statement": statement}
+                for offset, duration, statement in self.sql
+            ],
+        }
+
+
+profiles: collections.deque = collections.deque(maxlen=settings.profile_buffer_size)
+
+
+def get(profile_id: str) -> Optional[Profile]:
+    for profile in list(profiles):
+        if profile.id == profile_id:
+            return profile
+    return None
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> Tuple[Tuple[str, ...], bool]:
+    names = []
+    in_app = False
+    while frame is not None and len(names) < _MAX_DEPTH:
+        names.append(_frame_name(frame))
+        in_app = in_app or frame.f_code.co_filename.startswith(_APP_DIR)
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names), in_app
+
+
+def _await_stack(coroutine) -> Tuple[str, ...]:
+    # Цепочка await приостановленной корутины: где именно ждет запрос (argon2 в пуле процессов, драйвер БД)
+    names = []
+    while coroutine is not None and len(names) < _MAX_DEPTH:
+        frame = getattr(coroutine, "cr_frame", None) or getattr(coroutine, "gi_frame", None)
+        if frame is None:
+            break
+        names.append(_frame_name(frame))
+        coroutine = getattr(coroutine, "cr_await", None) or getattr(coroutine, "gi_yieldfrom", None)
+    return tuple(names)
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, profile: Profile, loop_thread: int, task: Optional[asyncio.Task]):
+        super().__init__(name=f"profile-{profile.id}", daemon=True)
+        self.profile = profile
+        self.loop_thread = loop_thread
+        self.coroutine = task.get_coro() if task is not None else None
+        self.stopped = threading.Event()
+
+    def run(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        while not self.stopped.wait(self.profile.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack, in_app = _stack(frame)
+                if ident != self.loop_thread and not in_app:
+                    # Простаивающие потоки threadpool и служебные потоки
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                thread = "event loop" if ident == self.loop_thread else names.get(ident, str(ident))
+                self.profile.samples[thread][stack] += 1
+            if self.coroutine is not None and not getattr(self.coroutine, "cr_running", True):
+                self.profile.samples["request task (suspended)"][_await_stack(self.coroutine)] += 1
+
+
+_active_profile: contextvars.ContextVar[Optional[Profile]] = contextvars.ContextVar("active_profile", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_profile.get() is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active_profile.get()
+    if profile is not None and conn.info.get("profile_query_start"):
+        started = conn.info["profile_query_start"].pop()
+        finished = time.perf_counter()
+        profile.sql.append((started - profile.perf_started, finished - started, statement))
+
+
+def collapsed(profile: Profile) -> str:
+    """Формат collapsed stacks (flamegraph.pl, speedscope): "кадр;кадр;кадр число" на строку."""
+    lines = []
+    for thread, counter in profile.samples.items():
+        for stack, count in counter.items():
+            lines.append(";".join((f"[{thread}]",) + stack) + f" {count}")
+    return "\n".join(lines) + "\n"
+
+
+def speedscope(profile: Profile) -> dict:
+    """Файл speedscope: по одному sampled-профилю на поток, вес семпла - интервал в миллисекундах."""
+    frames, index = [], {}
+    profiles_out = []
+    weight = profile.interval * 1000
+    for thread, counter in profile.samples.items():
+        samples, weights = [], []
+        for stack, count in counter.items():
+            for name in stack:
+                if name not in index:
+                    index[name] = len(frames)
+                    function, _, location = name.rpartition(" (")
+                    file, _, line = location.rstrip(")").rpartition(":")
+                    frames.append({"name": function, "file": file, "line": int(line)})
+            samples.append([index[name] for name in stack])
+            weights.append(count * weight)
+        profiles_out.append({
+            "type": "sampled",
+            "name": f"{profile.method} {profile.path} [{thread}]",
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        })
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": f"{profile.method} {profile.path} ({profile.id})",
+        "exporter": "app.profiling",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": profiles_out,
+    }
+
+
+def _bearer_token(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token if scheme.lower() == "bearer" and token else None
+    return None
+
+
+def _load_principal(user_id: uuid.UUID):
+    from app.database import SessionLocal
+    from app.dependencies import load_principal
+
+    with SessionLocal() as db:
+        return load_principal(db, user_id)
+
+
+async def _is_admin(scope) -> bool:
+    from app.dependencies import decode_token
+
+    token = _bearer_token(scope)
+    # Без проверки отзыва, как в rate_limit: эндпоинты профилей все равно закрыты require_admin
+    payload = decode_token(token, check_revoked=False) if token else None
+    try:
+        user_id = uuid.UUID(payload["sub"])
+    except (TypeError, KeyError, ValueError):
+        return False
+    principal = cache.principal_cache.get(user_id)
+    if principal is None:
+        principal = await run_in_threadpool(_load_principal, user_id)
+    return principal is not None and principal.is_active and principal.group == "admin"
+
+
+class ProfilingMiddleware:
+    """ASGI-middleware: профилирует запрос по заголовку администратора или по доле запросов."""
+
+    def __init__(self, app, sample_rate: Optional[float] = None):
+        self.app = app
+        self.sample_rate = settings.profile_sample_rate if sample_rate is None else sample_rate
+        self.header = settings.profile_header.lower().encode("latin-1")
+
+    async def _reason(self, scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == self.header and value not in (b"", b"0"):
+                # Заголовок чужого пользователя молча игнорируем: не раскрываем, что профилирование включено
+                if await _is_admin(scope):
+                    return "header"
+                break
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        reason = await self._reason(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], settings.profile_interval_ms / 1000, reason)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]}
+            await send(message)
+
+        sampler = _Sampler(profile, threading.get_ident(), asyncio.current_task())
+        token = _active_profile.set(profile)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration = time.perf_counter() - profile.perf_started
+            sampler.stopped.set()
+            sampler.join()
+            _active_profile.reset(token)
+            route = scope.get("route")
+            profile.route = route.path if route is not None else None
+            profiles.append(profile)
@@ -0,0 +1,164 @@
+import asyncio
+import datetime
+import logging
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+from app import models, price_stats, response_cache, search, sharding
+from app.config import settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Не больше id удаленных пользователей в одном IN при каскаде в шардах
+DELETED_AUTHORS_CHUNK = 500
+
+# Фоновая очистка мягко удаленных данных. Каждый шаг - короткая транзакция на пачку
+# из settings.purge_batch_size строк, между пачками - пауза, чтобы не держать запись:
+#   1. объявления удаленных пользователей помечаются удаленными (пропадают из выдачи и статистики)
+#   2. объявления, удаленные раньше срока хранения, удаляются физически вместе с записями FTS
+#   3. удаленные раньше срока пользователи без объявлений удаляются физически
+# Запросы идут по частичным индексам ix_*_deleted_at и по author_id, без сканов таблиц.
+# Шаги безопасны при запуске в нескольких воркерах: каждая строка меняется условным
+# UPDATE/DELETE, а сводка цен правится только по строкам из RETURNING.
+# Шаги 1-2 выполняются в каждом шарде объявлений (app/sharding.py); таблицы users в шардах нет,
+# поэтому удаленные пользователи передаются туда списком id, а шаг 3 проверяет объявления во всех шардах
+
+
+def cascade_user_advertisements(db: Session, batch_size: int, deleted_authors=None) -> int:
+    Advertisement = models.Advertisement
+    if deleted_authors is None:
+        deleted_authors = select(models.User.id).where(models.User.deleted_at.is_not(None))
+    batch = (
+        select(Advertisement.id)
+        .where(Advertisement.author_id.in_(deleted_authors), Advertisement.deleted_at.is_(None))
+        .limit(batch_size)
+    )
+    rows = db.execute(
+        update(Advertisement)
+        .where(Advertisement.id.in_(batch), Advertisement.deleted_at.is_(None))
+        .values(deleted_at=datetime.datetime.utcnow())
+        .returning(Advertisement.id, Advertisement.price)
+        .execution_options(synchronize_session=False)
+    ).all()
+    price_stats.record(db, removed=[row.price for row in rows])
+    db.commit()
+    for row in rows:
+        response_cache.invalidate_advertisement(row.id)
+    return len(rows)
+
+
+def purge_advertisements(db: Session, batch_size: int, cutoff: datetime.datetime) -> int:
+    Advertisement = models.Advertisement
+    batch = select(Advertisement.id).where(Advertisement.deleted_at < cutoff).limit(batch_size)
+    ids = db.execute(
+        delete(Advertisement)
+        .where(Advertisement.id.in_(batch))
+        .returning(Advertisement.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    search.remove_advertisements(db, ids)
+    db.commit()
+    return len(ids)
+
+
+def _authors_with_advertisements(db: Session, author_ids) -> set:
+    Advertisement = models.Advertisement
+    return set(db.execute(select(Advertisement.author_id).where(Advertisement.author_id.in_(author_ids))).scalars())
+
+
+def purge_users(db: Session, batch_size: int, cutoff: datetime.datetime) -> int:
+    User = models.User
+    has_advertisements = select(models.Advertisement.id).where(models.Advertisement.author_id == User.id).exists()
+    batch = select(User.id).where(User.deleted_at < cutoff, ~has_advertisements).limit(batch_size)
+    if sharding.enabled:
+        ids = db.execute(batch).scalars().all()
+        if not ids:
+            return 0
+        remaining = set().union(
+            *sharding.fan_out(db, _authors_with_advertisements, ids, shards=sharding.extra_shards)
+        )
+        batch = [user_id for user_id in ids if user_id not in remaining]
+    ids = db.execute(
+        delete(User).where(User.id.in_(batch)).returning(User.id).execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    return len(ids)
+
+
+def _purge_shard(db: Session, batch_size: int, cutoff: datetime.datetime, deleted_authors: list) -> int:
+    done = 0
+    for offset in range(0, len(deleted_authors), DELETED_AUTHORS_CHUNK):
+        done += cascade_user_advertisements(db, batch_size, deleted_authors[offset:offset + DELETED_AUTHORS_CHUNK])
+    return done + purge_advertisements(db, batch_size, cutoff)
+
+
+def purge_batch(batch_size: int, retention: float) -> int:
+    """Одна пачка каждого шага. Возвращает число затронутых строк (0 - очищать нечего)."""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=retention)
+    with SessionLocal() as db:
+        done = cascade_user_advertisements(db, batch_size)
+        done += purge_advertisements(db, batch_size, cutoff)
+        if sharding.enabled:
+            # Удаленные, но еще не очищенные пользователи - их не больше, чем удалено за срок хранения
+            deleted_authors = db.execute(
+                select(models.User.id).where(models.User.deleted_at.is_not(None))
+            ).scalars().all()
+            done += sum(sharding.fan_out(
+                db, _purge_shard, batch_size, cutoff, deleted_authors, shards=sharding.extra_shards
+            ))
+        done += purge_users(db, batch_size, cutoff)
+    return done
+
+
+class PurgeJob:
+    def __init__(self, interval: float, batch_size: int, retention: float, pause: float):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.retention = retention
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        # Вызывается из обработчиков (в том числе из потоков threadpool) после удаления пользователя
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                # Пачками до опустошения очереди, уступая БД между пачками
+                while await run_in_threadpool(purge_batch, self.batch_size, self.retention):
+                    await asyncio.sleep(self.pause)
+            except Exception:
+                logger.exception("Purge of soft-deleted rows failed")
+
+
+job = PurgeJob(
+    settings.purge_interval,
+    settings.purge_batch_size,
+    settings.purge_retention_seconds,
+    settings.purge_pause,
+)
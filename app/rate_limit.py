@@ -0,0 +1,169 @@
+import importlib
+import json
+import math
+import time
+from typing import Dict, Hashable, NamedTuple, Optional, Protocol, Tuple
+from app import metrics
+from app.config import settings
+from app.dependencies import decode_token
+
+# Ограничение частоты запросов: token bucket на ключ (IP, пользователь из JWT sub или весь маршрут).
+# Правила задаются в настройках строкой "N/период" (10/minute): корзина на N запросов,
+# пополняется N токенами за период
+
+
+class Backend(Protocol):
+    """Хранилище корзин. Для нескольких воркеров подставляется общее (например, Redis) через RATE_LIMIT_BACKEND."""
+
+    async def hit(self, key: Hashable, rate: float, burst: float) -> float:
+        """Списывает токен. Возвращает 0, если запрос разрешен, иначе - сколько секунд ждать."""
+
+
+class MemoryBackend:
+    """Корзины в памяти процесса.
+
+    Блокировок нет: hit не уступает управление event loop, поэтому чтение и запись
+    корзины выполняются без переключения на другой запрос.
+    """
+
+    def __init__(self, sweep_interval: float = 60.0, max_keys: int = 100_000):
+        self.sweep_interval = sweep_interval
+        self.max_keys = max_keys
+        # ключ -> [токены, время обновления, время полного восстановления]
+        self._buckets: Dict[Hashable, list] = {}
+        self._next_sweep = 0.0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    async def hit(self, key: Hashable, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        if now >= self._next_sweep or len(self._buckets) >= self.max_keys:
+            self._sweep(now)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._buckets[key] = [burst - 1, now, burst / rate]
+            return 0.0
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / rate
+
+    def _sweep(self, now: float):
+        # Корзина, которая простояла дольше времени полного восстановления, не отличается от новой
+        self._next_sweep = now + self.sweep_interval
+        idle = [key for key, bucket in self._buckets.items() if now - bucket[1] >= bucket[2]]
+        for key in idle:
+            del self._buckets[key]
+
+
+KEY_IP = "ip"
+KEY_USER = "user"
+KEY_ROUTE = "route"
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class Rule(NamedTuple):
+    name: str
+    key: str
+    rate: float
+    burst: float
+
+
+def parse_limit(limit: str) -> Tuple[float, float]:
+    """"10/minute" -> (токенов в секунду, размер корзины)."""
+    count, _, period = limit.partition("/")
+    try:
+        burst = float(count)
+        seconds = _PERIODS[period.strip().rstrip("s")]
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid rate limit: {limit!r}")
+    return burst / seconds, burst
+
+
+def build_rules() -> Dict[Tuple[str, str], Rule]:
+    # (метод, путь) -> правило; поиск правила - один доступ к словарю
+    configured = [
+        ("login", "POST", "/auth/login", KEY_IP, settings.rate_limit_login),
+        ("register", "POST", "/user/", KEY_IP, settings.rate_limit_register),
+        ("create_advertisement", "POST", "/advertisement/", KEY_USER, settings.rate_limit_create_advertisement),
+    ]
+    rules = {}
+    if not settings.rate_limit_enabled:
+        return rules
+    for name, method, path, key, limit in configured:
+        if limit:
+            rules[(method, path)] = Rule(name, key, *parse_limit(limit))
+    return rules
+
+
+def load_backend(path: str) -> Backend:
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+def _client_ip(scope) -> str:
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _user_id(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            # decode_token кеширует payload по токену - подпись проверяется один раз.
+            # Отзыв здесь не проверяем: ключу лимита нужен только sub, а проверка могла бы пойти в БД
+            payload = decode_token(token, check_revoked=False)
+            return payload.get("sub") if payload else None
+    return None
+
+
+def request_key(rule: Rule, scope) -> Hashable:
+    if rule.key == KEY_ROUTE:
+        return (rule.name,)
+    if rule.key == KEY_USER:
+        user_id = _user_id(scope)
+        if user_id:
+            return (rule.name, "user", user_id)
+    # Без токена считаем по IP: неавторизованный запрос все равно получит 401, но не бесплатно
+    return (rule.name, "ip", _client_ip(scope))
+
+
+rate_limited = metrics.Counter("rate_limited_total", "Requests rejected by rate limiting", ("rule",))
+
+_TOO_MANY_REQUESTS = json.dumps({"detail": "Too many requests"}).encode()
+
+
+class RateLimitMiddleware:
+    """ASGI-middleware: 429 с Retry-After, если корзина ключа пуста. Маршруты без правила не затрагивает."""
+
+    def __init__(self, app, backend: Optional[Backend] = None, rules: Optional[Dict[Tuple[str, str], Rule]] = None):
+        self.app = app
+        self.backend = backend if backend is not None else load_backend(settings.rate_limit_backend)
+        self.rules = rules if rules is not None else build_rules()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.rules:
+            rule = self.rules.get((scope["method"], scope["path"]))
+            if rule is not None:
+                retry_after = await self.backend.hit(request_key(rule, scope), rule.rate, rule.burst)
+                if retry_after:
+                    rate_limited.labels(rule.name).inc()
+                    await send({
+                        "type": "http.response.start",
+                        "status": 429,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(_TOO_MANY_REQUESTS)).encode()),
+                            (b"retry-after", str(math.ceil(retry_after)).encode()),
+                        ],
+                    })
+                    await send({"type": "http.response.body", "body": _TOO_MANY_REQUESTS})
+                    return
+        await self.app(scope, receive, send)
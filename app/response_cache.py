@@ -0,0 +1,132 @@
+import hashlib
+import operator
+import threading
+import time
+from typing import Hashable, NamedTuple, Optional
+import orjson
+from fastapi import Request, Response, status
+from app import cache, schemas
+from app.cache import TTLCache
+from app.config import settings
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    headers: dict
+
+
+# Готовые JSON-ответы чтения объявлений: по id и по нормализованным параметрам поиска
+responses = TTLCache(settings.response_cache_size, settings.response_cache_ttl)
+
+# Растет при каждом изменении объявлений. Входит в ключ поиска, поэтому любая запись
+# делает все закешированные поиски недостижимыми (они вытесняются по LRU/TTL)
+generation = 0
+_generation_lock = threading.Lock()
+# Время последней инвалидации (time.monotonic) - для окна отставания реплики
+invalidated_at = float("-inf")
+
+# Поля ответа в порядке AdvertisementResponse. crud выбирает ровно эти колонки кортежами (as_rows=True)
+ADVERTISEMENT_FIELDS = tuple(schemas.AdvertisementResponse.model_fields)
+_advertisement_values = operator.attrgetter(*ADVERTISEMENT_FIELDS)
+USER_FIELDS = tuple(schemas.UserResponse.model_fields)
+_user_values = operator.attrgetter(*USER_FIELDS)
+
+
+def advertisement_key(advertisement_id) -> Hashable:
+    return ("advertisement", advertisement_id)
+
+
+def search_key(**params) -> Hashable:
+    return ("search", generation, tuple(sorted((k, v) for k, v in params.items() if v is not None)))
+
+
+# Данные из БД уже соответствуют схеме, поэтому вместо модели pydantic на каждую строку
+# кодируем значения сразу orjson (UUID и datetime он сериализует сам).
+# Принимают и ORM-объекты, и строки запроса по колонкам
+def _advertisement_dict(advertisement) -> dict:
+    return dict(zip(ADVERTISEMENT_FIELDS, _advertisement_values(advertisement)))
+
+
+def serialize_advertisement(advertisement) -> bytes:
+    return orjson.dumps(_advertisement_dict(advertisement))
+
+
+def serialize_advertisements(advertisements) -> bytes:
+    return orjson.dumps([_advertisement_dict(advertisement) for advertisement in advertisements])
+
+
+def serialize_popular(ranked) -> bytes:
+    # ranked - пары (строка объявления, число просмотров) в порядке рейтинга
+    return orjson.dumps([
+        {**_advertisement_dict(advertisement), "view_count": view_count} for advertisement, view_count in ranked
+    ])
+
+
+def _user_dict(user) -> dict:
+    return dict(zip(USER_FIELDS, _user_values(user)))
+
+
+def serialize_users(users) -> bytes:
+    return orjson.dumps([_user_dict(user) for user in users])
+
+
+def serialize_with_authors(pairs) -> bytes:
+    # pairs - (строка объявления, строка автора или None), см. crud.get_advertisements_with_authors
+    return orjson.dumps([
+        {**_advertisement_dict(advertisement), "author": _user_dict(author) if author is not None else None}
+        for advertisement, author in pairs
+    ])
+
+
+def make_entry(body: bytes, headers: Optional[dict] = None) -> CachedResponse:
+    # Сильный ETag по содержимому ответа: у объявлений нет версии строки или updated_at
+    etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+    return CachedResponse(body, etag, headers or {})
+
+
+def get(key: Hashable) -> Optional[CachedResponse]:
+    return responses.get(key)
+
+
+def store(key: Hashable, entry: CachedResponse, seen_generation: int) -> CachedResponse:
+    # Если пока мы читали БД объявления изменились, ответ мог устареть - не кешируем его.
+    # Чтение с реплики вскоре после записи могло не увидеть ее - такой ответ тоже не кешируем
+    if seen_generation != generation:
+        return entry
+    if settings.database_read_url and time.monotonic() - invalidated_at < settings.response_cache_replica_lag:
+        return entry
+    responses.set(key, entry)
+    return entry
+
+
+def invalidate_advertisement(advertisement_id=None, broadcast: bool = True):
+    global generation, invalidated_at
+    with _generation_lock:
+        generation += 1
+        invalidated_at = time.monotonic()
+    if advertisement_id is not None:
+        responses.pop(advertisement_key(advertisement_id))
+    if broadcast:
+        # Кеш - в памяти процесса: другие воркеры gunicorn сбросят его через app/cache_sync.py
+        cache.publish(cache.ADVERTISEMENT, advertisement_id)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Для If-None-Match применяется слабое сравнение, поэтому префикс W/ игнорируем
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def respond(request: Request, entry: CachedResponse) -> Response:
+    if _etag_matches(request, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": entry.etag, **entry.headers})
+    return Response(
+        content=entry.body,
+        media_type="application/json",
+        headers={"ETag": entry.etag, **entry.headers}
+    )
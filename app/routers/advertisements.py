@@ -1,13 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from typing import Optional, List
+from typing import Literal, Optional, List
 import uuid
-from app.database import get_db
-from app import crud, schemas, models
+from app.config import settings
+from app.database import ReadSessionLocal, get_db, get_read_db
+from app import crud, response_cache, schemas, models, views
 from app.dependencies import get_current_user, require_admin, optional_auth
 
 router = APIRouter(prefix="/advertisement", tags=["advertisements"])
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_REPORTED_ERRORS = 1000
+EXPORT_CHUNK_ROWS = 100
+
 
 @router.post("/", response_model=schemas.AdvertisementResponse)
 def create_advertisement(
@@ -19,19 +29,190 @@ def create_advertisement(
     return crud.create_advertisement(db, advertisement, current_user.id)
 
 
+@router.post("/bulk", response_model=schemas.BulkImportResponse)
+async def bulk_create_advertisements(
+        request: Request,
+        current_user: models.User = Depends(get_current_user),
+        db: Session = Depends(get_db)
+):
+    # Тело - NDJSON: по объявлению (AdvertisementCreate) на строку.
+    # Читаем поток построчно и пишем пачками по settings.bulk_batch_size в отдельных транзакциях
+    created = 0
+    failed = 0
+    errors = []
+    batch, batch_lines = [], []
+
+    async def flush():
+        nonlocal created, failed
+        try:
+            created += await run_in_threadpool(crud.bulk_create_advertisements, db, batch, current_user.id)
+            return
+        except SQLAlchemyError:
+            pass
+        # Пачка не записалась - повторяем построчно, чтобы найти проблемные строки
+        for advertisement, line_number in zip(batch, batch_lines):
+            try:
+                created += await run_in_threadpool(crud.bulk_create_advertisements, db, [advertisement], current_user.id)
+            except SQLAlchemyError as e:
+                failed += 1
+                _report_error(errors, line_number, str(getattr(e, "orig", e)))
+
+    async for line_number, line in _ndjson_lines(request):
+        try:
+            batch.append(schemas.AdvertisementCreate.model_validate_json(line))
+            batch_lines.append(line_number)
+        except ValidationError as e:
+            failed += 1
+            _report_error(errors, line_number, "; ".join(
+                ".".join(str(part) for part in error["loc"]) + ": " + error["msg"] if error["loc"] else error["msg"]
+                for error in e.errors()
+            ))
+            continue
+        if len(batch) >= settings.bulk_batch_size:
+            await flush()
+            batch, batch_lines = [], []
+    if batch:
+        await flush()
+
+    return {"created": created, "failed": failed, "errors": errors}
+
+
+async def _ndjson_lines(request: Request):
+    buffer = b""
+    line_number = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+
+def _report_error(errors: list, line_number: int, message: str):
+    # Счетчик failed растет всегда, а подробности храним только для первых ошибок
+    if len(errors) < MAX_REPORTED_ERRORS:
+        errors.append({"line": line_number, "error": message})
+
+
+@router.post("/batch", response_model=List[schemas.AdvertisementBatchItem])
+def get_advertisements_batch(
+        batch: schemas.AdvertisementBatchRequest,
+        request: Request,
+        current_user: Optional[models.User] = Depends(optional_auth),
+        db: Session = Depends(get_read_db)
+):
+    # Для страниц со списком конкретных объявлений: вместо N запросов GET /{id} - один запрос IN.
+    # Порядок - как в ids, отсутствующие и удаленные пропускаются. Просмотры не считаются
+    if batch.include_author:
+        body = response_cache.serialize_with_authors(crud.get_advertisements_with_authors(db, batch.ids))
+    else:
+        body = response_cache.serialize_advertisements(crud.get_advertisements_by_ids(db, batch.ids, as_rows=True))
+    return response_cache.respond(request, response_cache.make_entry(body))
+
+
+@router.get("/export")
+def export_advertisements(
+        author_id: Optional[uuid.UUID] = Query(None),
+        current_user: models.User = Depends(get_current_user)
+):
+    # Пользователь выгружает свои объявления, админ - объявления любого автора или все сразу
+    if current_user.group != "admin":
+        if author_id is not None and author_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions"
+            )
+        author_id = current_user.id
+    return StreamingResponse(_export_lines(author_id), media_type="application/x-ndjson")
+
+
+def _export_lines(author_id: Optional[uuid.UUID]):
+    # Своя сессия: ответ стримится после выхода из зависимостей запроса
+    db = ReadSessionLocal()
+    try:
+        chunk = []
+        for advertisement in crud.iter_advertisements(db, author_id, settings.bulk_batch_size, as_rows=True):
+            chunk.append(response_cache.serialize_advertisement(advertisement))
+            if len(chunk) >= EXPORT_CHUNK_ROWS:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+    finally:
+        db.close()
+
+
+@router.get("/stats", response_model=schemas.PriceStats)
+def get_price_stats(
+        request: Request,
+        title: Optional[str] = Query(None),
+        description: Optional[str] = Query(None),
+        min_price: Optional[float] = Query(None),
+        max_price: Optional[float] = Query(None),
+        category: Optional[str] = Query(None),
+        current_user: Optional[models.User] = Depends(optional_auth),
+        db: Session = Depends(get_read_db)
+):
+    # Распределение цен (count, min, max, перцентили, гистограмма) для тех же фильтров, что у поиска
+    key = response_cache.search_key(
+        view="stats", title=title, description=description, min_price=min_price, max_price=max_price,
+        category=category
+    )
+    entry = response_cache.get(key)
+    if entry is None:
+        seen_generation = response_cache.generation
+        stats = crud.get_price_stats(db, title, description, min_price, max_price, category)
+        body = schemas.PriceStats.model_validate(stats).model_dump_json().encode()
+        entry = response_cache.store(key, response_cache.make_entry(body), seen_generation)
+    return response_cache.respond(request, entry)
+
+
+@router.get("/popular", response_model=List[schemas.PopularAdvertisement])
+def get_popular_advertisements(
+        request: Request,
+        limit: int = Query(min(DEFAULT_PAGE_SIZE, settings.popular_size), ge=1, le=settings.popular_size),
+        current_user: Optional[models.User] = Depends(optional_auth),
+        db: Session = Depends(get_read_db)
+):
+    # Версия рейтинга в ключе: ответ меняется после сброса просмотров, а не по TTL
+    key = response_cache.search_key(view="popular", limit=limit, ranking=views.counter.ranking.version)
+    entry = response_cache.get(key)
+    if entry is None:
+        seen_generation = response_cache.generation
+        ranked = crud.get_popular_advertisements(db, limit)
+        entry = response_cache.store(
+            key, response_cache.make_entry(response_cache.serialize_popular(ranked)), seen_generation
+        )
+    return response_cache.respond(request, entry)
+
+
 @router.get("/{advertisement_id}", response_model=schemas.AdvertisementResponse)
 def get_advertisement(
         advertisement_id: uuid.UUID,
+        request: Request,
         current_user: Optional[models.User] = Depends(optional_auth),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
-    advertisement = crud.get_advertisement_by_id(db, advertisement_id)
-    if not advertisement:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Advertisement not found"
+    key = response_cache.advertisement_key(advertisement_id)
+    entry = response_cache.get(key)
+    if entry is None:
+        seen_generation = response_cache.generation
+        advertisement = crud.get_advertisement_by_id(db, advertisement_id)
+        if not advertisement:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Advertisement not found"
+            )
+        entry = response_cache.store(
+            key, response_cache.make_entry(response_cache.serialize_advertisement(advertisement)), seen_generation
         )
-    return advertisement
+    # Просмотр считается в памяти и попадает в БД пачкой (app/views.py), в том числе для ответа из кеша
+    views.counter.record(advertisement_id)
+    # Готовый JSON и ETag: при совпадении If-None-Match тело не передается (304)
+    return response_cache.respond(request, entry)
 
 
 @router.patch("/{advertisement_id}", response_model=schemas.AdvertisementResponse)
@@ -55,7 +236,7 @@ def update_advertisement(
             detail="Not enough permissions"
         )
 
-    return crud.update_advertisement(db, advertisement_id, advertisement_update)
+    return crud.update_advertisement(db, advertisement, advertisement_update)
 
 
 @router.delete("/{advertisement_id}")
@@ -78,17 +259,52 @@ def delete_advertisement(
             detail="Not enough permissions"
         )
 
-    crud.delete_advertisement(db, advertisement_id)
+    crud.delete_advertisement(db, advertisement)
     return {"message": "Advertisement deleted successfully"}
 
 
 @router.get("/", response_model=List[schemas.AdvertisementResponse])
 def search_advertisements(
+        request: Request,
         title: Optional[str] = Query(None),
         description: Optional[str] = Query(None),
         min_price: Optional[float] = Query(None),
         max_price: Optional[float] = Query(None),
+        category: Optional[str] = Query(None),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+        sort: Literal["created_at", "relevance"] = Query(crud.SORT_CREATED_AT),
         current_user: Optional[models.User] = Depends(optional_auth),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
-    return crud.get_advertisements(db, title, description, min_price, max_price)
\ No newline at end of file
+    key = response_cache.search_key(
+        title=title, description=description, min_price=min_price, max_price=max_price,
+        limit=limit, cursor=cursor, sort=sort, category=category
+    )
+    entry = response_cache.get(key)
+    if entry is None:
+        seen_generation = response_cache.generation
+        headers = {}
+        try:
+            # Без limit и cursor отдаем весь список, как раньше
+            if limit is None and cursor is None:
+                items = crud.get_advertisements(
+                    db, title, description, min_price, max_price, sort, as_rows=True, category=category
+                )
+            else:
+                items, next_cursor = crud.get_advertisements_page(
+                    db, limit or DEFAULT_PAGE_SIZE, cursor, title, description, min_price, max_price, sort,
+                    as_rows=True, category=category
+                )
+                # Курсор следующей страницы передаем в заголовке, чтобы не менять формат тела ответа
+                if next_cursor:
+                    headers["X-Next-Cursor"] = next_cursor
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        entry = response_cache.store(
+            key, response_cache.make_entry(response_cache.serialize_advertisements(items), headers), seen_generation
+        )
+    return response_cache.respond(request, entry)
@@ -0,0 +1,201 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal, Optional, List
+import uuid
+from app.config import settings
+from app.database import get_async_db, get_async_read_db
+from app import crud, crud_async, response_cache, schemas, models, views
+from app.dependencies_async import get_current_user_async, optional_auth_async
+from app.routers import advertisements
+from app.routers.advertisements import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+# Асинхронные версии роутов app/routers/advertisements.py (settings.async_db)
+router = APIRouter(prefix="/advertisement", tags=["advertisements"])
+
+# Массовый импорт/экспорт и так не держит поток на время запроса - переиспользуем его.
+# Регистрируем до /{advertisement_id}, иначе тот перехватит эти пути
+router.add_api_route(
+    "/bulk", advertisements.bulk_create_advertisements,
+    methods=["POST"], response_model=schemas.BulkImportResponse
+)
+router.add_api_route("/export", advertisements.export_advertisements, methods=["GET"])
+
+
+@router.post("/batch", response_model=List[schemas.AdvertisementBatchItem])
+async def get_advertisements_batch(
+        batch: schemas.AdvertisementBatchRequest,
+        request: Request,
+        current_user: Optional[models.User] = Depends(optional_auth_async),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    if batch.include_author:
+        body = response_cache.serialize_with_authors(await crud_async.get_advertisements_with_authors(db, batch.ids))
+    else:
+        body = response_cache.serialize_advertisements(
+            await crud_async.get_advertisements_by_ids(db, batch.ids, as_rows=True)
+        )
+    return response_cache.respond(request, response_cache.make_entry(body))
+
+
+@router.post("/", response_model=schemas.AdvertisementResponse)
+async def create_advertisement(
+        advertisement: schemas.AdvertisementCreate,
+        current_user: models.User = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    return await crud_async.create_advertisement(db, advertisement, current_user.id)
+
+
+@router.get("/stats", response_model=schemas.PriceStats)
+async def get_price_stats(
+        request: Request,
+        title: Optional[str] = Query(None),
+        description: Optional[str] = Query(None),
+        min_price: Optional[float] = Query(None),
+        max_price: Optional[float] = Query(None),
+        category: Optional[str] = Query(None),
+        current_user: Optional[models.User] = Depends(optional_auth_async),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    key = response_cache.search_key(
+        view="stats", title=title, description=description, min_price=min_price, max_price=max_price,
+        category=category
+    )
+    entry = response_cache.get(key)
+    if entry is None:
+        seen_generation = response_cache.generation
+        stats = await crud_async.get_price_stats(db, title, description, min_price, max_price, category)
+        body = schemas.PriceStats.model_validate(stats).model_dump_json().encode()
+        entry = response_cache.store(key, response_cache.make_entry(body), seen_generation)
+    return response_cache.respond(request, entry)
+
+
+@router.get("/popular", response_model=List[schemas.PopularAdvertisement])
+async def get_popular_advertisements(
+        request: Request,
+        limit: int = Query(min(DEFAULT_PAGE_SIZE, settings.popular_size), ge=1, le=settings.popular_size),
+        current_user: Optional[models.User] = Depends(optional_auth_async),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    # Версия рейтинга в ключе: ответ меняется после сброса просмотров, а не по TTL
+    key = response_cache.search_key(view="popular", limit=limit, ranking=views.counter.ranking.version)
+    entry = response_cache.get(key)
+    if entry is None:
+        seen_generation = response_cache.generation
+        ranked = await crud_async.get_popular_advertisements(db, limit)
+        entry = response_cache.store(
+            key, response_cache.make_entry(response_cache.serialize_popular(ranked)), seen_generation
+        )
+    return response_cache.respond(request, entry)
+
+
+@router.get("/{advertisement_id}", response_model=schemas.AdvertisementResponse)
+async def get_advertisement(
+        advertisement_id: uuid.UUID,
+        request: Request,
+        current_user: Optional[models.User] = Depends(optional_auth_async),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    key = response_cache.advertisement_key(advertisement_id)
+    entry = response_cache.get(key)
+    if entry is None:
+        seen_generation = response_cache.generation
+        advertisement = await crud_async.get_advertisement_by_id(db, advertisement_id)
+        if not advertisement:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Advertisement not found"
+            )
+        entry = response_cache.store(
+            key, response_cache.make_entry(response_cache.serialize_advertisement(advertisement)), seen_generation
+        )
+    # Просмотр считается в памяти и попадает в БД пачкой (app/views.py), в том числе для ответа из кеша
+    views.counter.record(advertisement_id)
+    # Готовый JSON и ETag: при совпадении If-None-Match тело не передается (304)
+    return response_cache.respond(request, entry)
+
+
+async def _get_own_advertisement(db: AsyncSession, advertisement_id: uuid.UUID, current_user: models.User):
+    advertisement = await crud_async.get_advertisement_by_id(db, advertisement_id)
+    if not advertisement:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Advertisement not found"
+        )
+
+    # Пользователь может изменять только свои объявления, админ - любые
+    if current_user.group != "admin" and advertisement.author_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    return advertisement
+
+
+@router.patch("/{advertisement_id}", response_model=schemas.AdvertisementResponse)
+async def update_advertisement(
+        advertisement_id: uuid.UUID,
+        advertisement_update: schemas.AdvertisementUpdate,
+        current_user: models.User = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    advertisement = await _get_own_advertisement(db, advertisement_id, current_user)
+    return await crud_async.update_advertisement(db, advertisement, advertisement_update)
+
+
+@router.delete("/{advertisement_id}")
+async def delete_advertisement(
+        advertisement_id: uuid.UUID,
+        current_user: models.User = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    advertisement = await _get_own_advertisement(db, advertisement_id, current_user)
+    await crud_async.delete_advertisement(db, advertisement)
+    return {"message": "Advertisement deleted successfully"}
+
+
+@router.get("/", response_model=List[schemas.AdvertisementResponse])
+async def search_advertisements(
+        request: Request,
+        title: Optional[str] = Query(None),
+        description: Optional[str] = Query(None),
+        min_price: Optional[float] = Query(None),
+        max_price: Optional[float] = Query(None),
+        category: Optional[str] = Query(None),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+        sort: Literal["created_at", "relevance"] = Query(crud.SORT_CREATED_AT),
+        current_user: Optional[models.User] = Depends(optional_auth_async),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    key = response_cache.search_key(
+        title=title, description=description, min_price=min_price, max_price=max_price,
+        limit=limit, cursor=cursor, sort=sort, category=category
+    )
+    entry = response_cache.get(key)
+    if entry is None:
+        seen_generation = response_cache.generation
+        headers = {}
+        try:
+            # Без limit и cursor отдаем весь список, как раньше
+            if limit is None and cursor is None:
+                items = await crud_async.get_advertisements(
+                    db, title, description, min_price, max_price, sort, as_rows=True, category=category
+                )
+            else:
+                items, next_cursor = await crud_async.get_advertisements_page(
+                    db, limit or DEFAULT_PAGE_SIZE, cursor, title, description, min_price, max_price, sort,
+                    as_rows=True, category=category
+                )
+                # Курсор следующей страницы передаем в заголовке, чтобы не менять формат тела ответа
+                if next_cursor:
+                    headers["X-Next-Cursor"] = next_cursor
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        entry = response_cache.store(
+            key, response_cache.make_entry(response_cache.serialize_advertisements(items), headers), seen_generation
+        )
+    return response_cache.respond(request, entry)
@@ -1,40 +0,0 @@
-from datetime import datetime, timedelta
-from typing import Optional
-from jose import jwt
-from passlib.context import CryptContext
-from fastapi import HTTPException, status
-from app.config import settings
-
-
-SECRET_KEY = settings.secret_key
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_HOURS = 48
-
-pwd_context = CryptContext(
-    schemes=["pbkdf2_sha256", "django_argon2", "sha256_crypt"],
-    default="pbkdf2_sha256",
-    deprecated="auto"
-)
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-def verify_token(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except jwt.InvalidTokenError:
-        return None
\ No newline at end of file
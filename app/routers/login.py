@@ -1,26 +1,88 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordRequestForm
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from app import crud, schemas
-from app.auth import verify_password, create_access_token
+from typing import Optional
+import uuid
+from app import cache, crud, schemas, tokens
+from app.auth import check_password, rehash_password
 from app.database import get_db
+from app.dependencies import check_active_user, decode_token, load_principal, security, token_cache_key
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
 
 @router.post("/login", response_model=schemas.TokenResponse)
 def login(
+        background_tasks: BackgroundTasks,
         form_data: OAuth2PasswordRequestForm = Depends(),
         db: Session = Depends(get_db)
 ):
     user = crud.get_user_by_username(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    valid, needs_rehash = check_password(form_data.password, user.hashed_password) if user else (False, False)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
+    # Хеш старой схемы или с устаревшими параметрами argon2 пересчитываем после ответа, не задерживая логин
+    if needs_rehash:
+        background_tasks.add_task(rehash_password, user.id, user.hashed_password, form_data.password)
 
-    access_token = create_access_token(
-        data={"sub": str(user.id), "group": user.group}
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    # Короткоживущий access-токен и refresh-токен для его обновления без пароля
+    return tokens.issue_pair(user)
+
+
+def refresh_payload(refresh_token: str) -> dict:
+    payload = tokens.decode(refresh_token, tokens.REFRESH)
+    if not payload or not payload.get("jti"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
+    try:
+        uuid.UUID(payload["sub"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
+    return payload
+
+
+@router.post("/refresh", response_model=schemas.TokenResponse)
+def refresh(
+        body: schemas.RefreshRequest,
+        db: Session = Depends(get_db)
+):
+    payload = refresh_payload(body.refresh_token)
+    # Группа - из актуального пользователя, а не из старого токена
+    principal = check_active_user(load_principal(db, uuid.UUID(payload["sub"])))
+    # Refresh-токен одноразовый: отзыв - вставка по первичному ключу, поэтому из двух
+    # одновременных обновлений одним токеном пройдет только одно
+    if not tokens.revocations.revoke(db, payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token already used"
+        )
+    return tokens.issue_pair(principal)
+
+
+@router.post("/logout")
+def logout(
+        body: Optional[schemas.LogoutRequest] = None,
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: Session = Depends(get_db)
+):
+    payload = decode_token(credentials.credentials) if credentials else None
+    if not payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+    tokens.revocations.revoke(db, payload)
+    cache.token_cache.pop(token_cache_key(credentials.credentials))
+    if body and body.refresh_token:
+        refresh_token = refresh_payload(body.refresh_token)
+        if refresh_token["sub"] == payload.get("sub"):
+            tokens.revocations.revoke(db, refresh_token)
+    return {"message": "Logged out successfully"}
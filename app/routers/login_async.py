@@ -0,0 +1,71 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import uuid
+from app import cache, crud_async, schemas, tokens
+from app.auth import check_password_async, rehash_password_async
+from app.database import get_async_db
+from app.dependencies import check_active_user, decode_token, security, token_cache_key
+from app.dependencies_async import load_principal_async
+from app.routers.login import refresh_payload
+
+# Асинхронная версия app/routers/login.py (settings.async_db)
+router = APIRouter(prefix="/auth", tags=["authentication"])
+
+
+@router.post("/login", response_model=schemas.TokenResponse)
+async def login(
+        background_tasks: BackgroundTasks,
+        form_data: OAuth2PasswordRequestForm = Depends(),
+        db: AsyncSession = Depends(get_async_db)
+):
+    user = await crud_async.get_user_by_username(db, form_data.username)
+    valid, needs_rehash = False, False
+    if user:
+        valid, needs_rehash = await check_password_async(form_data.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password"
+        )
+    if needs_rehash:
+        background_tasks.add_task(rehash_password_async, user.id, user.hashed_password, form_data.password)
+
+    return tokens.issue_pair(user)
+
+
+@router.post("/refresh", response_model=schemas.TokenResponse)
+async def refresh(
+        body: schemas.RefreshRequest,
+        db: AsyncSession = Depends(get_async_db)
+):
+    payload = refresh_payload(body.refresh_token)
+    principal = check_active_user(await load_principal_async(db, uuid.UUID(payload["sub"])))
+    if not await tokens.revocations.revoke_async(db, payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token already used"
+        )
+    return tokens.issue_pair(principal)
+
+
+@router.post("/logout")
+async def logout(
+        body: Optional[schemas.LogoutRequest] = None,
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: AsyncSession = Depends(get_async_db)
+):
+    payload = decode_token(credentials.credentials) if credentials else None
+    if not payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+    await tokens.revocations.revoke_async(db, payload)
+    cache.token_cache.pop(token_cache_key(credentials.credentials))
+    if body and body.refresh_token:
+        refresh_token = refresh_payload(body.refresh_token)
+        if refresh_token["sub"] == payload.get("sub"):
+            await tokens.revocations.revoke_async(db, refresh_token)
+    return {"message": "Logged out successfully"}
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app import profiling
+from app.dependencies import require_admin
+
+# Профили последних запросов этого воркера (app/profiling.py) - только для администраторов
+router = APIRouter(prefix="/debug/profiles", tags=["profiling"], dependencies=[Depends(require_admin)])
+
+
+def _get_profile(profile_id: str) -> profiling.Profile:
+    profile = profiling.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return profile
+
+
+@router.get("/")
+def list_profiles():
+    return [profile.summary() for profile in reversed(profiling.profiles)]
+
+
+@router.get("/{profile_id}")
+def get_profile(profile_id: str):
+    # Сводка и тайминги SQL-запросов
+    return _get_profile(profile_id).details()
+
+
+@router.get("/{profile_id}/speedscope")
+def download_speedscope(profile_id: str):
+    profile = _get_profile(profile_id)
+    return JSONResponse(
+        profiling.speedscope(profile),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile.id}.speedscope.json"'}
+    )
+
+
+@router.get("/{profile_id}/collapsed")
+def download_collapsed(profile_id: str):
+    profile = _get_profile(profile_id)
+    return PlainTextResponse(
+        profiling.collapsed(profile),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile.id}.collapsed.txt"'}
+    )
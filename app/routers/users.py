@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional
 import uuid
-from app.database import get_db
-from app import crud, schemas, models
+from app.database import get_db, get_read_db
+from app import crud, response_cache, schemas, models
 from app.dependencies import get_current_user, require_admin, optional_auth
 
 router = APIRouter(prefix="/user", tags=["users"])
@@ -11,21 +11,34 @@ router = APIRouter(prefix="/user", tags=["users"])
 
 @router.post("/", response_model=schemas.UserResponse)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-
-    if crud.get_user_by_username(db, user.username):
+    # Уникальность username/email проверяет ограничение БД, без предварительных SELECT
+    try:
+        return crud.create_user(db, user)
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already exists"
+            detail=str(e)
         )
 
-    return crud.create_user(db, user)
+
+@router.post("/batch", response_model=List[schemas.UserResponse])
+def get_users_batch(
+        batch: schemas.BatchRequest,
+        request: Request,
+        current_user: models.User = Depends(get_current_user),
+        db: Session = Depends(get_read_db)
+):
+    # Ответ содержит email - только для авторизованных
+    # Один запрос IN; порядок - как в ids, отсутствующие и удаленные пропускаются
+    users = crud.get_users_by_ids(db, batch.ids, as_rows=True)
+    return response_cache.respond(request, response_cache.make_entry(response_cache.serialize_users(users)))
 
 
 @router.get("/{user_id}", response_model=schemas.UserResponse)
 def get_user(
         user_id: uuid.UUID,
         current_user: Optional[models.User] = Depends(optional_auth),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
     user = crud.get_user_by_id(db, user_id)
     if not user:
@@ -50,7 +63,13 @@ def update_user(
             detail="Not enough permissions"
         )
 
-    user = crud.update_user(db, user_id, user_update)
+    try:
+        user = crud.update_user(db, user_id, user_update)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
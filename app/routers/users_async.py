@@ -0,0 +1,100 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import uuid
+from app.database import get_async_db, get_async_read_db
+from app import crud_async, response_cache, schemas, models
+from app.dependencies_async import get_current_user_async, optional_auth_async
+
+# Асинхронные версии роутов app/routers/users.py (settings.async_db)
+router = APIRouter(prefix="/user", tags=["users"])
+
+
+@router.post("/", response_model=schemas.UserResponse)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    # Уникальность username/email проверяет ограничение БД, без предварительных SELECT
+    try:
+        return await crud_async.create_user(db, user)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+@router.post("/batch", response_model=List[schemas.UserResponse])
+async def get_users_batch(
+        batch: schemas.BatchRequest,
+        request: Request,
+        current_user: models.User = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    # Ответ содержит email - только для авторизованных
+    users = await crud_async.get_users_by_ids(db, batch.ids, as_rows=True)
+    return response_cache.respond(request, response_cache.make_entry(response_cache.serialize_users(users)))
+
+
+@router.get("/{user_id}", response_model=schemas.UserResponse)
+async def get_user(
+        user_id: uuid.UUID,
+        current_user: Optional[models.User] = Depends(optional_auth_async),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    user = await crud_async.get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return user
+
+
+@router.patch("/{user_id}", response_model=schemas.UserResponse)
+async def update_user(
+        user_id: uuid.UUID,
+        user_update: schemas.UserUpdate,
+        current_user: models.User = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    # Пользователь может обновлять только себя, админ - любого
+    if current_user.group != "admin" and current_user.id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+    try:
+        user = await crud_async.update_user(db, user_id, user_update)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return user
+
+
+@router.delete("/{user_id}")
+async def delete_user(
+        user_id: uuid.UUID,
+        current_user: models.User = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    # Пользователь может удалять только себя, админ - любого
+    if current_user.group != "admin" and current_user.id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+    user = await crud_async.delete_user(db, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return {"message": "User deleted successfully"}
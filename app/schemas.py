@@ -1,8 +1,9 @@
-from pydantic import BaseModel, EmailStr, validator, ConfigDict
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, validator, ConfigDict
+from typing import Dict, Optional, List
 from datetime import datetime
 from enum import Enum
 import uuid
+from app.models import DEFAULT_CATEGORY
 
 
 # Enum для групп пользователей
@@ -52,6 +53,24 @@ class LoginRequest(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+
+# Пакетное чтение по id: один запрос IN на сущность, размер пакета ограничен
+MAX_BATCH_IDS = 200
+
+
+class BatchRequest(BaseModel):
+    ids: List[uuid.UUID] = Field(min_length=1, max_length=MAX_BATCH_IDS)
 
 
 # Advertisement Schemas
@@ -59,6 +78,8 @@ class AdvertisementBase(BaseModel):
     title: str
     description: Optional[str] = None
     price: float
+    # Ключ шардирования: задается при создании и не меняется
+    category: str = Field(DEFAULT_CATEGORY, min_length=1, max_length=50)
 
 
 class AdvertisementCreate(AdvertisementBase):
@@ -79,6 +100,47 @@ class AdvertisementResponse(AdvertisementBase):
     model_config = ConfigDict(from_attributes=True)  # ← ИСПРАВЛЕНО (вместо class Config)
 
 
+class PopularAdvertisement(AdvertisementResponse):
+    view_count: int
+
+
+class AdvertisementBatchRequest(BatchRequest):
+    # Вложить автора (UserResponse) в каждое объявление - вторым запросом IN по author_id
+    include_author: bool = False
+
+
+class AdvertisementBatchItem(AdvertisementResponse):
+    # Только при include_author; null, если автор удален
+    author: Optional[UserResponse] = None
+
+
+class PriceBucket(BaseModel):
+    lower: Optional[float]
+    upper: Optional[float]
+    count: int
+
+
+class PriceStats(BaseModel):
+    count: int
+    min: Optional[float]
+    max: Optional[float]
+    avg: Optional[float]
+    # Оценка по гистограмме: интерполяция внутри корзины
+    percentiles: Dict[str, float]
+    buckets: List[PriceBucket]
+
+
+class BulkImportError(BaseModel):
+    line: int
+    error: str
+
+
+class BulkImportResponse(BaseModel):
+    created: int
+    failed: int
+    errors: List[BulkImportError]
+
+
 # Для обратной совместимости
 class IdResponse(BaseModel):
     id: uuid.UUID
@@ -0,0 +1,175 @@
+import re
+import uuid
+from typing import Optional
+from sqlalchemy import UUID, Column, MetaData, Table, Text, delete, func, insert, inspect, literal_column, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from app import models, outbox, response_cache
+
+# Полнотекстовый поиск по title/description:
+#   sqlite     - отдельная FTS5-таблица, обновляется фоновой задачей по событиям outbox из crud
+#   postgresql - GIN-индексы по to_tsvector, поддерживаются самой БД
+#   иначе      - прежний ilike
+FTS5 = "fts5"
+POSTGRES = "postgresql"
+
+backend: Optional[str] = None
+
+# Событие outbox: переиндексировать объявления {"ids": [...]}
+REINDEX = "search.reindex"
+# Не больше id в одном MATCH/IN
+REINDEX_CHUNK = 500
+
+# Отдельная MetaData, чтобы create_all не пытался создать виртуальную таблицу
+fts_metadata = MetaData()
+advertisements_fts = Table(
+    "advertisements_fts",
+    fts_metadata,
+    Column("ad_id", UUID(as_uuid=True)),
+    Column("title", Text),
+    Column("description", Text),
+    Column("rank"),
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def setup(engine):
+    global backend
+    dialect = engine.dialect.name
+
+    if dialect == "sqlite":
+        with engine.begin() as conn:
+            exists = inspect(conn).has_table("advertisements_fts")
+            try:
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS advertisements_fts "
+                    "USING fts5(ad_id, title, description, tokenize='unicode61')"
+                ))
+            except OperationalError:
+                # SQLite собран без FTS5 - остаемся на ilike
+                backend = None
+                return backend
+            if not exists:
+                # Индексируем объявления, созданные до появления FTS-таблицы
+                conn.execute(text(
+                    "INSERT INTO advertisements_fts (ad_id, title, description) "
+                    "SELECT id, title, description FROM advertisements"
+                ))
+        backend = FTS5
+    elif dialect == POSTGRES:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_advertisements_title_fts "
+                "ON advertisements USING gin (to_tsvector('simple', title))"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_advertisements_description_fts "
+                "ON advertisements USING gin (to_tsvector('simple', coalesce(description, '')))"
+            ))
+        backend = POSTGRES
+    else:
+        backend = None
+    return backend
+
+
+def _tokens(term: str):
+    return _TOKEN_RE.findall(term)
+
+
+def _fts5_columns_query(column: str, tokens) -> str:
+    # Каждое слово ищем по префиксу; кавычки защищают от синтаксиса FTS5
+    terms = " ".join('"%s"*' % token for token in tokens)
+    return f"{column} : ({terms})"
+
+
+def _pg_tsquery(tokens) -> str:
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+def apply_search(query, title: Optional[str] = None, description: Optional[str] = None):
+    """Добавляет к запросу фильтры по title/description.
+
+    Возвращает (query, relevance), где relevance - выражение для сортировки
+    по релевантности или None, если полнотекстовый поиск не применялся.
+    """
+    title_tokens = _tokens(title) if title else []
+    description_tokens = _tokens(description) if description else []
+
+    if backend == FTS5 and (title_tokens or description_tokens):
+        parts = []
+        if title_tokens:
+            parts.append(_fts5_columns_query("title", title_tokens))
+        if description_tokens:
+            parts.append(_fts5_columns_query("description", description_tokens))
+        query = query.join(
+            advertisements_fts, advertisements_fts.c.ad_id == models.Advertisement.id
+        ).filter(literal_column("advertisements_fts").op("MATCH")(" AND ".join(parts)))
+        # bm25: чем меньше значение, тем выше релевантность
+        return query, advertisements_fts.c.rank.asc()
+
+    if backend == POSTGRES and (title_tokens or description_tokens):
+        ranks = []
+        if title_tokens:
+            vector = func.to_tsvector("simple", models.Advertisement.title)
+            tsquery = func.to_tsquery("simple", _pg_tsquery(title_tokens))
+            query = query.filter(vector.op("@@")(tsquery))
+            ranks.append(func.ts_rank(vector, tsquery))
+        if description_tokens:
+            vector = func.to_tsvector("simple", func.coalesce(models.Advertisement.description, ""))
+            tsquery = func.to_tsquery("simple", _pg_tsquery(description_tokens))
+            query = query.filter(vector.op("@@")(tsquery))
+            ranks.append(func.ts_rank(vector, tsquery))
+        return query, sum(ranks[1:], ranks[0]).desc()
+
+    if title:
+        query = query.filter(models.Advertisement.title.ilike(f"%{title}%"))
+    if description:
+        query = query.filter(models.Advertisement.description.ilike(f"%{description}%"))
+    return query, None
+
+
+def enqueue_reindex(db: Session, advertisement_ids):
+    # Индексация - не в запросе: событие в outbox в транзакции записи, FTS обновит фоновая задача
+    if backend != FTS5 or not advertisement_ids:
+        return
+    outbox.enqueue(db, REINDEX, {"ids": [str(advertisement_id) for advertisement_id in advertisement_ids]})
+
+
+def reindex_advertisements(db: Session, advertisement_ids):
+    """Приводит FTS в соответствие с текущими строками: удаляет записи и заново вставляет живые объявления.
+
+    Идемпотентна, поэтому повтор события или порядок событий одного объявления не важны.
+    """
+    if backend != FTS5:
+        return
+    advertisement_ids = list(advertisement_ids)
+    Advertisement = models.Advertisement
+    for offset in range(0, len(advertisement_ids), REINDEX_CHUNK):
+        chunk = advertisement_ids[offset:offset + REINDEX_CHUNK]
+        remove_advertisements(db, chunk)
+        db.execute(insert(advertisements_fts).from_select(
+            ["ad_id", "title", "description"],
+            select(Advertisement.id, Advertisement.title, Advertisement.description)
+            .where(Advertisement.id.in_(chunk), Advertisement.deleted_at.is_(None))
+        ))
+
+
+def _reindex_events(db: Session, payloads):
+    reindex_advertisements(db, {
+        uuid.UUID(advertisement_id) for payload in payloads for advertisement_id in payload["ids"]
+    })
+
+
+# После commit: поиск мог закешировать ответ между записью объявления и его индексацией
+outbox.handler(REINDEX, after_commit=response_cache.invalidate_advertisement)(_reindex_events)
+
+
+def remove_advertisements(db: Session, advertisement_ids):
+    if backend != FTS5 or not advertisement_ids:
+        return
+    # ad_id проиндексирован в FTS5, поэтому удаление ищет строки по индексу, а не сканом
+    terms = " OR ".join(f'"{advertisement_id.hex}"' for advertisement_id in advertisement_ids)
+    db.execute(delete(advertisements_fts).where(
+        literal_column("advertisements_fts").op("MATCH")(f"ad_id : ({terms})")
+    ))
@@ -1,10 +1,43 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app import cache, hashing, metrics, rate_limit, response_cache
+from app.config import settings
 from app.lifespan import lifespan
-from app.routers.users import router as users_router
-from app.routers.advertisements import router as ads_router
-from app.routers.login import router as login_router
+
+if settings.async_db:
+    from app.routers.users_async import router as users_router
+    from app.routers.advertisements_async import router as ads_router
+    from app.routers.login_async import router as login_router
+else:
+    from app.routers.users import router as users_router
+    from app.routers.advertisements import router as ads_router
+    from app.routers.login import router as login_router
 
 app = FastAPI(lifespan=lifespan)
+# Последний добавленный middleware - внешний: метрики видят и ответы 429
+app.add_middleware(rate_limit.RateLimitMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+if settings.profiling_enabled:
+    # Модуль подключает обработчики событий SQL, поэтому без профилирования не импортируется
+    from app import profiling
+    from app.routers.profiling import router as profiling_router
+
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(profiling_router)
+
+metrics.register_cache("principals", cache.principal_cache)
+metrics.register_cache("tokens", cache.token_cache)
+metrics.register_cache("responses", response_cache.responses)
+metrics.register_hashing(hashing.service)
+
+@app.exception_handler(hashing.HashingOverloaded)
+def hashing_overloaded_handler(request: Request, exc: hashing.HashingOverloaded):
+    # Очередь argon2 заполнена: отвечаем сразу, а не держим поток в ожидании
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": "1"}
+    )
 
 app.include_router(login_router)
 app.include_router(users_router)
@@ -16,4 +49,13 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/health/cache")
+def cache_stats():
+    # Счетчики попаданий/промахов для подбора размеров кешей
+    return {**cache.stats(), "responses": response_cache.responses.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,114 @@
+import contextlib
+import contextvars
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from app.config import settings
+from app.database import SessionLocal, engine, make_engine
+
+# Шардирование объявлений по категории.
+# Основная БД - шард "default": в ней пользователи, токены и объявления категорий без назначения
+# (settings.shard_categories). У каждого шарда свои advertisements, FTS, сводка цен и outbox,
+# поэтому запись объявления, событие индексации и сводка остаются одной локальной транзакцией.
+#   запись       - в шард категории объявления; категория после создания не меняется
+#   чтение с категорией - только ее шард
+#   без категории и по id - параллельно во все шарды, упорядоченные ответы сливаются по ключу сортировки
+# Шард по умолчанию читается через сессию запроса (реплика - как раньше), остальные - своими
+# синхронными сессиями в пуле потоков. fan_out ждет эти потоки, поэтому в async-режиме crud_async
+# вызывает ее из threadpool, а не из AsyncSession.run_sync. Без settings.database_shards шард один
+# и слой сводится к прямому вызову с сессией запроса.
+# Внешнего ключа author_id -> users в шардах нет: пользователи только в основной БД
+
+DEFAULT = "default"
+
+engines: Dict[str, Engine] = {DEFAULT: engine}
+sessionmakers: Dict[str, sessionmaker] = {DEFAULT: SessionLocal}
+for _name, _url in settings.database_shards.items():
+    if _name == DEFAULT:
+        raise ValueError(f"Shard name {DEFAULT!r} is reserved for DATABASE_URL")
+    engines[_name] = make_engine(_url, foreign_keys=False)
+    sessionmakers[_name] = sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=engines[_name]
+    )
+for _category, _name in settings.shard_categories.items():
+    if _name not in engines:
+        raise ValueError(f"Category {_category!r} is assigned to unknown shard {_name!r}")
+
+# Шарды помимо основной БД
+extra_shards = [name for name in engines if name != DEFAULT]
+enabled = bool(extra_shards)
+_executor = ThreadPoolExecutor(settings.shard_fan_out_workers, "shard") if enabled else None
+
+
+def shard_for(category: str) -> str:
+    return settings.shard_categories.get(category, DEFAULT)
+
+
+def shards_for(category: Optional[str] = None) -> List[str]:
+    return [shard_for(category)] if category is not None else list(engines)
+
+
+@contextlib.contextmanager
+def session(db: Session, shard: str):
+    """Сессия шарда: для default - сессия вызывающего db, иначе своя на время блока."""
+    if shard == DEFAULT:
+        yield db
+        return
+    with sessionmakers[shard]() as shard_db:
+        yield shard_db
+
+
+def _call_in_shard(shard: str, fn: Callable, args):
+    with sessionmakers[shard]() as shard_db:
+        return fn(shard_db, *args)
+
+
+def fan_out(db: Session, fn: Callable, *args, shards: Optional[Iterable[str]] = None) -> list:
+    """fn(сессия шарда, *args) в каждом шарде параллельно; результаты - в порядке shards.
+
+    fn должна вернуть уже прочитанные данные: сессии шардов закрываются сразу после вызова.
+    Блокирует вызывающий поток до ответа всех шардов - не вызывать в потоке event loop.
+    """
+    shards = list(engines) if shards is None else list(shards)
+    if len(shards) == 1:
+        with session(db, shards[0]) as shard_db:
+            return [fn(shard_db, *args)]
+    # Контекст копируется, как в threadpool: запросы шардов попадают в статистику текущего HTTP-запроса
+    futures = {
+        shard: _executor.submit(contextvars.copy_context().run, _call_in_shard, shard, fn, args)
+        for shard in shards if shard != DEFAULT
+    }
+    # Сессия запроса привязана к текущему потоку (в async-режиме - к greenlet run_sync)
+    local = fn(db, *args) if DEFAULT in shards else None
+    return [local if shard == DEFAULT else futures[shard].result() for shard in shards]
+
+
+def merge(results: Iterable[list], key: Callable, reverse: bool = False, limit: Optional[int] = None) -> list:
+    # Каждый список уже упорядочен по key - слияние без пересортировки
+    merged = heapq.merge(*results, key=key, reverse=reverse)
+    return list(merged if limit is None else itertools.islice(merged, limit))
+
+
+def iter_merged(db: Session, query: Callable, key: Callable, shards: Optional[Iterable[str]] = None):
+    """Потоковое слияние упорядоченных query(сессия шарда) из всех шардов (экспорт)."""
+    shards = list(engines) if shards is None else list(shards)
+    with contextlib.ExitStack() as stack:
+        if len(shards) == 1:
+            yield from query(stack.enter_context(session(db, shards[0])))
+            return
+        yield from heapq.merge(*(query(stack.enter_context(session(db, shard))) for shard in shards), key=key)
+
+
+def drop_user_foreign_key(shard_engine: Engine):
+    # Схема шарда - та же, что у основной БД (лишние таблицы пусты), но без внешнего ключа на users:
+    # в SQLite шарды подключаются с foreign_keys=OFF, в Postgres ограничение снимается
+    if shard_engine.dialect.name != "postgresql":
+        return
+    with shard_engine.begin() as conn:
+        names = {fk["name"] for fk in inspect(conn).get_foreign_keys("advertisements")}
+        if "fk_advertisements_author_id_users" in names:
+            conn.exec_driver_sql("ALTER TABLE advertisements DROP CONSTRAINT fk_advertisements_author_id_users")
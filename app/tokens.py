@@ -0,0 +1,361 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import hmac
+import logging
+import math
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Optional, Tuple
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from app import cache, models
+from app.config import settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# JWT (HS256) для access- и refresh-токенов.
+# Подпись проверяется напрямую через hmac: формат тот же, что у jose, но без его разбора
+# заголовков и claims на каждый вызов. Ключ выбирается по kid из заголовка - кольцо ключей
+# settings.token_keys ("kid:секрет,kid:секрет", первым - ключ подписи) позволяет выпускать
+# токены новым ключом, пока старые еще проверяются. Токены без kid (выпущенные до кольца)
+# проверяются settings.secret_key, только пока кольцо не задано или при явном
+# settings.accept_legacy_tokens: exp задает сам токен, срок действия от подделки не защищает.
+# Отзыв: jti отозванных токенов хранятся в таблице revoked_tokens и в блум-фильтре в памяти.
+# Проверка на запрос - только фильтр (O(число хешей), без БД); в БД идем лишь при
+# срабатывании фильтра, чтобы отсечь ложное срабатывание. Воркеры подтягивают чужие
+# отзывы раз в revocation_sync_interval.
+
+ALGORITHM = "HS256"
+ACCESS = "access"
+REFRESH = "refresh"
+LEGACY_KID = None
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def parse_keys(value: str) -> Dict[str, bytes]:
+    keys = {}
+    for item in value.split(","):
+        kid, _, secret = item.strip().partition(":")
+        if not kid or not secret:
+            raise ValueError(f"Invalid token key {item!r}, expected kid:secret")
+        keys[kid] = secret.encode()
+    return keys
+
+
+class KeyRing:
+    def __init__(self, keys: Dict[str, bytes], legacy_secret: Optional[bytes]):
+        if not keys:
+            raise ValueError("Token key ring is empty")
+        self.active_kid = next(iter(keys))
+        self._keys: Dict[Optional[str], bytes] = dict(keys)
+        if legacy_secret is not None:
+            self._keys[LEGACY_KID] = legacy_secret
+        # Разобранные заголовки: у всех токенов одного ключа заголовок одинаковый
+        self._headers: Dict[str, bytes] = {}
+
+    def sign(self, payload: dict) -> str:
+        header = _b64encode(orjson.dumps({"alg": ALGORITHM, "typ": "JWT", "kid": self.active_kid}))
+        signing_input = header + b"." + _b64encode(orjson.dumps(payload))
+        signature = hmac.new(self._keys[self.active_kid], signing_input, hashlib.sha256).digest()
+        return (signing_input + b"." + _b64encode(signature)).decode()
+
+    def _key_for_header(self, header: str) -> bytes:
+        key = self._headers.get(header)
+        if key is None:
+            try:
+                fields = orjson.loads(_b64decode(header))
+            except (ValueError, orjson.JSONDecodeError):
+                raise InvalidToken("Malformed header")
+            if not isinstance(fields, dict) or fields.get("alg") != ALGORITHM:
+                raise InvalidToken("Unsupported algorithm")
+            key = self._keys.get(fields.get("kid"))
+            if key is None:
+                raise InvalidToken("Unknown key id")
+            if len(self._headers) < 64:
+                self._headers[header] = key
+        return key
+
+    def verify(self, token: str) -> dict:
+        try:
+            signing_input, signature = token.rsplit(".", 1)
+            header, body = signing_input.split(".")
+        except ValueError:
+            raise InvalidToken("Malformed token")
+        key = self._key_for_header(header)
+        expected = hmac.new(key, signing_input.encode(), hashlib.sha256).digest()
+        try:
+            valid = hmac.compare_digest(expected, _b64decode(signature))
+            payload = orjson.loads(_b64decode(body)) if valid else None
+        except (ValueError, orjson.JSONDecodeError):
+            raise InvalidToken("Malformed token")
+        if not valid:
+            raise InvalidToken("Invalid signature")
+        if not isinstance(payload, dict):
+            raise InvalidToken("Malformed payload")
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)) or exp <= time.time():
+            raise InvalidToken("Token expired")
+        return payload
+
+
+def build_key_ring(token_keys: str, secret_key: str, accept_legacy: Optional[bool] = None) -> KeyRing:
+    if accept_legacy is None:
+        accept_legacy = not token_keys
+    return KeyRing(
+        parse_keys(token_keys) if token_keys else {"primary": secret_key.encode()},
+        secret_key.encode() if accept_legacy else None,
+    )
+
+
+keys = build_key_ring(settings.token_keys, settings.secret_key, settings.accept_legacy_tokens)
+
+
+def _claims(data: dict, token_type: str, lifetime: datetime.timedelta) -> dict:
+    now = int(time.time())
+    return {
+        **data,
+        "typ": token_type,
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + int(lifetime.total_seconds()),
+    }
+
+
+def create_token(data: dict, token_type: str = ACCESS, lifetime: Optional[datetime.timedelta] = None) -> str:
+    if lifetime is None:
+        lifetime = datetime.timedelta(
+            minutes=settings.access_token_expire_minutes
+        ) if token_type == ACCESS else datetime.timedelta(days=settings.refresh_token_expire_days)
+    return keys.sign(_claims(data, token_type, lifetime))
+
+
+def issue_pair(user) -> dict:
+    data = {"sub": str(user.id), "group": user.group}
+    return {
+        "access_token": create_token(data, ACCESS),
+        "refresh_token": create_token(data, REFRESH),
+        "token_type": "bearer",
+        "expires_in": settings.access_token_expire_minutes * 60,
+    }
+
+
+def decode(token: str, token_type: Optional[str] = ACCESS) -> Optional[dict]:
+    """Payload проверенного токена нужного типа или None. Отзыв здесь не проверяется."""
+    try:
+        payload = keys.verify(token)
+    except InvalidToken:
+        return None
+    # У токенов, выпущенных до refresh-токенов, нет typ: это access-токены
+    if token_type is not None and payload.get("typ", ACCESS) != token_type:
+        return None
+    return payload
+
+
+class BloomFilter:
+    """Блум-фильтр на bytearray: k позиций из одного хеша, ложноположительные с вероятностью error_rate."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _hashes(self, key: str) -> Tuple[int, int]:
+        # Встроенный hash строки: фильтр живет только в памяти процесса и перестраивается из БД при запуске,
+        # так что случайная соль hash между процессами не мешает, а jti выбирает сервер, не клиент
+        value = hash(key) & 0xFFFFFFFFFFFFFFFF
+        return value & 0xFFFFFFFF, (value >> 32) | 1
+
+    def add(self, key: str):
+        # Двойное хеширование: позиции h1 + i*h2 вместо k независимых хешей
+        first, second = self._hashes(key)
+        for i in range(self.hashes):
+            position = (first + i * second) % self.size
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        first, second = self._hashes(key)
+        bits, size = self._bits, self.size
+        # Для отсутствующего ключа обычно хватает одной-двух позиций
+        for i in range(self.hashes):
+            position = (first + i * second) % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    def __init__(self, capacity: int, error_rate: float, rebuild_interval: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.filter = BloomFilter(capacity, error_rate)
+        # Растет при каждом новом отзыве: результат проверки, закешированный в app/dependencies.py,
+        # действителен, пока версия не изменилась
+        self.version = 0
+        self._synced_at: Optional[datetime.datetime] = None
+        # Точные ответы для jti, на которых сработал фильтр (отзыв необратим, поэтому True не устаревает)
+        self._confirmed = cache.TTLCache(capacity, rebuild_interval)
+        self._lock = threading.Lock()
+
+    def _mark_revoked(self, jtis: Iterable[str]):
+        with self._lock:
+            changed = False
+            for jti in jtis:
+                if self._confirmed.get(jti):
+                    continue
+                if jti not in self.filter:
+                    self.filter.add(jti)
+                self._confirmed.set(jti, True)
+                changed = True
+            if changed:
+                self.version += 1
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti or jti not in self.filter:
+            return False
+        revoked = self._confirmed.get(jti)
+        if revoked is None:
+            # Фильтр сработал: проверяем по первичному ключу - это может быть ложное срабатывание
+            seen_version = self.version
+            with SessionLocal() as db:
+                revoked = db.get(models.RevokedToken, jti) is not None
+            with self._lock:
+                # Пока шел запрос, jti мог быть отозван - тогда отрицательный ответ уже неверен
+                if revoked or self.version == seen_version:
+                    self._confirmed.set(jti, revoked)
+        return revoked
+
+    def _row(self, payload: dict) -> Optional[dict]:
+        if not payload.get("jti"):
+            # Токены, выпущенные до появления jti, отозвать нельзя - они истекут сами
+            return None
+        sub = payload.get("sub")
+        return {
+            "jti": payload["jti"],
+            "user_id": uuid.UUID(sub) if sub else None,
+            "expires_at": datetime.datetime.utcfromtimestamp(payload["exp"]),
+            "revoked_at": datetime.datetime.utcnow(),
+        }
+
+    def revoke(self, db, payload: dict) -> bool:
+        """Отзывает токен (отдельной транзакцией). False - уже был отозван: повторный logout или гонка двух refresh."""
+        row = self._row(payload)
+        if row is None:
+            return False
+        try:
+            db.execute(insert(models.RevokedToken).values(**row))
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return False
+        self._mark_revoked([row["jti"]])
+        return True
+
+    async def revoke_async(self, db, payload: dict) -> bool:
+        row = self._row(payload)
+        if row is None:
+            return False
+        try:
+            await db.execute(insert(models.RevokedToken).values(**row))
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            return False
+        self._mark_revoked([row["jti"]])
+        return True
+
+    def load(self):
+        """Перестраивает фильтр по неистекшим отзывам: при запуске и периодически, чтобы забыть истекшие."""
+        RevokedToken = models.RevokedToken
+        now = datetime.datetime.utcnow()
+        with SessionLocal() as db:
+            # Истекшие токены отклоняются по exp - их записи больше не нужны
+            db.execute(delete(RevokedToken).where(RevokedToken.expires_at < now))
+            db.commit()
+            jtis = db.execute(select(RevokedToken.jti)).scalars().all()
+        bloom = BloomFilter(max(self.capacity, len(jtis) * 2), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        with self._lock:
+            self.filter = bloom
+            self.version += 1
+            self._synced_at = now
+
+    def sync(self) -> int:
+        """Добавляет отзывы других воркеров."""
+        if self._synced_at is None:
+            self.load()
+            return 0
+        RevokedToken = models.RevokedToken
+        now = datetime.datetime.utcnow()
+        # Окно с запасом: транзакция могла закоммититься позже своего revoked_at
+        since = self._synced_at - datetime.timedelta(seconds=settings.revocation_sync_interval * 2)
+        with SessionLocal() as db:
+            jtis = db.execute(select(RevokedToken.jti).where(RevokedToken.revoked_at > since)).scalars().all()
+        self._mark_revoked(jtis)
+        self._synced_at = now
+        if self.filter.count > self.filter.capacity:
+            # Фильтр переполнен - доля ложных срабатываний растет; перестраиваем большего размера
+            self.load()
+        return len(jtis)
+
+
+revocations = RevocationList(
+    settings.revocation_bloom_capacity, settings.revocation_bloom_error_rate, settings.revocation_rebuild_interval
+)
+
+
+class RevocationSync:
+    def __init__(self, interval: float, rebuild_interval: float):
+        self.interval = interval
+        self.rebuild_interval = rebuild_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # Первая загрузка - в lifespan до приема запросов
+        rebuilt = time.monotonic()
+        while True:
+            try:
+                if time.monotonic() - rebuilt >= self.rebuild_interval:
+                    await run_in_threadpool(revocations.load)
+                    rebuilt = time.monotonic()
+                else:
+                    await run_in_threadpool(revocations.sync)
+            except Exception:
+                logger.exception("Revocation list sync failed")
+            await asyncio.sleep(self.interval)
+
+
+sync_job = RevocationSync(settings.revocation_sync_interval, settings.revocation_rebuild_interval)
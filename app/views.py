@@ -0,0 +1,207 @@
+import asyncio
+import heapq
+import logging
+import operator
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+from app import models, sharding
+from app.config import settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Счетчики просмотров GET /advertisement/{id} с отложенной записью.
+# Просмотр - инкремент в памяти воркера (шард выбирается по id, у каждого шарда свой lock,
+# поэтому потоки threadpool почти не конкурируют). Фоновая задача раз в views_flush_interval
+# забирает накопленное и пишет пачками UPDATE view_count = view_count + n - одна запись на
+# объявление за интервал вместо записи на каждый просмотр. Остаток сбрасывается при остановке
+# (lifespan); при аварийном завершении теряется не больше одного интервала.
+# Рейтинг популярных (GET /advertisement/popular) - top-K в памяти: кандидаты обновляются
+# значениями из БД после каждой записи и периодически перечитываются по индексу view_count,
+# чтобы учесть просмотры в других воркерах.
+
+_increment = update(models.Advertisement.__table__).where(
+    models.Advertisement.__table__.c.id == bindparam("b_id"),
+    models.Advertisement.__table__.c.deleted_at.is_(None),
+).values(view_count=models.Advertisement.__table__.c.view_count + bindparam("b_views"))
+
+
+class ViewBuffer:
+    def __init__(self, shards: int):
+        # Число шардов - степень двойки: номер шарда берется маской от хеша
+        size = 1
+        while size < shards:
+            size *= 2
+        self._mask = size - 1
+        self._locks = [threading.Lock() for _ in range(size)]
+        self._counts: List[Dict[uuid.UUID, int]] = [{} for _ in range(size)]
+
+    def record(self, advertisement_id: uuid.UUID, views: int = 1):
+        shard = hash(advertisement_id) & self._mask
+        with self._locks[shard]:
+            counts = self._counts[shard]
+            counts[advertisement_id] = counts.get(advertisement_id, 0) + views
+
+    def drain(self) -> Dict[uuid.UUID, int]:
+        # Шард подменяется пустым словарем под его lock: инкременты после подмены попадут в следующий сброс
+        drained = {}
+        for shard, lock in enumerate(self._locks):
+            if not self._counts[shard]:
+                continue
+            with lock:
+                counts, self._counts[shard] = self._counts[shard], {}
+            drained.update(counts)
+        return drained
+
+
+class TopK:
+    """Top-K по числу просмотров. Хранит до capacity кандидатов, отдает готовый отсортированный срез."""
+
+    def __init__(self, k: int, capacity: int):
+        self.k = k
+        self.capacity = max(capacity, k)
+        self.version = 0
+        self._counts: Dict[uuid.UUID, int] = {}
+        self._top: List[Tuple[uuid.UUID, int]] = []
+        self._lock = threading.Lock()
+
+    def _rebuild(self):
+        by_count = operator.itemgetter(1)
+        if len(self._counts) > self.capacity:
+            self._counts = dict(heapq.nlargest(self.capacity, self._counts.items(), key=by_count))
+        top = heapq.nlargest(self.k, self._counts.items(), key=by_count)
+        if top != self._top:
+            self._top = top
+            self.version += 1
+
+    def update(self, counts: Iterable[Tuple[uuid.UUID, int]]):
+        with self._lock:
+            self._counts.update(counts)
+            self._rebuild()
+
+    def replace(self, counts: Iterable[Tuple[uuid.UUID, int]]):
+        with self._lock:
+            self._counts = dict(counts)
+            self._rebuild()
+
+    def discard(self, advertisement_id: uuid.UUID):
+        with self._lock:
+            if self._counts.pop(advertisement_id, None) is not None:
+                self._rebuild()
+
+    def top(self, limit: int) -> List[Tuple[uuid.UUID, int]]:
+        return self._top[:limit]
+
+
+def _write_views(db: Session, batch) -> list:
+    Advertisement = models.Advertisement
+    db.execute(_increment, [{"b_id": advertisement_id, "b_views": views} for advertisement_id, views in batch])
+    totals = db.execute(
+        select(Advertisement.id, Advertisement.view_count)
+        .where(Advertisement.id.in_([advertisement_id for advertisement_id, _ in batch]))
+        .where(Advertisement.deleted_at.is_(None))
+    ).all()
+    db.commit()
+    return totals
+
+
+def flush(buffer: ViewBuffer, ranking: TopK, batch_size: int) -> int:
+    """Пишет накопленные просмотры в БД и обновляет рейтинг. Возвращает число объявлений."""
+    pending = buffer.drain()
+    if not pending:
+        return 0
+    items = list(pending.items())
+    written = 0
+    try:
+        with SessionLocal() as db:
+            for offset in range(0, len(items), batch_size):
+                batch = items[offset:offset + batch_size]
+                # Шард объявления по id неизвестен: пачка идет во все шарды (app/sharding.py),
+                # UPDATE меняет строки только там, где они есть
+                for totals in sharding.fan_out(db, _write_views, batch):
+                    ranking.update((row.id, row.view_count) for row in totals)
+                written = offset + len(batch)
+    except Exception:
+        # Незаписанное возвращаем в буфер - запишется при следующем сбросе.
+        # Если упал один из шардов, в остальных эта пачка уже записана и будет учтена повторно
+        for advertisement_id, views in items[written:]:
+            buffer.record(advertisement_id, views)
+        raise
+    return len(items)
+
+
+def _top_viewed(db: Session, limit: int) -> list:
+    # Кандидаты с края индекса ix_advertisements_live_view_count - без сортировки таблицы
+    Advertisement = models.Advertisement
+    return db.execute(
+        select(Advertisement.id, Advertisement.view_count)
+        .where(Advertisement.deleted_at.is_(None), Advertisement.view_count > 0)
+        .order_by(Advertisement.view_count.desc())
+        .limit(limit)
+    ).all()
+
+
+def load_ranking(ranking: TopK):
+    with SessionLocal() as db:
+        results = sharding.fan_out(db, _top_viewed, ranking.capacity)
+    rows = sharding.merge(results, operator.attrgetter("view_count"), reverse=True, limit=ranking.capacity)
+    ranking.replace((row.id, row.view_count) for row in rows)
+
+
+class ViewCounter:
+    def __init__(self, shards: int, flush_interval: float, batch_size: int, top_size: int, refresh_interval: float):
+        self.buffer = ViewBuffer(shards)
+        self.ranking = TopK(top_size, top_size * 2)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.refresh_interval = refresh_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, advertisement_id: uuid.UUID):
+        self.buffer.record(advertisement_id)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Последний сброс: просмотры, накопленные после предыдущего
+        try:
+            await run_in_threadpool(flush, self.buffer, self.ranking, self.batch_size)
+        except Exception:
+            logger.exception("Final flush of view counters failed")
+
+    async def _run(self):
+        refreshed = None
+        while True:
+            try:
+                if refreshed is None or time.monotonic() - refreshed >= self.refresh_interval:
+                    await run_in_threadpool(load_ranking, self.ranking)
+                    refreshed = time.monotonic()
+                await asyncio.sleep(self.flush_interval)
+                await run_in_threadpool(flush, self.buffer, self.ranking, self.batch_size)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Flush of view counters failed")
+                await asyncio.sleep(self.flush_interval)
+
+
+counter = ViewCounter(
+    settings.views_shards,
+    settings.views_flush_interval,
+    settings.bulk_batch_size,
+    settings.popular_size,
+    settings.popular_refresh_interval,
+)
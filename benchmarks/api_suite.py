@@ -0,0 +1,283 @@
+"""Нагрузочный тест всех основных эндпоинтов со смешанной нагрузкой чтения и записи.
+
+Наполняет БД (benchmarks/seed.py), поднимает сервер на этой БД (или использует уже
+запущенный через --base-url) и держит --concurrency виртуальных пользователей на
+--duration секунд. Каждый виртуальный пользователь - отдельный пользователь из сида
+со своим токеном; операция выбирается случайно по весам --mix:
+    login   POST   /auth/login
+    get     GET    /advertisement/{id}              (объявления из сида)
+    search  GET    /advertisement/?title=...&limit=20
+    batch   POST   /advertisement/batch             (BATCH_SIZE объявлений из сида с авторами)
+    create  POST   /advertisement/
+    patch   PATCH  /advertisement/{id}              (свои объявления из сида)
+    delete  DELETE /advertisement/{id}              (свои объявления, созданные в прогоне)
+Результат - JSON с RPS и p50/p95/p99 по каждой операции и в сумме, плюс коммит и
+параметры запуска, чтобы сравнивать прогоны между коммитами (--baseline прошлый.json).
+
+Запуск:
+    python -m benchmarks.api_suite [--concurrency 50] [--duration 30] [--mix get=50,search=20,...]
+    python -m benchmarks.api_suite --database-url postgresql://... [--server gunicorn --workers 4]
+    python -m benchmarks.api_suite --base-url http://host:8000 --database-url <БД этого сервера>
+    python -m benchmarks.api_suite --mix login=1 --password-hash pbkdf2_sha256   (логин с пересчетом старых хешей)
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+import httpx
+from benchmarks.load_test import percentile, wait_ready
+from benchmarks.seed import PASSWORD_HASHES
+
+OPERATIONS = ("login", "get", "search", "batch", "create", "patch", "delete")
+BATCH_SIZE = 50
+DEFAULT_MIX = "get=50,search=20,create=10,patch=10,delete=7,login=3"
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, expected one of {OPERATIONS}")
+        mix[name] = float(weight)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("mix has no operations")
+    return mix
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, username: str, own_ads, shared_ads, rng: random.Random):
+        self.client = client
+        self.username = username
+        self.own_ads = [str(ad) for ad in own_ads]
+        self.shared_ads = shared_ads
+        self.created = []
+        self.rng = rng
+        self.headers = {}
+
+    async def login(self):
+        from benchmarks.seed import PASSWORD
+
+        response = await self.client.post("/auth/login", data={"username": self.username, "password": PASSWORD})
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def get(self):
+        return await self.client.get(f"/advertisement/{self.rng.choice(self.shared_ads)}")
+
+    async def search(self):
+        from benchmarks.seed import WORDS
+
+        return await self.client.get("/advertisement/", params={"title": self.rng.choice(WORDS), "limit": 20})
+
+    async def batch(self):
+        ids = self.rng.sample(self.shared_ads, min(BATCH_SIZE, len(self.shared_ads)))
+        return await self.client.post("/advertisement/batch", json={"ids": ids, "include_author": True})
+
+    async def create(self):
+        response = await self.client.post("/advertisement/", headers=self.headers, json={
+            "title": f"{self.username} item {self.rng.randrange(10 ** 6)}",
+            "description": "created by benchmark",
+            "price": round(self.rng.uniform(1, 1000), 2),
+        })
+        if response.status_code == 200:
+            self.created.append(response.json()["id"])
+        return response
+
+    async def patch(self):
+        return await self.client.patch(
+            f"/advertisement/{self.rng.choice(self.own_ads)}", headers=self.headers,
+            json={"price": round(self.rng.uniform(1, 1000), 2)},
+        )
+
+    async def delete(self):
+        return await self.client.delete(f"/advertisement/{self.created.pop()}", headers=self.headers)
+
+    def choose(self, names, weights) -> str:
+        name = self.rng.choices(names, weights)[0]
+        # Удаляем только созданное в прогоне: объявления из сида нужны для get и patch до конца теста
+        if name == "delete" and not self.created:
+            return "create"
+        if name == "patch" and not self.own_ads:
+            return "create"
+        return name
+
+
+async def run_user(user: VirtualUser, mix: dict, deadline: float, record: bool, stats):
+    names, weights = list(mix), list(mix.values())
+    while time.monotonic() < deadline:
+        name = user.choose(names, weights)
+        started = time.perf_counter()
+        try:
+            response = await getattr(user, name)()
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            failed = True
+        if record:
+            stats[name]["latencies"].append(time.perf_counter() - started)
+            stats[name]["errors"] += failed
+
+
+def summarize(latencies, errors: int, elapsed: float) -> dict:
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def load(base_url: str, seeded: dict, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await wait_ready(client)
+        shared_ads = [str(ad) for user in seeded["users"] for ad in user["ads"]]
+        users = [
+            VirtualUser(client, user["username"], user["ads"], shared_ads, random.Random(args.seed + index))
+            for index, user in enumerate(seeded["users"][:args.concurrency])
+        ]
+        # Токены получаем до замера: login в смеси меряется отдельно
+        await asyncio.gather(*(user.login() for user in users))
+
+        stats = defaultdict(lambda: {"latencies": [], "errors": 0})
+        if args.warmup:
+            deadline = time.monotonic() + args.warmup
+            await asyncio.gather(*(run_user(user, args.mix, deadline, False, stats) for user in users))
+        started = time.monotonic()
+        await asyncio.gather(*(run_user(user, args.mix, started + args.duration, True, stats) for user in users))
+        elapsed = time.monotonic() - started
+
+    operations = {name: summarize(stats[name]["latencies"], stats[name]["errors"], elapsed) for name in args.mix}
+    return {
+        "total": summarize(
+            [latency for name in args.mix for latency in stats[name]["latencies"]],
+            sum(stats[name]["errors"] for name in args.mix),
+            elapsed,
+        ),
+        "operations": operations,
+    }
+
+
+def start_server(args, env: dict) -> subprocess.Popen:
+    host, port = "127.0.0.1", args.port
+    if args.server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.server:app"]
+        env = dict(env, BIND=f"{host}:{port}", WEB_CONCURRENCY=str(args.workers))
+    else:
+        command = [
+            sys.executable, "-m", "uvicorn", "app.server:app", "--host", host, "--port", str(port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ]
+    return subprocess.Popen(command, env=env)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    """Относительное изменение RPS и p99 по операциям: +0.1 - на 10% больше, чем в baseline."""
+    changes = {}
+    for name, result in {"total": current["total"], **current["operations"]}.items():
+        before = baseline["total"] if name == "total" else baseline["operations"].get(name)
+        if not before or not before.get("requests") or not result.get("requests"):
+            continue
+        changes[name] = {
+            metric: round(result[metric] / before[metric] - 1, 3)
+            for metric in ("rps", "p99_ms")
+            if before.get(metric)
+        }
+    return changes
+
+
+def run(args) -> dict:
+    from benchmarks.seed import seed
+
+    seeded = seed(args.users, args.ads_per_user, args.seed, args.password_hash)
+    if args.base_url:
+        results = asyncio.run(load(args.base_url, seeded, args))
+    else:
+        env = dict(os.environ, RATE_LIMIT_ENABLED="false", ASYNC_DB=str(args.async_db).lower())
+        server = start_server(args, env)
+        try:
+            results = asyncio.run(load(f"http://127.0.0.1:{args.port}", seeded, args))
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--users", type=int, default=None, help="по умолчанию - по одному на виртуального пользователя")
+    parser.add_argument("--ads-per-user", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--password-hash", choices=PASSWORD_HASHES, default="current")
+    parser.add_argument("--database-url", default=None, help="по умолчанию - временная SQLite")
+    parser.add_argument("--base-url", default=None, help="уже запущенный сервер на --database-url")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn"), default="uvicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--async-db", action="store_true")
+    parser.add_argument("--port", type=int, default=8770)
+    parser.add_argument("--output", default=None, help="дополнительно записать JSON в файл")
+    parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+    if args.users is None:
+        args.users = args.concurrency
+    if args.users < args.concurrency:
+        parser.error("--users must be at least --concurrency: each virtual user owns a seeded user")
+    if args.base_url and not args.database_url:
+        parser.error("--base-url needs --database-url of that server for seeding")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # DATABASE_URL задаем до импорта app: его читают и сидер, и запущенный сервер
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tmp}/bench.db"
+        results = run(args)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+        "config": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "mix": args.mix,
+            "users": args.users,
+            "ads_per_user": args.ads_per_user,
+            "password_hash": args.password_hash,
+            "server": "external" if args.base_url else args.server,
+            "workers": args.workers,
+            "async_db": args.async_db,
+        },
+        **results,
+    }
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            report["vs_baseline"] = compare(report, json.load(baseline))
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
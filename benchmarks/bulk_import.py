@@ -0,0 +1,57 @@
+"""Скорость загрузки объявлений: POST /advertisement/ на каждое против POST /advertisement/bulk (NDJSON).
+
+Запуск: python -m benchmarks.bulk_import [--rows 2000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+
+def run(rows: int) -> dict:
+    from fastapi.testclient import TestClient
+    from app.server import app
+
+    payloads = [{"title": f"товар {i}", "description": "импорт", "price": i} for i in range(rows)]
+    with TestClient(app) as client:
+        client.post("/user/", json={"username": "bench", "email": "bench@example.com", "password": "bench"})
+        token = client.post("/auth/login", data={"username": "bench", "password": "bench"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        started = time.perf_counter()
+        for payload in payloads:
+            client.post("/advertisement/", json=payload, headers=headers)
+        single = time.perf_counter() - started
+
+        body = "\n".join(json.dumps(payload, ensure_ascii=False) for payload in payloads).encode()
+        started = time.perf_counter()
+        result = client.post(
+            "/advertisement/bulk", content=body,
+            headers={**headers, "Content-Type": "application/x-ndjson"}
+        ).json()
+        bulk = time.perf_counter() - started
+        assert result["created"] == rows, result
+
+        started = time.perf_counter()
+        exported = sum(1 for _ in client.get("/advertisement/export", headers=headers).iter_lines())
+        export = time.perf_counter() - started
+
+    return {
+        "rows": rows,
+        "per_request_rows_per_s": round(rows / single),
+        "bulk_rows_per_s": round(rows / bulk),
+        "export_rows_per_s": round(exported / export),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        # Замеряем пропускную способность, а не лимит на создание объявлений
+        os.environ["RATE_LIMIT_ENABLED"] = "false"
+        print(json.dumps(run(args.rows), indent=2))
@@ -0,0 +1,175 @@
+"""Проверка планов горячих запросов к advertisements и users.
+
+Выполняет функции crud, перехватывает отправленный в БД SQL и запускает для него
+EXPLAIN. Завершается с кодом 1, если запрос не использует ожидаемый индекс, читает
+таблицу полным сканом или (там, где порядок должен давать индекс) сортирует результат
+отдельным шагом.
+Входит в тесты: tests/test_explain_plans.py.
+
+Запуск: python -m benchmarks.explain_plans [--rows 5000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import uuid
+from sqlalchemy import event, text
+
+FULL_SCAN = {
+    "sqlite": re.compile(r"^SCAN advertisements$", re.MULTILINE),
+    "postgresql": re.compile(r"Seq Scan on advertisements"),
+}
+SORT = {
+    "sqlite": re.compile(r"USE TEMP B-TREE FOR ORDER BY"),
+    "postgresql": re.compile(r"^\s*(->\s+)?Sort\b", re.MULTILINE),
+}
+CATEGORIES = ("electronics", "furniture", "transport", "other")
+
+
+def hot_queries(crud, context: dict) -> dict:
+    """Имя -> (вызов crud, ожидаемый индекс, допустима ли отдельная сортировка)."""
+    from app import views
+
+    author_id = context["author_id"]
+    return {
+        "user advertisements": (
+            lambda db: crud.get_user_advertisements(db, author_id), "ix_advertisements_author_id_created_at", False
+        ),
+        "export by author": (
+            lambda db: list(crud.iter_advertisements(db, author_id)), "ix_advertisements_author_id_created_at", False
+        ),
+        # Вход по имени: уникальный частичный индекс живых пользователей
+        "user by username": (
+            lambda db: crud.get_user_by_username(db, context["username"]), "uq_users_live_username", False
+        ),
+        "get advertisement": (
+            lambda db: crud.get_advertisement_by_id(db, context["advertisement_id"]), None, False
+        ),
+        "search first page": (
+            lambda db: crud.get_advertisements_page(db, 20), "ix_advertisements_live_created_at_id", False
+        ),
+        "search next page": (
+            lambda db: crud.get_advertisements_page(db, 20, cursor=context["cursor"]),
+            "ix_advertisements_live_created_at_id", False
+        ),
+        # В шарде несколько категорий: выдача категории идет по своему индексу, без сортировки
+        "search in category": (
+            lambda db: crud.get_advertisements_page(db, 20, category=context["category"]),
+            "ix_advertisements_live_category_created_at_id", False
+        ),
+        # Статистика без фильтров: min/max читаются с краев индекса цены
+        "price stats": (lambda db: crud.get_price_stats(db), "ix_advertisements_live_price", False),
+        # Узкий диапазон цен: индекс отбирает малую часть строк, сортировать их дешевле, чем идти по created_at
+        "price range": (
+            lambda db: crud.get_advertisements(db, min_price=10, max_price=11), "ix_advertisements_live_price", True
+        ),
+        # Кандидаты рейтинга популярных: с конца индекса просмотров, без сортировки таблицы
+        "popular candidates": (
+            lambda db: views.load_ranking(views.counter.ranking), "ix_advertisements_live_view_count", False
+        ),
+    }
+
+
+def seed(engine, rows: int) -> dict:
+    from app import crud, models
+    from app.database import SessionLocal
+
+    authors = [uuid.uuid4() for _ in range(max(rows // 50, 1))]
+    with SessionLocal() as db:
+        # Авторы - настоящие пользователи: author_id ссылается на users.id
+        db.execute(models.User.__table__.insert(), [
+            {"id": author, "username": f"author {i}", "email": f"author{i}@example.com", "hashed_password": "-"}
+            for i, author in enumerate(authors)
+        ])
+        db.execute(models.Advertisement.__table__.insert(), [
+            {
+                "id": uuid.uuid4(),
+                "title": f"item {i}",
+                "price": round(random.uniform(1, 1000), 2),
+                "author_id": random.choice(authors),
+                "category": random.choice(CATEGORIES),
+            }
+            for i in range(rows)
+        ])
+        db.commit()
+        _, cursor = crud.get_advertisements_page(db, 20)
+        advertisement_id = db.query(models.Advertisement.id).first()[0]
+    with engine.begin() as conn:
+        # Статистика для планировщика, как на рабочей БД
+        conn.execute(text("ANALYZE"))
+    return {
+        "author_id": authors[0], "username": "author 0", "advertisement_id": advertisement_id, "cursor": cursor,
+        "category": CATEGORIES[0],
+    }
+
+
+def explain(conn, statement: str, parameters) -> str:
+    if conn.dialect.name == "postgresql":
+        # На маленькой таблице Postgres выбирает Seq Scan и при наличии индекса
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).all()
+        return "\n".join(row[0] for row in rows)
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def run(rows: int) -> dict:
+    from app import crud
+    from app.database import SessionLocal, create_tables, engine
+
+    create_tables()
+    context = seed(engine, rows)
+    full_scan = FULL_SCAN[engine.dialect.name]
+    sort = SORT[engine.dialect.name]
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    results = {}
+    for name, (query, index, allow_sort) in hot_queries(crud, context).items():
+        captured.clear()
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            with SessionLocal() as db:
+                query(db)
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+
+        with engine.connect() as conn:
+            plans = [
+                explain(conn, statement, parameters)
+                for statement, parameters in captured
+                if statement.lstrip().upper().startswith("SELECT")
+            ]
+        plan = "\n".join(plans)
+        problems = []
+        if full_scan.search(plan):
+            problems.append("full scan")
+        if index is not None and index not in plan:
+            problems.append(f"{index} not used")
+        if not allow_sort and sort.search(plan):
+            problems.append("sort outside index")
+        results[name] = (plan, problems)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/explain.db")
+        results = run(args.rows)
+
+    failed = False
+    for name, (plan, problems) in results.items():
+        failed |= bool(problems)
+        print(f"{name:<24} {'BAD PLAN: ' + ', '.join(problems) if problems else 'ok'}")
+        for line in plan.splitlines():
+            print(f"    {line}")
+    sys.exit(1 if failed else 0)
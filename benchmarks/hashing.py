@@ -0,0 +1,50 @@
+"""Пропускная способность проверки паролей (узкое место логина) в зависимости от числа процессов пула.
+
+Запуск: python -m benchmarks.hashing [--workers 1 2 4] [--logins 200] [--clients 32]
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app import hashing
+from app.config import settings
+
+
+def measure(workers: int, logins: int, clients: int) -> dict:
+    service = hashing.HashingService(workers, max_pending=logins)
+    service.start()
+    hashed = hashing.hash_password("benchmark-password")
+    # Прогрев: процессы пула должны успеть запуститься
+    service.run(hashing.verify_password, "benchmark-password", hashed)
+
+    started = time.perf_counter()
+    # Потоки изображают потоки веб-сервера, которые ждут результат проверки пароля
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(
+            lambda _: service.run(hashing.verify_password, "benchmark-password", hashed), range(logins)
+        ))
+    elapsed = time.perf_counter() - started
+    service.shutdown()
+
+    assert all(results)
+    return {"workers": workers, "logins_per_s": round(logins / elapsed, 1)}
+
+
+if __name__ == "__main__":
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({0, 1, 2, cpus, cpus * 2}))
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=32)
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "cpu_count": cpus,
+        "argon2": {
+            "time_cost": settings.argon2_time_cost,
+            "memory_cost": settings.argon2_memory_cost,
+            "parallelism": settings.argon2_parallelism,
+        },
+        "results": [measure(workers, args.logins, args.clients) for workers in args.workers],
+    }, indent=2))
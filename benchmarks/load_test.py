@@ -0,0 +1,117 @@
+"""Нагрузочный тест чтения: sync- и async-режим (ASYNC_DB) при большом числе соединений.
+
+Поднимает uvicorn на временной SQLite-базе в каждом режиме, наполняет данными
+через API и держит --concurrency одновременных запросов в течение --duration секунд.
+
+Запуск: python -m benchmarks.load_test [--concurrency 500] [--duration 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def seed(client: httpx.AsyncClient, ads: int):
+    await client.post("/user/", json={"username": "bench", "email": "bench@example.com", "password": "bench"})
+    token = (await client.post("/auth/login", data={"username": "bench", "password": "bench"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    ids = []
+    for i in range(ads):
+        response = await client.post(
+            "/advertisement/", headers=headers,
+            json={"title": f"bench ad {i}", "description": "load test", "price": i}
+        )
+        ids.append(response.json()["id"])
+    return ids
+
+
+async def worker(client: httpx.AsyncClient, ids, deadline: float, latencies, errors):
+    rng = random.Random()
+    while time.monotonic() < deadline:
+        if rng.random() < 0.8:
+            url, params = f"/advertisement/{rng.choice(ids)}", None
+        else:
+            url, params = "/advertisement/", {"limit": 20}
+        started = time.perf_counter()
+        try:
+            response = await client.get(url, params=params)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+
+async def load(base_url: str, concurrency: int, duration: float, ads: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await wait_ready(client)
+        ids = await seed(client, ads)
+        latencies, errors = [], []
+        started = time.monotonic()
+        await asyncio.gather(*(
+            worker(client, ids, started + duration, latencies, errors) for _ in range(concurrency)
+        ))
+        elapsed = time.monotonic() - started
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def run_mode(async_db: bool, port: int, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ, ASYNC_DB=str(async_db).lower(), DATABASE_URL=f"sqlite:///{tmp}/bench.db",
+            RATE_LIMIT_ENABLED="false"
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.server:app", "--port", str(port), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            return asyncio.run(load(f"http://127.0.0.1:{port}", args.concurrency, args.duration, args.ads))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--ads", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = {
+        "sync": run_mode(False, args.port, args),
+        "async": run_mode(True, args.port + 1, args),
+    }
+    print(json.dumps({"concurrency": args.concurrency, "duration_s": args.duration, **results}, indent=2))
@@ -0,0 +1,138 @@
+"""Соединения из пула на один запрос: сколько раз запрос брал соединение и сколько держал одновременно.
+
+Прогоняет сценарии в sync- и async-режиме (ASYNC_DB) на временной SQLite без реплики,
+с холодным кешем авторизации (худший случай: зависимость авторизации тоже идет в БД).
+Завершается с кодом 1, если число выдач соединений превышает бюджет.
+
+Запуск: python -m benchmarks.pool_checkouts
+"""
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from sqlalchemy import event
+from benchmarks.query_budget import wait_outbox
+
+# Сценарий -> бюджет выдач соединения из пула
+BUDGETS = {
+    "health": 0,
+    "get advertisement, anonymous": 1,
+    "get advertisement, cached response, anonymous": 0,
+    "get advertisement, authenticated": 1,     # авторизация и обработчик - одна сессия
+    "search, authenticated": 1,
+    "get user, authenticated": 1,
+    "batch advertisements + authors": 1,   # оба запроса IN - в сессии авторизации
+    "create advertisement": 1,
+    "create advertisement, invalid token": 0,
+    "login": 1,
+    "refresh token": 1,      # проверка пользователя и отзыв старого refresh-токена - одна транзакция
+}
+
+
+class CheckoutCounter:
+    def __init__(self, pool):
+        self.checkouts = 0
+        self.held = 0
+        self.peak = 0
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+
+    # Считаем только соединения, взятые внутри HTTP-запроса: фоновые задачи (outbox, просмотры) не в счет
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        from app import metrics
+
+        if metrics._request_stats.get() is None:
+            return
+        connection_record.info["pool_checkouts_counted"] = True
+        self.checkouts += 1
+        self.held += 1
+        self.peak = max(self.peak, self.held)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        if connection_record.info.pop("pool_checkouts_counted", False):
+            self.held -= 1
+
+    @contextlib.contextmanager
+    def measure(self, results: dict, name: str):
+        from app import cache
+
+        cache.principal_cache.clear()
+        started, self.peak = self.checkouts, self.held
+        yield
+        results[name] = {"checkouts": self.checkouts - started, "peak_held": self.peak}
+
+
+def run() -> dict:
+    from fastapi.testclient import TestClient
+    from app import response_cache
+    from app.database import async_engine, engine
+    from app.server import app
+
+    counter = CheckoutCounter(async_engine.sync_engine.pool if async_engine is not None else engine.pool)
+    results = {}
+    with TestClient(app) as client:
+        user_id = client.post(
+            "/user/", json={"username": "pool", "email": "pool@example.com", "password": "p"}
+        ).json()["id"]
+        tokens = client.post("/auth/login", data={"username": "pool", "password": "p"}).json()
+        token = tokens["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        ad_id = client.post("/advertisement/", json={"title": "pool", "price": 1}, headers=headers).json()["id"]
+        wait_outbox()
+
+        with counter.measure(results, "health"):
+            client.get("/health")
+        response_cache.responses.clear()
+        with counter.measure(results, "get advertisement, anonymous"):
+            client.get(f"/advertisement/{ad_id}")
+        with counter.measure(results, "get advertisement, cached response, anonymous"):
+            client.get(f"/advertisement/{ad_id}")
+        response_cache.responses.clear()
+        with counter.measure(results, "get advertisement, authenticated"):
+            client.get(f"/advertisement/{ad_id}", headers=headers)
+        with counter.measure(results, "search, authenticated"):
+            client.get("/advertisement/", params={"limit": 20, "title": "pool"}, headers=headers)
+        with counter.measure(results, "get user, authenticated"):
+            client.get(f"/user/{user_id}", headers=headers)
+        with counter.measure(results, "batch advertisements + authors"):
+            client.post("/advertisement/batch", json={"ids": [ad_id], "include_author": True}, headers=headers)
+        with counter.measure(results, "create advertisement"):
+            client.post("/advertisement/", json={"title": "pool 2", "price": 2}, headers=headers)
+        with counter.measure(results, "create advertisement, invalid token"):
+            client.post(
+                "/advertisement/", json={"title": "pool 3", "price": 3}, headers={"Authorization": "Bearer x.y.z"}
+            )
+        with counter.measure(results, "login"):
+            client.post("/auth/login", data={"username": "pool", "password": "p"})
+        with counter.measure(results, "refresh token"):
+            client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    return results
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/pool.db"
+            print(json.dumps(run()))
+        sys.exit(0)
+
+    failed = False
+    for mode in ("sync", "async"):
+        env = dict(
+            os.environ, ASYNC_DB=str(mode == "async").lower(), RATE_LIMIT_ENABLED="false", PYTHONWARNINGS="ignore"
+        )
+        env.pop("DATABASE_READ_URL", None)
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.pool_checkouts", "--child"],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        results = json.loads(output.strip().splitlines()[-1])
+        print(f"[{mode}]")
+        for name, budget in BUDGETS.items():
+            used = results[name]
+            status = "ok" if used["checkouts"] <= budget else "OVER BUDGET"
+            failed |= used["checkouts"] > budget
+            print(f"{name:<48} {used['checkouts']:>2} / {budget:<2} peak held {used['peak_held']}  {status}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,141 @@
+"""Бюджет SQL-запросов на каждый эндпоинт.
+
+Считает выражения, отправленные в БД за один запрос, и завершается с кодом 1,
+если какой-то эндпоинт превысил бюджет. Входит в тесты: tests/test_query_budget.py.
+
+Запуск: python -m benchmarks.query_budget
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import time
+from sqlalchemy import event
+
+# (метод, путь, бюджет). Бюджеты - для прогретого кеша авторизации (app/cache.py)
+BUDGETS = {
+    "create user": 1,               # INSERT ... RETURNING
+    "duplicate user": 1,            # INSERT, нарушение UNIQUE
+    "login": 1,                     # SELECT пользователя
+    "create advertisement": 3,      # INSERT ... RETURNING + событие outbox + сводка цен
+    "get advertisement": 1,         # SELECT
+    "get advertisement (cached)": 0,
+    "search": 1,
+    "search (cached)": 0,
+    "price stats": 2,               # сводка цен + min/max по индексу
+    "price stats (filtered)": 1,    # один GROUP BY
+    "popular advertisements": 1,    # рейтинг в памяти + SELECT ... WHERE id IN
+    "batch advertisements": 1,      # SELECT ... WHERE id IN
+    "batch advertisements + authors": 2,    # + SELECT users ... WHERE id IN, без N+1
+    "batch users": 1,
+    "update advertisement price": 3,   # SELECT + UPDATE + сводка цен
+    "update advertisement title": 3,   # SELECT + UPDATE + событие outbox (FTS обновит фоновая задача)
+    "delete advertisement": 3,      # SELECT + UPDATE deleted_at ... RETURNING + сводка цен
+    "update user": 1,               # UPDATE ... RETURNING
+    "delete user": 1,               # UPDATE deleted_at ... RETURNING
+}
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        from app import metrics
+
+        # Только запросы внутри HTTP-запроса: фоновые задачи (очистка, просмотры) в бюджет не входят
+        if metrics._request_stats.get() is not None:
+            self.count += 1
+
+    @contextlib.contextmanager
+    def measure(self, results: dict, name: str):
+        started = self.count
+        yield
+        results[name] = self.count - started
+
+
+def wait_outbox(timeout: float = 10):
+    from app import outbox
+
+    deadline = time.monotonic() + timeout
+    while outbox.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def run() -> dict:
+    from fastapi.testclient import TestClient
+    from app import views
+    from app.database import engine
+    from app.server import app
+
+    counter = StatementCounter(engine)
+    results = {}
+    with TestClient(app) as client:
+        with counter.measure(results, "create user"):
+            user_id = client.post(
+                "/user/", json={"username": "budget", "email": "budget@example.com", "password": "p"}
+            ).json()["id"]
+        with counter.measure(results, "duplicate user"):
+            assert client.post(
+                "/user/", json={"username": "budget", "email": "other@example.com", "password": "p"}
+            ).status_code == 400
+        with counter.measure(results, "login"):
+            token = client.post("/auth/login", data={"username": "budget", "password": "p"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        # Прогреваем кеш авторизации, чтобы бюджеты не зависели от порядка сценариев
+        client.get("/advertisement/", headers=headers)
+
+        with counter.measure(results, "create advertisement"):
+            ad_id = client.post("/advertisement/", json={"title": "budget", "price": 1}, headers=headers).json()["id"]
+        # Индексация из outbox сбрасывает кеш ответов - ждем ее, чтобы она не попала в сценарии с кешем
+        wait_outbox()
+        with counter.measure(results, "get advertisement"):
+            client.get(f"/advertisement/{ad_id}", headers=headers)
+        with counter.measure(results, "get advertisement (cached)"):
+            client.get(f"/advertisement/{ad_id}", headers=headers)
+        with counter.measure(results, "search"):
+            client.get("/advertisement/", params={"limit": 20}, headers=headers)
+        with counter.measure(results, "search (cached)"):
+            client.get("/advertisement/", params={"limit": 20}, headers=headers)
+        with counter.measure(results, "price stats"):
+            client.get("/advertisement/stats", headers=headers)
+        with counter.measure(results, "price stats (filtered)"):
+            client.get("/advertisement/stats", params={"min_price": 1}, headers=headers)
+        # Просмотры выше попадают в рейтинг при сбросе буфера (в обычной работе - фоновой задачей)
+        views.flush(views.counter.buffer, views.counter.ranking, 100)
+        with counter.measure(results, "popular advertisements"):
+            client.get("/advertisement/popular", headers=headers)
+        with counter.measure(results, "batch advertisements"):
+            client.post("/advertisement/batch", json={"ids": [ad_id]}, headers=headers)
+        with counter.measure(results, "batch advertisements + authors"):
+            client.post("/advertisement/batch", json={"ids": [ad_id], "include_author": True}, headers=headers)
+        with counter.measure(results, "batch users"):
+            client.post("/user/batch", json={"ids": [user_id]}, headers=headers)
+        with counter.measure(results, "update advertisement price"):
+            client.patch(f"/advertisement/{ad_id}", json={"price": 2}, headers=headers)
+        with counter.measure(results, "update advertisement title"):
+            client.patch(f"/advertisement/{ad_id}", json={"title": "renamed"}, headers=headers)
+        with counter.measure(results, "delete advertisement"):
+            client.delete(f"/advertisement/{ad_id}", headers=headers)
+        with counter.measure(results, "update user"):
+            client.patch(f"/user/{user_id}", json={"email": "new@example.com"}, headers=headers)
+        # После update кеш авторизации сброшен - прогреваем снова
+        client.get("/advertisement/", headers=headers)
+        with counter.measure(results, "delete user"):
+            client.delete(f"/user/{user_id}", headers=headers)
+    return results
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/budget.db"
+        results = run()
+
+    failed = False
+    for name, budget in BUDGETS.items():
+        used = results[name]
+        status = "ok" if used <= budget else "OVER BUDGET"
+        failed |= used > budget
+        print(f"{name:<32} {used:>3} / {budget:<3} {status}")
+    sys.exit(1 if failed else 0)
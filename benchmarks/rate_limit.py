@@ -0,0 +1,74 @@
+"""Накладные расходы RateLimitMiddleware на запрос.
+
+Вызывает middleware напрямую с пустым ASGI-приложением и сравнивает с вызовом
+приложения без него. Завершается с кодом 1, если добавка превышает бюджет.
+
+Запуск: python -m benchmarks.rate_limit [--requests 200000] [--budget-us 50]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+BUDGET_US = 50
+
+
+async def _app(scope, receive, send):
+    pass
+
+
+async def _noop(*args):
+    pass
+
+
+def scope(method: str, path: str, client: str, token: str = None) -> dict:
+    headers = [(b"host", b"bench"), (b"user-agent", b"bench")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return {"type": "http", "method": method, "path": path, "client": (client, 50000), "headers": headers}
+
+
+async def per_request_us(app, scopes, requests: int) -> float:
+    started = time.perf_counter()
+    for i in range(requests):
+        await app(scopes[i % len(scopes)], _noop, _noop)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def run(requests: int) -> dict:
+    from app import rate_limit
+    from app.auth import create_access_token
+
+    # Лимиты заведомо большие: замеряем путь разрешенного запроса, а не отказы
+    rules = {
+        ("POST", "/auth/login"): rate_limit.Rule("login", rate_limit.KEY_IP, 1e9, 1e9),
+        ("POST", "/advertisement/"): rate_limit.Rule("create_advertisement", rate_limit.KEY_USER, 1e9, 1e9),
+    }
+    middleware = rate_limit.RateLimitMiddleware(_app, backend=rate_limit.MemoryBackend(), rules=rules)
+    token = create_access_token({"sub": "6f1c7c4e-5a53-4f7e-9d0b-0b3f5f6b8c11"})
+    scenarios = {
+        "unlimited route": [scope("GET", "/advertisement/", "10.0.0.1")],
+        "ip key": [scope("POST", "/auth/login", "10.0.0.1")],
+        "ip key, 10k clients": [scope("POST", "/auth/login", f"10.0.{i // 256}.{i % 256}") for i in range(10000)],
+        "user key (jwt sub)": [scope("POST", "/advertisement/", "10.0.0.1", token)],
+    }
+
+    baseline = await per_request_us(_app, scenarios["unlimited route"], requests)
+    results = {}
+    for name, scopes in scenarios.items():
+        # Прогрев: создание корзин и кеш токена
+        await per_request_us(middleware, scopes, len(scopes))
+        results[name] = round(await per_request_us(middleware, scopes, requests) - baseline, 2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--budget-us", type=float, default=BUDGET_US)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.requests))
+    print(json.dumps({"overhead_us_per_request": results, "budget_us": args.budget_us}, indent=2))
+    sys.exit(1 if max(results.values()) > args.budget_us else 0)
@@ -0,0 +1,78 @@
+"""Задержка поиска по title: ilike против FTS5 в зависимости от числа объявлений.
+
+Запуск: python -m benchmarks.search_fts [--sizes 1000 10000 100000]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app import crud, models, search
+from app.database import Base
+
+# Словарь большой, поэтому каждое слово встречается редко - как названия товаров в реальном каталоге
+_rng = random.Random(42)
+WORDS = ["".join(_rng.choices("абвгдеклмнопрстxyzwq", k=_rng.randint(5, 9))) for _ in range(20000)]
+QUERIES = _rng.sample(WORDS, 5)
+
+
+def seed(engine, rows: int):
+    rng = random.Random(rows)
+    batch = []
+    with engine.begin() as conn:
+        for _ in range(rows):
+            batch.append({
+                "id": uuid.uuid4(),
+                "title": " ".join(rng.sample(WORDS, 3)),
+                "description": " ".join(rng.choices(WORDS, k=12)),
+                "price": rng.uniform(100, 100000),
+                "author_id": uuid.uuid4(),
+            })
+            if len(batch) == 5000:
+                conn.execute(insert(models.Advertisement), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(models.Advertisement), batch)
+
+
+def measure(session_factory, repeats: int) -> float:
+    timings = []
+    with session_factory() as db:
+        for _ in range(repeats):
+            for term in QUERIES:
+                started = time.perf_counter()
+                crud.get_advertisements_page(db, 20, title=term)
+                timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def run(sizes, repeats: int):
+    print(f"{'rows':>10} {'ilike, ms':>12} {'fts5, ms':>12} {'speedup':>9}")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            Base.metadata.create_all(bind=engine)
+            seed(engine, rows)
+            session_factory = sessionmaker(bind=engine)
+
+            search.backend = None
+            ilike_ms = measure(session_factory, repeats)
+
+            if search.setup(engine) != search.FTS5:
+                raise SystemExit("SQLite is built without FTS5")
+            fts_ms = measure(session_factory, repeats)
+
+            print(f"{rows:>10} {ilike_ms:>12.2f} {fts_ms:>12.2f} {ilike_ms / fts_ms:>8.1f}x")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.repeats)
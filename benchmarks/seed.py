@@ -0,0 +1,115 @@
+"""Наполнение БД для бенчмарков: N пользователей и M объявлений на каждого.
+
+Пишет напрямую в БД из DATABASE_URL (SQLite или Postgres) пачками через crud -
+вместе с полнотекстовым индексом и сводкой цен, как при импорте через API. Категории
+объявлений чередуются: с DATABASE_SHARDS/SHARD_CATEGORIES объявления расходятся по шардам.
+У всех пользователей один пароль, хеш считается один раз. --password-hash задает схему хеша:
+старые схемы и argon2 с прежними параметрами приложение пересчитывает при входе.
+
+Запуск: DATABASE_URL=... python -m benchmarks.seed [--users 100] [--ads-per-user 50]
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+
+PASSWORD = "bench-password"
+WORDS = ("lamp", "sofa", "bike", "phone", "laptop", "table", "chair", "camera", "guitar", "watch")
+CATEGORIES = ("electronics", "furniture", "transport", "other")
+PASSWORD_HASHES = ("current", "argon2-old", "pbkdf2_sha256")
+
+
+def username(index: int) -> str:
+    return f"bench{index}"
+
+
+def password_hash(scheme: str = "current") -> str:
+    from app import auth
+
+    if scheme == "current":
+        return auth.get_password_hash(PASSWORD)
+    from passlib.hash import argon2, pbkdf2_sha256
+
+    if scheme == "argon2-old":
+        return argon2.using(time_cost=1, memory_cost=65536, parallelism=4).hash(PASSWORD)
+    return pbkdf2_sha256.hash(PASSWORD)
+
+
+def seed(users: int, ads_per_user: int, seed_value: int = 0, scheme: str = "current") -> dict:
+    """Возвращает {"users": [{"username", "id", "ads": [id, ...]}]} для генератора нагрузки."""
+    from sqlalchemy import insert, select
+    from app import crud, models, outbox, schemas
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.lifespan import setup_schema
+
+    setup_schema()
+    rng = random.Random(seed_value)
+    hashed_password = password_hash(scheme)
+    with SessionLocal() as db:
+        # Повторный запуск дописывает новых пользователей после уже созданных
+        start = db.query(models.User).filter(models.User.username.like("bench%")).count()
+        rows = [
+            {
+                "id": uuid.uuid4(),
+                "username": username(index),
+                "email": f"{username(index)}@example.com",
+                "hashed_password": hashed_password,
+            }
+            for index in range(start, start + users)
+        ]
+        if rows:
+            db.execute(insert(models.User), rows)
+            db.commit()
+
+        per_batch = max(1, settings.bulk_batch_size)
+        for row in rows:
+            advertisements = [
+                schemas.AdvertisementCreate(
+                    title=f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}",
+                    description=f"{rng.choice(WORDS)} in good condition",
+                    price=round(rng.lognormvariate(5, 1.5), 2),
+                    category=CATEGORIES[i % len(CATEGORIES)],
+                )
+                for i in range(ads_per_user)
+            ]
+            for offset in range(0, len(advertisements), per_batch):
+                crud.bulk_create_advertisements(db, advertisements[offset:offset + per_batch], row["id"])
+        # Полнотекстовый индекс строится из outbox фоновой задачей; сид заполняет его сразу,
+        # чтобы поиск работал и до запуска сервера
+        outbox.drain()
+
+        ads = {}
+        author_ids = [row["id"] for row in rows]
+        for offset in range(0, len(author_ids), 500):
+            query = select(models.Advertisement.id, models.Advertisement.author_id).where(
+                models.Advertisement.author_id.in_(author_ids[offset:offset + 500])
+            )
+            for advertisement_id, author_id in db.execute(query):
+                ads.setdefault(author_id, []).append(advertisement_id)
+
+    return {
+        "users": [
+            {"username": row["username"], "id": row["id"], "ads": ads.get(row["id"], [])}
+            for row in rows
+        ],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--ads-per-user", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--password-hash", choices=PASSWORD_HASHES, default="current")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = seed(args.users, args.ads_per_user, args.seed, args.password_hash)
+    print(json.dumps({
+        "users": len(result["users"]),
+        "advertisements": sum(len(user["ads"]) for user in result["users"]),
+        "password": PASSWORD,
+        "seconds": round(time.perf_counter() - started, 2),
+    }, indent=2))
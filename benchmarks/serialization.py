@@ -0,0 +1,97 @@
+"""Сериализация больших ответов поиска: CPU и пиковая память на 1k/10k строк.
+
+Сравниваются (чтение из БД + кодирование в JSON):
+  response_model - ORM-объекты, модель pydantic на строку, jsonable_encoder + json.dumps
+                   (путь FastAPI при response_model=List[AdvertisementResponse])
+  pydantic_json  - ORM-объекты, TypeAdapter.dump_json (прежний путь кеша ответов)
+  orjson_rows    - кортежи колонок (as_rows=True) и orjson (текущий путь)
+
+Запуск: python -m benchmarks.serialization [--rows 1000 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import List
+
+
+def measure(fn, repeat: int) -> dict:
+    cpu = []
+    for _ in range(repeat):
+        started = time.process_time()
+        fn()
+        cpu.append(time.process_time() - started)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms": round(statistics.median(cpu) * 1000, 1), "peak_kib": round(peak / 1024)}
+
+
+def run(sizes: List[int], repeat: int) -> dict:
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from app import crud, models, response_cache, schemas
+    from app.database import SessionLocal, create_tables
+
+    create_tables()
+    adapter = TypeAdapter(List[schemas.AdvertisementResponse])
+    author_id = uuid.uuid4()
+    with SessionLocal() as db:
+        db.execute(models.User.__table__.insert(), [
+            {"id": author_id, "username": "author", "email": "author@example.com", "hashed_password": "-"}
+        ])
+        db.commit()
+    results = {}
+    seeded = 0
+    for rows in sorted(sizes):
+        with SessionLocal() as db:
+            db.execute(models.Advertisement.__table__.insert(), [
+                {
+                    "id": uuid.uuid4(),
+                    "title": f"товар {i}",
+                    "description": "описание объявления для замера сериализации",
+                    "price": i + 0.5,
+                    "author_id": author_id,
+                }
+                for i in range(seeded, rows)
+            ])
+            db.commit()
+        seeded = rows
+
+        def response_model():
+            with SessionLocal() as db:
+                items = crud.get_advertisements(db)
+                validated = [schemas.AdvertisementResponse.model_validate(item) for item in items]
+                return json.dumps(jsonable_encoder(validated)).encode()
+
+        def pydantic_json():
+            with SessionLocal() as db:
+                return adapter.dump_json(adapter.validate_python(crud.get_advertisements(db)))
+
+        def orjson_rows():
+            with SessionLocal() as db:
+                return response_cache.serialize_advertisements(crud.get_advertisements(db, as_rows=True))
+
+        assert json.loads(pydantic_json()) == json.loads(orjson_rows())
+        results[rows] = {
+            "response_model": measure(response_model, repeat),
+            "pydantic_json": measure(pydantic_json, repeat),
+            "orjson_rows": measure(orjson_rows, repeat),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        print(json.dumps(run(args.rows, args.repeat), indent=2))
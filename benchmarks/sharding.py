@@ -0,0 +1,145 @@
+"""Шардирование объявлений по категории (app/sharding.py) на нескольких файлах SQLite.
+
+Для каждого числа шардов из --shards наполняет отдельный набор БД (--rows объявлений,
+категории поровну, категории распределены по шардам по кругу) и измеряет медианную
+задержку вызовов crud: страница категории (один шард), страница и поиск по title без
+категории (все шарды параллельно со слиянием), статистика цен и чтение по id.
+Каждый прогон сверяет первые страницы выдачи без категории со слиянием всех шардов
+напрямую и завершается с кодом 1 при расхождении.
+
+Запуск: python -m benchmarks.sharding [--shards 1 4] [--rows 100000] [--repeats 50]
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+CATEGORIES = ("electronics", "furniture", "transport", "clothes", "books", "garden", "toys", "sport")
+WORDS = ("lamp", "sofa", "bike", "phone", "laptop", "table", "chair", "camera", "guitar", "watch")
+PAGES = 5
+
+
+def shard_env(directory: str, shards: int) -> dict:
+    # Основная БД - шард default, остальные - отдельные файлы; категории по кругу
+    names = ["default"] + [f"shard{i}" for i in range(1, shards)]
+    return {
+        "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'main.db')}",
+        "DATABASE_SHARDS": json.dumps({name: f"sqlite:///{os.path.join(directory, name)}.db" for name in names[1:]}),
+        "SHARD_CATEGORIES": json.dumps({
+            category: shard for category, shard in zip(CATEGORIES, itertools.cycle(names)) if shard != "default"
+        }),
+    }
+
+
+def seed(rows: int):
+    from sqlalchemy import insert
+    from app import crud, models, outbox, schemas
+    from app.database import SessionLocal
+    from app.lifespan import setup_schema
+
+    setup_schema()
+    rng = random.Random(rows)
+    author_id = uuid.uuid4()
+    with SessionLocal() as db:
+        db.execute(insert(models.User), [{
+            "id": author_id, "username": "sharding", "email": "sharding@example.com", "hashed_password": "-"
+        }])
+        db.commit()
+        for offset in range(0, rows, 1000):
+            crud.bulk_create_advertisements(db, [
+                schemas.AdvertisementCreate(
+                    title=f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}",
+                    price=round(rng.lognormvariate(5, 1.5), 2),
+                    category=CATEGORIES[i % len(CATEGORIES)],
+                )
+                for i in range(offset, min(offset + 1000, rows))
+            ], author_id)
+    outbox.drain()
+
+
+def check_order(db) -> bool:
+    # Эталон - все живые (created_at, id) из каждого шарда, отсортированные здесь
+    from sqlalchemy import select
+    from app import crud, models, sharding
+
+    Advertisement = models.Advertisement
+    keys = []
+    for session_factory in sharding.sessionmakers.values():
+        with session_factory() as shard_db:
+            keys += shard_db.execute(
+                select(Advertisement.created_at, Advertisement.id).where(Advertisement.deleted_at.is_(None))
+            ).all()
+    expected = [tuple(key) for key in sorted(keys, reverse=True)[:PAGES * 20]]
+    seen, cursor = [], None
+    for _ in range(PAGES):
+        items, cursor = crud.get_advertisements_page(db, 20, cursor, as_rows=True)
+        seen += [(item.created_at, item.id) for item in items]
+    return seen == expected
+
+
+def median_ms(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def measure(rows: int, repeats: int) -> dict:
+    from app import crud, sharding
+    from app.database import SessionLocal
+
+    seed(rows)
+    with SessionLocal() as db:
+        advertisement_id = crud.get_advertisements_page(db, 1, category=CATEGORIES[-1])[0][0].id
+        calls = {
+            "page in category": lambda: crud.get_advertisements_page(db, 20, category=CATEGORIES[0], as_rows=True),
+            "page, all categories": lambda: crud.get_advertisements_page(db, 20, as_rows=True),
+            "title search, all categories": lambda: crud.get_advertisements_page(db, 20, title="lamp", as_rows=True),
+            "price stats": lambda: crud.get_price_stats(db),
+            "price stats in category": lambda: crud.get_price_stats(db, category=CATEGORIES[0]),
+            "get by id": lambda: crud.get_advertisement_by_id(db, advertisement_id),
+        }
+        results = {name: median_ms(fn, repeats) for name, fn in calls.items()}
+        results["order ok"] = check_order(db)
+    results["shards"] = len(sharding.engines)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Настройки шардов читаются при импорте app - каждый набор БД измеряется в своем процессе
+        print(json.dumps(measure(args.rows, args.repeats)))
+        sys.exit(0)
+
+    runs = []
+    for shards in args.shards:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = subprocess.run(
+                [sys.executable, "-W", "ignore", "-m", "benchmarks.sharding", "--child",
+                 "--rows", str(args.rows), "--repeats", str(args.repeats)],
+                env={**os.environ, **shard_env(tmp, shards)}, check=True, capture_output=True, text=True,
+            ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+
+    names = [name for name in runs[0] if name not in ("order ok", "shards")]
+    print(f"{'ms (median)':<30}" + "".join(f"{str(run['shards']) + ' shards':>12}" for run in runs))
+    for name in names:
+        print(f"{name:<30}" + "".join(f"{run[name]:>12}" for run in runs))
+    print(f"{'merged order matches':<30}" + "".join(f"{str(run['order ok']):>12}" for run in runs))
+    sys.exit(0 if all(run["order ok"] for run in runs) else 1)
@@ -0,0 +1,69 @@
+"""Время импорта app.server - то, что платит каждый воркер без preload.
+
+Запускает несколько чистых интерпретаторов, берет медиану времени `import app.server`
+и разбирает вывод -X importtime: самые тяжелые модули приложения и пакеты верхнего уровня.
+
+Запуск: python -m benchmarks.startup [--runs 5] [--top 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_SNIPPET = "import time; t = time.perf_counter(); import app.server; print(time.perf_counter() - t)"
+
+
+def import_once() -> tuple:
+    env = dict(os.environ, PYTHONPATH=os.getcwd(), PYTHONWARNINGS="ignore")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _SNIPPET],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    # Строки вида "import time:  self [us] | cumulative | name" (вложенность - отступом в имени)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split("|")
+        modules.append((name.rstrip(), int(self_us.split(":")[1]), int(cumulative_us)))
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+
+def hotspots(modules, top: int) -> dict:
+    own = sorted(
+        (m for m in modules if m[0].strip().startswith("app")), key=lambda m: m[1], reverse=True
+    )[:top]
+    # Строка пакета верхнего уровня: ее cumulative - цена зависимости целиком
+    packages = {}
+    for name, _, cumulative in modules:
+        root = name.strip().split(".")[0]
+        if root != "app" and name.strip() == root:
+            packages[root] = max(packages.get(root, 0), cumulative)
+    return {
+        "app_modules_self_ms": {m[0].strip(): round(m[1] / 1000, 1) for m in own},
+        "packages_cumulative_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    timings, modules = [], []
+    for _ in range(args.runs):
+        elapsed, modules = import_once()
+        timings.append(elapsed)
+    print(json.dumps({
+        "import_app_server_ms": {
+            "median": round(statistics.median(timings) * 1000, 1),
+            "min": round(min(timings) * 1000, 1),
+        },
+        **hotspots(modules, args.top),
+    }, indent=2))
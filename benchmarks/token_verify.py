@@ -0,0 +1,63 @@
+"""Стоимость проверки access-токена на запрос.
+
+- verify (cold): полная проверка подписи и срока - первый запрос с новым токеном
+- decode_token (cached): путь зависимостей авторизации для уже виденного токена
+- invalid signature: отказ по подделанному токену
+- revocation check: проверка jti по блум-фильтру отозванных (после нового отзыва кеш перепроверяет токены)
+Завершается с кодом 1, если путь с кешем дороже бюджета.
+
+Запуск: python -m benchmarks.token_verify [--tokens 2000] [--rounds 20] [--budget-us 10]
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import uuid
+
+BUDGET_US = 10
+
+
+def per_call_us(fn, items, rounds: int) -> float:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for item in items:
+            fn(item)
+        timings.append((time.perf_counter() - started) / len(items) * 1e6)
+    return round(statistics.median(timings), 2)
+
+
+def run(count: int, rounds: int) -> dict:
+    from app import cache, tokens
+    from app.auth import create_access_token, verify_token
+    from app.dependencies import decode_token
+
+    issued = [create_access_token({"sub": str(uuid.uuid4()), "group": "user"}) for _ in range(count)]
+    assert all(decode_token(token) for token in issued)
+    # Подпись заменена на подпись другого токена: формат верный, проверка - нет
+    forged = [token.rsplit(".", 1)[0] + "." + issued[0].rsplit(".", 1)[1] for token in issued[1:]]
+    results = {
+        "verify_cold_us": per_call_us(verify_token, issued, rounds),
+        "decode_token_cached_us": per_call_us(decode_token, issued, rounds),
+        "invalid_signature_us": per_call_us(verify_token, forged, rounds),
+    }
+    # Фильтр с отозванными токенами, проверяются неотозванные - путь без БД
+    for _ in range(tokens.revocations.capacity // 10):
+        tokens.revocations.filter.add(uuid.uuid4().hex)
+    jtis = [verify_token(token)["jti"] for token in issued]
+    results["revocation_check_us"] = per_call_us(tokens.revocations.is_revoked, jtis, rounds)
+    cache.token_cache.clear()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--budget-us", type=float, default=BUDGET_US)
+    args = parser.parse_args()
+
+    results = run(args.tokens, args.rounds)
+    print(json.dumps({**results, "budget_us": args.budget_us}, indent=2))
+    sys.exit(1 if results["decode_token_cached_us"] > args.budget_us else 0)
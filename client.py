@@ -1,21 +1,40 @@
 import requests
 import json
+import uuid
 
 BASE_URL = "http://localhost:8000"
+USERNAME = f"client_{uuid.uuid4().hex[:8]}"
+PASSWORD = "client-password"
+HEADERS = {}
+
+
+def test_register_and_login():
+    """Регистрация пользователя и получение токена"""
+    response = requests.post(f"{BASE_URL}/user/", json={
+        "username": USERNAME,
+        "email": f"{USERNAME}@example.com",
+        "password": PASSWORD
+    })
+    print("=== REGISTER USER ===")
+    print(f"Status: {response.status_code}")
+
+    response = requests.post(f"{BASE_URL}/auth/login", data={"username": USERNAME, "password": PASSWORD})
+    print("=== LOGIN ===")
+    print(f"Status: {response.status_code}")
+    HEADERS["Authorization"] = f"Bearer {response.json()['access_token']}"
 
 
 def test_create_advertisement():
     """Тест создания объявления"""
-    url = f"{BASE_URL}/advertisement"
+    url = f"{BASE_URL}/advertisement/"
     data = {
         "title": "Продам MacBook Pro",
         "description": "2022 года, отличное состояние",
-        "price": 150000,
-        "author": "Анна"
+        "price": 150000
     }
 
-    response = requests.post(url, json=data)
-    print("=== CREATE ADVERTISEMENT ===")
+    response = requests.post(url, json=data, headers=HEADERS)
+    print("\n=== CREATE ADVERTISEMENT ===")
     print(f"Status: {response.status_code}")
     print(f"Response: {response.json()}")
     return response.json().get("id")
@@ -52,7 +71,7 @@ def test_update_advertisement(advertisement_id):
         "title": "Продам MacBook Pro (цена снижена)"
     }
 
-    response = requests.patch(url, json=data)
+    response = requests.patch(url, json=data, headers=HEADERS)
     print(f"\n=== UPDATE ADVERTISEMENT {advertisement_id} ===")
     print(f"Status: {response.status_code}")
     print(f"Response: {response.json()}")
@@ -76,7 +95,7 @@ def test_delete_advertisement(advertisement_id):
     """Тест удаления объявления"""
     url = f"{BASE_URL}/advertisement/{advertisement_id}"
 
-    response = requests.delete(url)
+    response = requests.delete(url, headers=HEADERS)
     print(f"\n=== DELETE ADVERTISEMENT {advertisement_id} ===")
     print(f"Status: {response.status_code}")
     print(f"Response: {response.json()}")
@@ -86,6 +105,9 @@ if __name__ == "__main__":
     print("🚀 Testing Advertisement API...")
 
     try:
+        # 0. Регистрируемся и входим: создание, изменение и удаление требуют токен
+        test_register_and_login()
+
         # 1. Создаем объявление
         ad_id = test_create_advertisement()
 
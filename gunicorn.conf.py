@@ -0,0 +1,47 @@
+# Продакшен-запуск: gunicorn -c gunicorn.conf.py app.server:app
+# N процессов с uvicorn-воркерами. Настройки переопределяются переменными окружения
+import multiprocessing
+import os
+import sys
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Приложению нужно число воркеров: с несколькими кеши сбрасываются во всех (app/cache_sync.py)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# preload: app.server импортируется один раз в мастере, воркеры получают его через fork
+# (быстрый старт и общая память под код). Выключается PRELOAD_APP=false
+preload_app = os.environ.get("PRELOAD_APP", "true").lower() in ("1", "true", "yes")
+
+# Плавная остановка: по SIGTERM воркер перестает принимать соединения и дорабатывает
+# текущие запросы до graceful_timeout, затем выполняет shutdown lifespan
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+keepalive = int(os.environ.get("KEEPALIVE", 5))
+# Heartbeat воркеров в памяти, а не на диске контейнера
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# У каждого воркера свой пул процессов argon2 (app/hashing.py) - делим ядра между воркерами
+os.environ.setdefault("HASH_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))
+
+
+def on_starting(server):
+    # Схему создаем один раз до запуска воркеров; воркеры в lifespan только убеждаются, что она готова
+    from app.lifespan import setup_schema
+
+    setup_schema()
+    _dispose_engines(close=True)
+
+
+def post_fork(server, worker):
+    # Соединения пула нельзя делить между процессами: воркер забывает унаследованные и открывает свои
+    _dispose_engines(close=False)
+
+
+def _dispose_engines(close: bool):
+    database = sys.modules.get("app.database")
+    if database is None:
+        return
+    database.engine.dispose(close=close)
+    database.read_engine.dispose(close=close)
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def run_check():
+    """Запускает проверку из benchmarks/ отдельным процессом: настройки app читаются при импорте."""
+    def run(module: str, *args: str, database_url: Optional[str] = None) -> subprocess.CompletedProcess:
+        # DATABASE_URL окружения в проверки не передаем: они наполняют БД тестовыми строками
+        env = {key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+        if database_url:
+            env["DATABASE_URL"] = database_url
+        result = subprocess.run(
+            [sys.executable, "-m", module, *args], cwd=ROOT, env=env, capture_output=True, text=True, timeout=600
+        )
+        assert result.returncode == 0, f"{module} failed:\n{result.stdout}\n{result.stderr}"
+        return result
+    return run
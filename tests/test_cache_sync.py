@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# Два воркера в одном процессе: у каждого экземпляра CacheSync свой origin, кеши общие
+TWO_WORKERS = """
+import uuid
+from app import cache, cache_sync, response_cache
+from app.lifespan import setup_schema
+
+setup_schema()
+first, second = cache_sync.CacheSync(1), cache_sync.CacheSync(1)
+assert first.sync() == 0 and second.sync() == 0
+user_id, advertisement_id = uuid.uuid4(), uuid.uuid4()
+key = response_cache.advertisement_key(advertisement_id)
+cache.invalidate_principal(user_id)
+response_cache.invalidate_advertisement(advertisement_id)
+assert first.sync() == 0
+# Второй воркер успел закешировать старые данные
+cache.principal_cache.set(user_id, "stale")
+response_cache.responses.set(key, "stale")
+assert second.sync() == 2
+assert cache.principal_cache.get(user_id) is None
+assert response_cache.responses.get(key) is None
+# Примененные не рассылаются повторно и не применяются второй раз; свои строки воркер пропускает
+assert not cache.take_published()
+assert second.sync() == 0 and first.sync() == 0
+"""
+
+
+def test_invalidations_reach_other_workers(tmp_path):
+    env = {key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+    env.update(DATABASE_URL=f"sqlite:///{tmp_path / 'sync.db'}", WEB_CONCURRENCY="2")
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", TWO_WORKERS], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
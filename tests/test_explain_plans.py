@@ -0,0 +1,8 @@
+import os
+
+
+def test_explain_plans(run_check):
+    # Горячие запросы идут по ожидаемым индексам, без полного скана и лишней сортировки
+    # (benchmarks/explain_plans.py). По умолчанию - временная SQLite; планы Postgres проверяются
+    # с EXPLAIN_PLANS_DATABASE_URL, указывающим на отдельную пустую БД
+    run_check("benchmarks.explain_plans", database_url=os.environ.get("EXPLAIN_PLANS_DATABASE_URL"))
@@ -0,0 +1,22 @@
+from collections import namedtuple
+
+from app import price_stats
+
+SummaryRow = namedtuple("SummaryRow", "bucket count total")
+AggregateRow = namedtuple("AggregateRow", "bucket count total low high")
+
+
+def test_summary_and_filtered_percentiles_match():
+    # Фильтр, не отсекающий ни одной строки (min_price=0), не меняет перцентили
+    prices = [10, 20, 30, 40, 999]
+    by_bucket = {}
+    for price in prices:
+        by_bucket.setdefault(price_stats.bucket_of(price), []).append(price)
+    summary = price_stats.merge_summaries([(
+        [SummaryRow(bucket, len(values), sum(values)) for bucket, values in by_bucket.items()], min(prices), max(prices)
+    )])
+    filtered = price_stats.merge_aggregates([[
+        AggregateRow(bucket, len(values), sum(values), min(values), max(values)) for bucket, values in by_bucket.items()
+    ]])
+    assert summary == filtered
+    assert summary["percentiles"]["p90"] == 749.5
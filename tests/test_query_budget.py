@@ -0,0 +1,3 @@
+def test_query_budget(run_check):
+    # Каждый эндпоинт укладывается в бюджет SQL-запросов (benchmarks/query_budget.py)
+    run_check("benchmarks.query_budget")
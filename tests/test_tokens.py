@@ -0,0 +1,37 @@
+import hashlib
+import hmac
+import time
+
+import orjson
+import pytest
+
+from app import tokens
+
+
+def legacy_token(secret: str) -> str:
+    # Токен без kid в заголовке - как выпускались до кольца ключей
+    header = tokens._b64encode(orjson.dumps({"alg": tokens.ALGORITHM, "typ": "JWT"}))
+    body = tokens._b64encode(orjson.dumps({"sub": "user", "exp": int(time.time()) + 60}))
+    signing_input = header + b"." + body
+    signature = hmac.new(secret.encode(), signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + tokens._b64encode(signature)).decode()
+
+
+def test_legacy_token_accepted_without_key_ring():
+    ring = tokens.build_key_ring("", "legacy-secret")
+    assert ring.verify(legacy_token("legacy-secret"))["sub"] == "user"
+
+
+def test_legacy_token_rejected_once_token_keys_set():
+    ring = tokens.build_key_ring("k1:new-secret", "legacy-secret")
+    with pytest.raises(tokens.InvalidToken):
+        ring.verify(legacy_token("legacy-secret"))
+    assert ring.verify(ring.sign({"sub": "user", "exp": int(time.time()) + 60}))["sub"] == "user"
+
+
+def test_legacy_token_accepted_during_explicit_transition():
+    ring = tokens.build_key_ring("k1:new-secret", "legacy-secret", accept_legacy=True)
+    assert ring.verify(legacy_token("legacy-secret"))["sub"] == "user"
+    ring = tokens.build_key_ring("", "legacy-secret", accept_legacy=False)
+    with pytest.raises(tokens.InvalidToken):
+        ring.verify(legacy_token("legacy-secret"))